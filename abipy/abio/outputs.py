@@ -901,9 +901,7 @@ class AboRobot(Robot):
                 Each function receives a |GsrFile| object and returns a tuple (key, value)
                 where key is a string with the name of column and value is the value to be inserted.
         """
-        rows, row_names = [], []
-        for label, abo in self.items():
-            row_names.append(label)
+        def get_row(abo):
             d = OrderedDict()
 
             if with_dims:
@@ -916,10 +914,20 @@ class AboRobot(Robot):
             if with_geo and abo.run_completed:
                 d.update(abo.final_structure.get_dict4pandas(with_spglib=True))
 
+            return d
+
+        # Rows are taken from the metadata index if use_metadata_index.
+        key = "AboRobot.get_dataframe with_geo=%s with_dims=%s" % (with_geo, with_dims)
+        rows, row_names = [], []
+        for label, abo in self.items():
+            row_names.append(label)
+            d = self._get_indexed_row(abo, key, get_row)
+
             # Execute functions
             if funcs is not None: d.update(self._exec_funcs(funcs, abo))
             rows.append(d)
 
+        self._save_metadata_index()
         row_names = row_names if not abspath else self._to_relpaths(row_names)
         return pd.DataFrame(rows, index=row_names, columns=list(rows[0].keys()))
 
@@ -9,7 +9,10 @@ import sys
 import os
 import six
 import inspect
+import json
 import itertools
+import threading
+import tempfile
 import numpy as np
 
 from collections import OrderedDict, deque
@@ -23,6 +26,262 @@ from abipy.tools.plotting import (plot_xy_with_hue, add_fig_kwargs, get_ax_fig_p
     rotate_ticklabels, set_visible)
 
 
+class LazyAbinitFile(object):
+    """
+    Proxy for an Abinit file that is opened with ``abiopen`` on the first access to an attribute
+    that is not available in the proxy. The file is only stat'ed at construction.
+    At most ``LazyAbinitFile.max_open`` files are kept open at the same time:
+    when the limit is reached, the least recently used file is closed and reopened on demand.
+
+    .. note::
+
+        Objects read from the file (e.g. ``ebands``) are not cached by the proxy and
+        are read again if the file has been closed to release the file descriptor.
+    """
+    # Max number of files opened by the proxies at the same time.
+    max_open = 128
+
+    # Proxies with an open file ordered from the least to the most recently used.
+    _open_proxies = OrderedDict()
+    _lock = threading.RLock()
+
+    def __init__(self, filepath):
+        """
+        Args:
+            filepath: Path of the file.
+        """
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        self.__dict__.update(filepath=filepath, st_size=stat.st_size, st_mtime=stat.st_mtime, _abifile=None)
+
+    def __repr__(self):
+        return "<%s: %s, is_open: %s>" % (self.__class__.__name__, self.relpath, self.is_open)
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, **kwargs):
+        """String representation of the underlying file."""
+        return self.get_abifile().to_string(**kwargs)
+
+    @property
+    def relpath(self):
+        """Relative path."""
+        try:
+            return os.path.relpath(self.filepath)
+        except OSError:
+            # current working directory may not be defined!
+            return self.filepath
+
+    @property
+    def basename(self):
+        """Basename of the file."""
+        return os.path.basename(self.filepath)
+
+    @property
+    def is_open(self):
+        """True if the underlying file is open."""
+        return self._abifile is not None
+
+    def get_abifile(self):
+        """Return the underlying Abinit file. Open it if needed."""
+        cls = self.__class__
+        with cls._lock:
+            abifile = self._abifile
+            if abifile is not None:
+                # Mark as most recently used.
+                cls._open_proxies.pop(id(self), None)
+                cls._open_proxies[id(self)] = self
+                return abifile
+
+            # Release the least recently used files.
+            while cls._open_proxies and len(cls._open_proxies) >= cls.max_open:
+                _, proxy = cls._open_proxies.popitem(last=False)
+                proxy._close_abifile()
+
+            from abipy.abilab import abiopen
+            abifile = abiopen(self.filepath)
+            self.__dict__["_abifile"] = abifile
+            cls._open_proxies[id(self)] = self
+            return abifile
+
+    def _close_abifile(self):
+        abifile = self._abifile
+        self.__dict__["_abifile"] = None
+        if abifile is not None:
+            try:
+                abifile.close()
+            except Exception as exc:
+                print("Exception while closing: ", self.filepath)
+                print(exc)
+
+    def close(self):
+        """Close the underlying file (if open)."""
+        with self.__class__._lock:
+            self.__class__._open_proxies.pop(id(self), None)
+            self._close_abifile()
+
+    def __getattr__(self, name):
+        # Invoked only if name is not found with the standard mechanism.
+        if name.startswith("__"): raise AttributeError(name)
+        return getattr(self.get_abifile(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_abifile(), name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _abiopen_files(filepaths, lazy=False, num_workers=1):
+    """
+    Open a list of files with ``abiopen``. Return list of ``(abifile, exception)`` tuples
+    in the same order as ``filepaths``. abifile is None if the file cannot be opened.
+
+    Args:
+        lazy: True to return :class:`LazyAbinitFile` proxies (files are only stat'ed).
+        num_workers: Number of threads used to open the files. None to use all the CPUs.
+    """
+    from abipy.abilab import abiopen
+
+    def do_open(path):
+        try:
+            return (LazyAbinitFile(path) if lazy else abiopen(path)), None
+        except Exception as exc:
+            return None, exc
+
+    if num_workers is None:
+        from monty.dev import get_ncpus
+        num_workers = get_ncpus()
+
+    num_workers = min(max(int(num_workers), 1), len(filepaths))
+    if lazy or num_workers <= 1:
+        return [do_open(path) for path in filepaths]
+
+    # Threads release the GIL while waiting for I/O.
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(num_workers)
+    try:
+        return pool.map(do_open, filepaths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _to_json_scalar(value):
+    """
+    Convert ``value`` to a scalar that can be stored in JSON format.
+    Raise TypeError if ``value`` is not a scalar.
+    """
+    if isinstance(value, np.generic): value = value.item()
+    if value is None or isinstance(value, (bool,) + six.string_types): return value
+    # Convert subclasses e.g. FloatWithUnit.
+    if isinstance(value, six.integer_types): return int(value)
+    if isinstance(value, float): return float(value)
+    raise TypeError("Cannot convert object of type %s to JSON scalar" % type(value))
+
+
+class RobotMetadataIndex(object):
+    """
+    Persistent index with the metadata extracted from the files of a robot
+    (parameters, energies, lattice, spacegroup ...).
+    Rows are stored in a hidden JSON file in the directory of the file (``.abipy_robot_index.json``)
+    and are indexed by basename and by a string with the name of the row (usually the method and its options).
+    Entries are ignored if the size or the modification time of the file changed.
+    Only rows whose values are scalars are stored.
+    """
+    basename = ".abipy_robot_index.json"
+
+    # Increase this number to invalidate the indices produced by previous versions.
+    VERSION = 1
+
+    def __init__(self):
+        # dirpath --> {basename: {"st_size": size, "st_mtime": mtime, "rows": {key: row}}}
+        self._dirs = {}
+        self._dirty = set()
+
+    def __len__(self):
+        return sum(len(files) for files in self._dirs.values())
+
+    def _get_files(self, dirpath):
+        """Return the dictionary with the metadata of the files in ``dirpath``. Read it from disk if needed."""
+        files = self._dirs.get(dirpath)
+        if files is not None: return files
+
+        files = {}
+        path = os.path.join(dirpath, self.basename)
+        if os.path.exists(path):
+            try:
+                with open(path, "rt") as fh:
+                    data = json.load(fh, object_pairs_hook=OrderedDict)
+                if data.get("version") == self.VERSION:
+                    files = data["files"]
+            except Exception as exc:
+                cprint("Ignoring corrupted index file `%s`:\n%s" % (path, str(exc)), "yellow")
+
+        self._dirs[dirpath] = files
+        return files
+
+    def get_row(self, filepath, key):
+        """
+        Return :class:`OrderedDict` with row ``key`` of file ``filepath``.
+        None if not present or if the file has been modified.
+        """
+        filepath = os.path.abspath(filepath)
+        entry = self._get_files(os.path.dirname(filepath)).get(os.path.basename(filepath))
+        if entry is None or key not in entry["rows"]: return None
+        stat = os.stat(filepath)
+        if entry["st_size"] != stat.st_size or entry["st_mtime"] != stat.st_mtime: return None
+        return OrderedDict(entry["rows"][key])
+
+    def set_row(self, filepath, key, row):
+        """
+        Store dictionary ``row`` with name ``key`` for file ``filepath``.
+        Return :class:`OrderedDict` with the values converted to JSON scalars (same types as in :meth:`get_row`)
+        or None if row cannot be stored because it contains values that are not scalars.
+        """
+        try:
+            row = OrderedDict([(k, _to_json_scalar(v)) for k, v in row.items()])
+        except TypeError:
+            return None
+
+        filepath = os.path.abspath(filepath)
+        dirpath, basename = os.path.split(filepath)
+        files = self._get_files(dirpath)
+        stat = os.stat(filepath)
+        entry = files.get(basename)
+        if entry is None or entry["st_size"] != stat.st_size or entry["st_mtime"] != stat.st_mtime:
+            # New file or file has been modified --> Remove old rows.
+            entry = files[basename] = OrderedDict([
+                ("st_size", stat.st_size), ("st_mtime", stat.st_mtime), ("rows", OrderedDict())])
+
+        entry["rows"][key] = row
+        self._dirty.add(dirpath)
+        return OrderedDict(row)
+
+    def save(self):
+        """
+        Write the index files of the directories that have been modified.
+        Directories in which we cannot write are ignored.
+        """
+        for dirpath in sorted(self._dirty):
+            data = OrderedDict([("version", self.VERSION), ("files", self._dirs[dirpath])])
+            try:
+                # Write to temporary file and rename to avoid partially written files.
+                fd, tmp = tempfile.mkstemp(dir=dirpath, prefix=self.basename, suffix=".tmp")
+                with os.fdopen(fd, "wt") as fh:
+                    json.dump(data, fh)
+                # os.rename is atomic on POSIX and overwrites dst.
+                os.rename(tmp, os.path.join(dirpath, self.basename))
+            except (IOError, OSError) as exc:
+                cprint("Cannot write index file in `%s`:\n%s" % (dirpath, str(exc)), "yellow")
+
+        self._dirty.clear()
+
+
 class Robot(NotebookWriter):
     """
     This is the base class from which all Robot subclasses should derive.
@@ -40,6 +299,14 @@ class Robot(NotebookWriter):
     # filepaths are relative to `start`. None for asbolute paths. This flag is set in trim_paths
     start = None
 
+    # Number of threads used to open the files in from_dir, from_files and from_flow.
+    # Not all the builds of the netcdf/HDF5 libraries are thread-safe hence files are opened serially by default.
+    num_open_workers = 1
+
+    # True if dataframes, sortby and group_and_sortby should use the metadata stored in RobotMetadataIndex
+    # instead of reopening and analyzing the files. Entries are invalidated if the size or mtime of the file change.
+    use_metadata_index = False
+
     # Used in iter_lineopt to generate matplotlib linestyles.
     _LINE_COLORS = ["b", "r", "g", "m", "y", "k", "c"]
     _LINE_STYLES = ["-", ":", "--", "-.",]
@@ -80,7 +347,7 @@ class Robot(NotebookWriter):
                          str(cls.get_supported_extensions()))
 
     @classmethod
-    def from_dir(cls, top, walk=True, abspath=False):
+    def from_dir(cls, top, walk=True, abspath=False, lazy=False, num_workers=None):
         """
         This class method builds a robot by scanning all files located within directory `top`.
         This method should be invoked with a concrete robot class, for example:
@@ -91,29 +358,33 @@ class Robot(NotebookWriter):
             top (str): Root directory
 	    walk: if True, directories inside `top` are included as well.
             abspath: True if paths in index should be absolute. Default: Relative to `top`.
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
         """
-        new = cls(*cls._open_files_in_dir(top, walk))
+        new = cls(*cls._open_files_in_dir(top, walk, lazy=lazy, num_workers=num_workers))
         if not abspath: new.trim_paths(start=top)
         return new
 
     @classmethod
-    def from_dirs(cls, dirpaths, walk=True, abspath=False):
+    def from_dirs(cls, dirpaths, walk=True, abspath=False, lazy=False, num_workers=None):
         """
         Similar to `from_dir` but accepts a list of directories instead of a single directory.
 
         Args:
 	    walk: if True, directories inside `top` are included as well.
             abspath: True if paths in index should be absolute. Default: Relative to `top`.
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
         """
         items = []
         for top in list_strings(dirpaths):
-            items.extend(cls._open_files_in_dir(top, walk))
+            items.extend(cls._open_files_in_dir(top, walk, lazy=lazy, num_workers=num_workers))
         new = cls(*items)
         if not abspath: new.trim_paths(start=os.getcwd())
         return new
 
     @classmethod
-    def from_dir_glob(cls, pattern, walk=True, abspath=False):
+    def from_dir_glob(cls, pattern, walk=True, abspath=False, lazy=False, num_workers=None):
         """
         This class method builds a robot by scanning all files located within the directories
         matching `pattern` as implemented by glob.glob
@@ -125,33 +396,35 @@ class Robot(NotebookWriter):
             pattern: Pattern string
 	    walk: if True, directories inside `top` are included as well.
             abspath: True if paths in index should be absolute. Default: Relative to getcwd().
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
         """
         import glob
         items = []
         for top in filter(os.path.isdir, glob.iglob(pattern)):
-            items += cls._open_files_in_dir(top, walk=walk)
+            items += cls._open_files_in_dir(top, walk=walk, lazy=lazy, num_workers=num_workers)
         new = cls(*items)
         if not abspath: new.trim_paths(start=os.getcwd())
         return new
 
     @classmethod
-    def _open_files_in_dir(cls, top, walk):
+    def _open_files_in_dir(cls, top, walk, lazy=False, num_workers=None):
         """Open files in directory tree starting from `top`. Return list of Abinit files."""
         if not os.path.isdir(top):
             raise ValueError("%s: no such directory" % str(top))
-        from abipy.abilab import abiopen
-        items = []
+
+        filepaths = []
         if walk:
             for dirpath, dirnames, filenames in os.walk(top):
-                filenames = [f for f in filenames if cls.class_handles_filename(f)]
-                for f in filenames:
-                    abifile = abiopen(os.path.join(dirpath, f))
-                    if abifile is not None: items.append((abifile.filepath, abifile))
+                filepaths.extend(os.path.join(dirpath, f) for f in filenames if cls.class_handles_filename(f))
         else:
-            filenames = [f for f in os.listdir(top) if cls.class_handles_filename(f)]
-            for f in filenames:
-                abifile = abiopen(os.path.join(top, f))
-                if abifile is not None: items.append((abifile.filepath, abifile))
+            filepaths = [os.path.join(top, f) for f in os.listdir(top) if cls.class_handles_filename(f)]
+
+        items = []
+        num_workers = cls.num_open_workers if num_workers is None else num_workers
+        for abifile, exc in _abiopen_files(filepaths, lazy=lazy, num_workers=num_workers):
+            if exc is not None: raise exc
+            if abifile is not None: items.append((abifile.filepath, abifile))
 
         return items
 
@@ -166,25 +439,25 @@ class Robot(NotebookWriter):
                 filename.endswith("." + cls.EXT))  # This for .abo
 
     @classmethod
-    def from_files(cls, filenames, labels=None, abspath=False):
+    def from_files(cls, filenames, labels=None, abspath=False, lazy=False, num_workers=None):
         """
         Build a Robot from a list of `filenames`.
         if labels is None, labels are automatically generated from absolute paths.
 
         Args:
             abspath: True if paths in index should be absolute. Default: Relative to `top`.
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
         """
         filenames = list_strings(filenames)
-        from abipy.abilab import abiopen
         filenames = [f for f in filenames if cls.class_handles_filename(f)]
+        num_workers = cls.num_open_workers if num_workers is None else num_workers
         items = []
-        for i, f in enumerate(filenames):
-            try:
-                abifile = abiopen(f)
-            except Exception as exc:
+        for i, (f, (abifile, exc)) in enumerate(zip(filenames, _abiopen_files(filenames, lazy=lazy,
+                                                                               num_workers=num_workers))):
+            if exc is not None:
                 cprint("Exception while opening file: `%s`" % str(f), "red")
                 cprint(exc, "red")
-                abifile = None
 
             if abifile is not None:
                 label = abifile.filepath if labels is None else labels[i]
@@ -195,7 +468,7 @@ class Robot(NotebookWriter):
         return new
 
     @classmethod
-    def from_flow(cls, flow, outdirs="all", nids=None, ext=None, task_class=None):
+    def from_flow(cls, flow, outdirs="all", nids=None, ext=None, task_class=None, lazy=False, num_workers=None):
         """
         Build a robot from a |Flow| object.
 
@@ -211,6 +484,8 @@ class Robot(NotebookWriter):
             ext: File extension associated to the robot. Mainly used if method is invoked with the BaseClass
             task_class: Task class or string with the class name used to select the tasks in the flow.
                 None implies no filtering.
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
 
         Usage example:
 
@@ -243,16 +518,26 @@ class Robot(NotebookWriter):
         if not all(t in all_opts for t in tokens):
             raise ValueError("Wrong outdirs string %s" % outdirs)
 
+        # Collect the paths first so that the files can be opened in parallel.
+        label_paths = []
         if "flow" in tokens:
-            robot.add_extfile_of_node(flow, nids=nids, task_class=task_class)
+            label_paths += robot._get_extfile_of_node(flow, nids=nids, task_class=task_class)
 
         if "work" in tokens:
             for work in flow:
-                robot.add_extfile_of_node(work, nids=nids, task_class=task_class)
+                label_paths += robot._get_extfile_of_node(work, nids=nids, task_class=task_class)
 
         if "task" in tokens:
             for task in flow.iflat_tasks():
-                robot.add_extfile_of_node(task, nids=nids, task_class=task_class)
+                label_paths += robot._get_extfile_of_node(task, nids=nids, task_class=task_class)
+
+        num_workers = robot.num_open_workers if num_workers is None else num_workers
+        results = _abiopen_files([p for _, p in label_paths], lazy=lazy, num_workers=num_workers)
+        for (label, filepath), (abifile, exc) in zip(label_paths, results):
+            if exc is not None: raise exc
+            robot.add_file(label, abifile)
+            # Open file here --> have to close it.
+            robot._do_close[abifile.filepath] = True
 
         return robot
 
@@ -266,7 +551,15 @@ class Robot(NotebookWriter):
             task_class: Task class or string with class name used to select the tasks in the flow.
                 None implies no filtering.
         """
-        if nids and node.node_id not in nids: return
+        for label, filepath in self._get_extfile_of_node(node, nids=nids, task_class=task_class):
+            self.add_file(label, filepath)
+
+    def _get_extfile_of_node(self, node, nids=None, task_class=None):
+        """
+        Return list with the (label, filepath) of the file produced by this node (empty if not found).
+        See :meth:`add_extfile_of_node` for the meaning of the arguments.
+        """
+        if nids and node.node_id not in nids: return []
         filepath = node.outdir.has_abiext(self.EXT)
         if not filepath:
             # Look in run.abi directory.
@@ -274,7 +567,7 @@ class Robot(NotebookWriter):
 
         # This to ignore DDB.nc files (only text DDB are supported)
         if filepath and filepath.endswith("_DDB.nc"):
-            return
+            return []
 
         if filepath:
             try:
@@ -285,29 +578,33 @@ class Robot(NotebookWriter):
 
             # Filter by task_class (class or string with class name)
             if task_class is not None and not node.isinstance(task_class):
-                return None
+                return []
 
-            self.add_file(label, filepath)
+            return [(label, filepath)]
+
+        return []
 
-    def scan_dir(self, top, walk=True):
+    def scan_dir(self, top, walk=True, lazy=False, num_workers=None):
         """
         Scan directory tree starting from ``top``. Add files to the robot instance.
 
         Args:
             top (str): Root directory
             walk: if True, directories inside ``top`` are included as well.
+            lazy: True if files should be opened on first access (see :class:`LazyAbinitFile`).
+            num_workers: Number of threads used to open the files. None to use ``num_open_workers``.
 
         Return:
             Number of files found.
 	"""
         count = 0
-        for filepath, abifile in self.__class__._open_files_in_dir(top, walk):
+        for filepath, abifile in self.__class__._open_files_in_dir(top, walk, lazy=lazy, num_workers=num_workers):
             count += 1
             self.add_file(filepath, abifile)
 
         return count
 
-    def add_file(self, label, abifile, filter_abifile=None):
+    def add_file(self, label, abifile, filter_abifile=None, lazy=False):
         """
         Add a file to the robot with the given label.
 
@@ -317,10 +614,15 @@ class Robot(NotebookWriter):
             abifile: Specify the file to be added. Accepts strings (filepath) or abipy file-like objects.
             filter_abifile: Function that receives an ``abifile`` object and returns
                 True if the file should be added to the plotter.
+            lazy: True if the file should be opened on first access (see :class:`LazyAbinitFile`).
+                Used only if abifile is a string.
         """
         if is_string(abifile):
-            from abipy.abilab import abiopen
-            abifile = abiopen(abifile)
+            if lazy:
+                abifile = LazyAbinitFile(abifile)
+            else:
+                from abipy.abilab import abiopen
+                abifile = abiopen(abifile)
             if filter_abifile is not None and not filter_abifile(abifile):
                 abifile.close()
                 return
@@ -328,6 +630,10 @@ class Robot(NotebookWriter):
             # Open file here --> have to close it.
             self._do_close[abifile.filepath] = True
 
+        elif isinstance(abifile, LazyAbinitFile):
+            # Proxies are created by the robot --> have to close them.
+            self._do_close[abifile.filepath] = True
+
         if label in self._abifiles:
             raise ValueError("label %s is already present!" % label)
 
@@ -366,6 +672,45 @@ class Robot(NotebookWriter):
     #        values = self.ordered_intersection(values, range(getattr(abifile, iattrname)))
     #    return values
 
+    @property
+    def metadata_index(self):
+        """:class:`RobotMetadataIndex` used if ``use_metadata_index``."""
+        if getattr(self, "_metadata_index", None) is None:
+            self._metadata_index = RobotMetadataIndex()
+        return self._metadata_index
+
+    def _get_indexed_row(self, abifile, key, func):
+        """
+        Return :class:`OrderedDict` with the output of ``func(abifile)``.
+        If ``use_metadata_index``, the row is taken from the metadata index with name ``key`` if available
+        else ``func`` is executed and the result is added to the index.
+        Values are converted to JSON scalars so that the output does not depend on the state of the index.
+        Call ``_save_metadata_index`` to write the new rows to disk.
+        """
+        if not self.use_metadata_index: return func(abifile)
+        row = self.metadata_index.get_row(abifile.filepath, key)
+        if row is None:
+            row = func(abifile)
+            new_row = self.metadata_index.set_row(abifile.filepath, key, row)
+            if new_row is not None: row = new_row
+        return row
+
+    def _save_metadata_index(self):
+        """Write the rows added to the metadata index (if ``use_metadata_index``)."""
+        if self.use_metadata_index: self.metadata_index.save()
+
+    def _getattrd_or_param(self, abifile, aname):
+        """
+        Return the value of attribute ``aname`` (dot notation is supported) or ``abifile.params[aname]``.
+        Use the metadata index if ``use_metadata_index``.
+        """
+        def get_value(abifile):
+            if hasattrd(abifile, aname): return getattrd(abifile, aname)
+            return abifile.params[aname]
+
+        return self._get_indexed_row(abifile, "attr " + aname,
+                lambda abifile: OrderedDict([(aname, get_value(abifile))]))[aname]
+
     @staticmethod
     def _to_relpaths(paths):
         """Convert a list of absolute paths to relative paths."""
@@ -611,6 +956,17 @@ Not all entries are sortable (Please select number-like quantities)""" % (self._
         elif callable(func_or_string):
             items = [(label, abifile, func_or_string(abifile)) for (label, abifile) in labelfile_list]
 
+        elif self.use_metadata_index:
+            # Read values from the index (files are not opened if entries are up to date).
+            try:
+                items = [(label, abifile, self._getattrd_or_param(abifile, func_or_string))
+                         for (label, abifile) in labelfile_list]
+            except (AttributeError, KeyError):
+                self.is_sortable(func_or_string, raise_exc=True)
+                raise
+            finally:
+                self._save_metadata_index()
+
         else:
             # Assume string and attribute with the same name.
             # try in abifile.params if not hasattrd(abifile, func_or_string)
@@ -667,6 +1023,11 @@ Not all entries are sortable (Please select number-like quantities)""" % (self._
 
         if callable(hue):
             key = lambda t: hue(t[1])
+        elif self.use_metadata_index:
+            # Read hue values from the index and save the new entries before sorting.
+            hvalues = {id(abifile): self._getattrd_or_param(abifile, hue) for abifile in self.abifiles}
+            self._save_metadata_index()
+            key = lambda t: hvalues[id(t[1])]
         else:
             # Assume string.
             if hasattrd(self.abifiles[0], hue):
@@ -798,13 +1159,21 @@ Expecting callable or attribute name or key in abifile.params""" % (type(hue), s
         """
         rows, row_names = [], []
         for label, abifile in self.items():
-            if not hasattr(abifile, "params"):
-                import warnings
-                warnings.warn("%s does not have `params` attribute" % type(abifile))
-                break
-            rows.append(abifile.params)
+            # Try the metadata index first so that (lazy) files are not opened.
+            params = self.metadata_index.get_row(abifile.filepath, "params") if self.use_metadata_index else None
+            if params is None:
+                params = getattr(abifile, "params", None)
+                if params is None:
+                    import warnings
+                    warnings.warn("%s does not have `params` attribute" % type(abifile))
+                    break
+                if self.use_metadata_index:
+                    new_params = self.metadata_index.set_row(abifile.filepath, "params", params)
+                    if new_params is not None: params = new_params
+            rows.append(params)
             row_names.append(label)
 
+        self._save_metadata_index()
         row_names = row_names if abspath else self._to_relpaths(row_names)
         import pandas as pd
         return pd.DataFrame(rows, index=row_names, columns=list(rows[0].keys()))
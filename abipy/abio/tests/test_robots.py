@@ -38,3 +38,81 @@ class RobotTest(AbipyTest):
 
         if self.has_nbformat():
             assert robot.get_baserobot_code_cells()
+
+    def test_lazy_and_parallel_opening(self):
+        """Testing lazy and parallel opening of files in robots."""
+        from abipy.abio.robots import LazyAbinitFile
+        filepaths = [abidata.ref_file("si_scf_GSR.nc"), abidata.ref_file("si_nscf_GSR.nc")]
+
+        # netcdf files are opened serially (the HDF5 library may not be thread-safe).
+        with abilab.GsrRobot.from_files(filepaths) as robot:
+            assert len(robot) == 2
+            energies = [gsr.energy for gsr in robot.abifiles]
+
+        # Text files are opened in parallel.
+        abo_paths = abidata.ref_files("refs/si_ebands/run.abo", "refs/gs_dfpt.abo")
+        with abilab.AboRobot.from_files(abo_paths, num_workers=2) as robot:
+            assert len(robot) == 2
+            assert [abo.filepath for abo in robot.abifiles] == abo_paths
+
+        # Files are opened on first access.
+        old_max_open = LazyAbinitFile.max_open
+        LazyAbinitFile.max_open = 1
+        try:
+            with abilab.GsrRobot.from_files(filepaths, lazy=True) as robot:
+                assert len(robot) == 2
+                proxies = robot.abifiles
+                assert all(isinstance(p, LazyAbinitFile) and not p.is_open for p in proxies)
+                assert robot.labels
+                repr(proxies[0])
+                self.assert_almost_equal([p.energy for p in proxies], energies)
+                # At most one file is open.
+                assert not proxies[0].is_open and proxies[1].is_open
+                assert proxies[0].ebands.nsppol == 1
+                assert proxies[0].is_open and not proxies[1].is_open
+
+            assert not any(p.is_open for p in proxies)
+        finally:
+            LazyAbinitFile.max_open = old_max_open
+
+    def test_metadata_index(self):
+        """Testing robots with metadata index."""
+        import shutil
+        import tempfile
+        from abipy.abio.robots import RobotMetadataIndex
+        tmpdir = tempfile.mkdtemp()
+        for basename in ("si_scf_GSR.nc", "si_nscf_GSR.nc"):
+            shutil.copy(abidata.ref_file(basename), tmpdir)
+
+        with abilab.GsrRobot.from_dir(tmpdir) as robot:
+            df = robot.get_dataframe()
+            robot.use_metadata_index = True
+            df_miss = robot.get_dataframe()
+            self.assert_equal(df_miss.values, df.values)
+            assert os.path.exists(os.path.join(tmpdir, RobotMetadataIndex.basename))
+            assert len(robot.metadata_index) == 2
+            labels = robot.sortby("nband", unpack=True)[0]
+            # Same types if rows are computed or taken from the index.
+            df_hit = robot.get_dataframe()
+            assert [type(v) for v in df_hit.values[0]] == [type(v) for v in df_miss.values[0]]
+
+        # Dataframes and sortby should not open the files.
+        with abilab.GsrRobot.from_dir(tmpdir, lazy=True) as robot:
+            robot.use_metadata_index = True
+            self.assert_equal(robot.get_dataframe().values, df.values)
+            assert robot.sortby("nband", unpack=True)[0] == labels
+            assert not any(p.is_open for p in robot.abifiles)
+            # First call may add the params to the index, the second one must use the index.
+            params_df = robot.get_params_dataframe()
+
+        with abilab.GsrRobot.from_dir(tmpdir, lazy=True) as robot:
+            robot.use_metadata_index = True
+            self.assert_equal(robot.get_params_dataframe().values, params_df.values)
+            self.assert_equal(robot.get_params_dataframe().values, params_df.values)
+            assert not any(p.is_open for p in robot.abifiles)
+            assert robot.get_dataframe().shape == df.shape
+            # Functions are always executed.
+            df = robot.get_dataframe(funcs=lambda gsr: ("nkpt2", len(gsr.kpoints)))
+            assert "nkpt2" in df and any(p.is_open for p in robot.abifiles)
+
+        shutil.rmtree(tmpdir)
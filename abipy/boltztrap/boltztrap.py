@@ -20,6 +20,10 @@ class AbipyBoltztrap():
     It creates an instance of Bolztrap2Results to save the data
     Enter with quantities in the IBZ and interpolate to a fine BZ mesh
     """
+    # Max number of entries in the arrays with the eigenvalues and velocities on the fine mesh
+    # that are kept in memory by run (see get_nband_chunk).
+    max_fine_nelem = 2**25
+
     def __init__(self,fermi,atoms,nelect,kpoints,eig,volume,linewidths=None,tmesh=None,mumesh=None,
                  lpratio=1,nworkers=1):
         self.fermi = fermi
@@ -130,61 +134,110 @@ class AbipyBoltztrap():
 
     @timeit
     def compute_coefficients(self):
-        """Call fitde3D routine from Boltztrap2"""
+        """
+        Call fitde3D routine from Boltztrap2.
+        The fit is linear in the input data so the eigenvalues and the linewidths at all the temperatures
+        are stacked along the band axis and fitted with a single call.
+        """
         from BoltzTraP2 import fite
-        #we will set ebands to compute teh coefficients
-        self.ebands = self.eig
-        self._coefficients = fite.fitde3D(self, self.equivalences, nworkers=self.nworkers)
+        #we will set ebands to compute the coefficients
+        nbands = len(self.eig)
+        self.ebands = np.vstack([self.eig] + list(self.linewidths or []))
+        coeffs = fite.fitde3D(self, self.equivalences, nworkers=self.nworkers)
+        self._coefficients = coeffs[:nbands]
 
         if self.linewidths:
-            self._linewidth_coefficients = []
-            for itemp in range(self.ntemps):
-                self.ebands = self.linewidths[itemp]
-                coeffs = fite.fitde3D(self, self.equivalences, nworkers=self.nworkers)
-                self._linewidth_coefficients.append(coeffs)
+            self._linewidth_coefficients = [coeffs[nbands*(itemp+1):nbands*(itemp+2)]
+                                            for itemp in range(self.ntemps)]
 
         #at the end we always unset ebands
         delattr(self,"ebands")
 
+    def get_nband_chunk(self,nband_chunk=None):
+        """
+        Number of bands interpolated at once on the fine mesh.
+        If None, the value is computed from max_fine_nelem.
+        """
+        if nband_chunk is not None: return max(1,int(nband_chunk))
+        #eigenvalues and the 3x3 velocity products for each point of the fine mesh
+        nfine = np.prod(self.rmesh)
+        return max(1,int(self.max_fine_nelem // (10*nfine)))
+
     @timeit
-    def run(self,npts=500,dos_method='gaussian:0.1 eV',erange=None,verbose=True):
+    def run(self,npts=500,dos_method='gaussian:0.1 eV',erange=None,verbose=True,nband_chunk=None):
         """
-        Interpolate the eingenvalues This part is quite memory intensive
+        Interpolate the eingenvalues and compute the DOS and VVDOS with and without lifetimes.
+
+        The bands are interpolated on the fine mesh in blocks of nband_chunk bands and the DOS are
+        accumulated block by block. The eigenvalues and velocities of a block are interpolated once
+        and reused for all the temperatures that are processed by a pool of nworkers threads,
+        so that memory does not depend on the number of bands and temperatures.
         """
         eV_s = abu.eV_to_THz*1e12 * 2*np.pi
         from BoltzTraP2 import fite
         import BoltzTraP2.bandlib as BL
 
         #TODO change this!
+        #erange must be fixed so that the DOS of the different blocks can be summed.
         if erange is None: erange = (np.min(self.eig),np.max(self.eig))
 
-        #interpolate the electronic structure
-        results = fite.getBTPbands(self.equivalences, self.coefficients,
-                                   self.lattvec, nworkers=self.nworkers)
-        eig_fine, vvband, cband = results
-        #calculate DOS and VDOS without lifetimes
-        wmesh,dos,vvdos,_ = BL.BTPDOS(eig_fine, vvband, erange=erange, npts=npts, mode=dos_method)
+        nbands = len(self.coefficients)
+        nband_chunk = self.get_nband_chunk(nband_chunk)
+        ntemps = self.ntemps if self.linewidths else 0
 
-        #if we have linewidths
-        if self.linewidths:
-            dos_tau_temps = []
-            vvdos_tau_temps = []
-            for itemp in range(self.ntemps):
-                #calculate the lifetimes on the fine grid
-                results = fite.getBTPbands(self.equivalences, self._linewidth_coefficients[itemp],
-                                           self.lattvec, nworkers=self.nworkers)
-                linewidth_fine, vvband, cband = results
-                tau_fine = 1.0/np.abs(2*linewidth_fine*eV_s)
+        dos, vvdos = 0, 0
+        dos_tau_temps = [0] * ntemps
+        vvdos_tau_temps = [0] * ntemps
+
+        pool = None
+        if self.nworkers > 1 and ntemps > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(self.nworkers, ntemps))
 
-                #calculate vvdos with the lifetimes
-                wmesh, dos_tau, vvdos_tau, _ = BL.BTPDOS(eig_fine, vvband, erange=erange, npts=npts,
+        try:
+            for bstart in range(0,nbands,nband_chunk):
+                bstop = min(bstart+nband_chunk,nbands)
+
+                #interpolate the electronic structure for this block of bands
+                results = fite.getBTPbands(self.equivalences, self.coefficients[bstart:bstop],
+                                           self.lattvec, nworkers=self.nworkers)
+                eig_fine, vvband, cband = results
+                #calculate DOS and VDOS without lifetimes
+                wmesh,dos_b,vvdos_b,_ = BL.BTPDOS(eig_fine, vvband, erange=erange, npts=npts, mode=dos_method)
+                dos = dos + dos_b
+                vvdos = vvdos + vvdos_b
+
+                #if we have linewidths
+                def get_dos_tau(itemp):
+                    #calculate the lifetimes on the fine grid
+                    results = fite.getBTPbands(self.equivalences,
+                                               self._linewidth_coefficients[itemp][bstart:bstop],
+                                               self.lattvec, nworkers=1)
+                    linewidth_fine = results[0]
+                    tau_fine = 1.0/np.abs(2*linewidth_fine*eV_s)
+
+                    #calculate vvdos with the lifetimes
+                    _, dos_tau, vvdos_tau, _ = BL.BTPDOS(eig_fine, vvband, erange=erange, npts=npts,
                                                          scattering_model=tau_fine, mode=dos_method)
-                #store results
-                dos_tau_temps.append(dos_tau)
-                vvdos_tau_temps.append(vvdos_tau)
+                    return dos_tau, vvdos_tau
+
+                temps_results = pool.map(get_dos_tau, range(ntemps)) if pool is not None else \
+                                map(get_dos_tau, range(ntemps))
+                for itemp, (dos_tau, vvdos_tau) in enumerate(temps_results):
+                    #accumulate results
+                    dos_tau_temps[itemp] = dos_tau_temps[itemp] + dos_tau
+                    vvdos_tau_temps[itemp] = vvdos_tau_temps[itemp] + vvdos_tau
+
+                del eig_fine, vvband, cband
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if not ntemps: dos_tau_temps, vvdos_tau_temps = None, None
 
         return BoltztrapResults(self,wmesh,dos,vvdos,self.fermi,self.mumesh,self.tmesh,self.volume,
-                                dos_tau_temps=dos_tau,vvdos_tau_temps=vvdos_tau_temps)
+                                dos_tau_temps=dos_tau_temps,vvdos_tau_temps=vvdos_tau_temps)
 
     def __str__(self):
         lines = []; app = lines.append
@@ -209,8 +262,8 @@ class BoltztrapResults():
 
         self.dos = dos
         self.vvdos = vvdos
-        self.dos_tau_temps = np.array(dos_tau_temps)
-        self.vvdos_tau_temps = np.array(vvdos_tau_temps)
+        self.dos_tau_temps = None if dos_tau_temps is None else np.array(dos_tau_temps)
+        self.vvdos_tau_temps = None if vvdos_tau_temps is None else np.array(vvdos_tau_temps)
 
     @property
     def ntemps(self):
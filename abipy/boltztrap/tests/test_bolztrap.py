@@ -32,6 +32,14 @@ class AbipyBoltztrapTest(AbipyTest):
         #get results
         btr = bt.run()
 
+        #interpolation in blocks of bands and temperatures processed by threads
+        bt.nworkers = 2
+        btr_chunk = bt.run(nband_chunk=1)
+        self.assert_almost_equal(btr_chunk.dos, btr.dos)
+        self.assert_almost_equal(btr_chunk.vvdos, btr.vvdos)
+        self.assert_almost_equal(btr_chunk.vvdos_tau_temps, btr.vvdos_tau_temps)
+        assert len(btr.vvdos_tau_temps) == bt.ntemps
+
         #boltztrap_results
         btr.plot_dos()
 
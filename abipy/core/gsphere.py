@@ -5,6 +5,7 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import collections
 import numpy as np
 
+from monty.collections import dict2namedtuple
 from .kpoints import Kpoint
 from abipy.tools import duck
 
@@ -25,6 +26,8 @@ class GSphere(collections.Sequence):
             kpoint: Reduced coordinates of the k-point.
             gvecs: Array with the reduced coordinates of the G-vectors.
             istwfk: Storage option (time-reversal symmetry, see abinit variable)
+                If istwfk > 1, only half of the G-vectors are stored and the missing coefficients
+                are reconstructed with u(-G-G0) = u(G)^* where G0 = 2k.
         """
         self.ecut = ecut
         self.lattice = lattice
@@ -33,9 +36,18 @@ class GSphere(collections.Sequence):
         self._gvecs = np.reshape(np.array(gvecs), (-1, 3))
         self.npw = self.gvecs.shape[0]
 
-        self.istwfk = istwfk
-        if istwfk != 1:
-            raise NotImplementedError("istwfk %d is not implemented" % self.istwfk)
+        self.istwfk = int(istwfk)
+        if self.istwfk not in range(1, 10):
+            raise ValueError("Invalid value for istwfk: %s" % str(istwfk))
+
+        if self.istwfk != 1:
+            g0 = 2 * np.asarray(self.kpoint.frac_coords)
+            if np.any(np.abs(g0 - np.rint(g0)) > 1e-6):
+                raise ValueError("istwfk %d requires 2k in the reciprocal lattice but k = %s" % (
+                                 self.istwfk, str(self.kpoint.frac_coords)))
+
+        # Tables used to scatter/gather arrays to/from the FFT mesh. Computed on demand for each mesh.
+        self._fft_tables = {}
 
     @property
     def gvecs(self):
@@ -146,79 +158,83 @@ class GSphere(collections.Sequence):
     #  """Returns the number of divisions of the FFT box enclosing the sphere."""
     #  #return ndivs
 
+    def get_fft_tables(self, mesh):
+        """
+        Return the tables used to scatter/gather arrays defined on the G-sphere to/from the FFT mesh.
+        The tables are computed once for each shape of the mesh.
+
+        Return: named tuple with the following attributes:
+
+            gsph2fft: [npw] array with the linear index (C-order) of the G-vectors in the FFT box.
+            gsph2fft_conj: [npw] array with the linear index of -G-G0 (used if istwfk > 1 else None).
+        """
+        shape = tuple(int(n) for n in mesh.shape)
+        if not hasattr(self, "_fft_tables"): self._fft_tables = {}
+        # Plain tuples are stored so that the object can be pickled.
+        tables = self._fft_tables.get(shape)
+        if tables is not None:
+            return dict2namedtuple(gsph2fft=tables[0], gsph2fft_conj=tables[1])
+
+        def linear_index(gvecs):
+            # Same as i1 = g1; if (i1 < 0) i1 = i1 + n1 in Fortran (0-based indices).
+            if len(gvecs) and np.any(gvecs.max(axis=0) - gvecs.min(axis=0) >= shape):
+                raise ValueError("G-sphere with G-vectors in [%s, %s] does not fit in FFT mesh %s" % (
+                                 gvecs.min(axis=0), gvecs.max(axis=0), str(shape)))
+            return np.ravel_multi_index(tuple(np.mod(gvecs, shape).T), shape)
+
+        gvecs = np.asarray(self.gvecs, dtype=np.int)
+        gsph2fft, gsph2fft_conj = linear_index(gvecs), None
+        if self.istwfk != 1:
+            g0 = np.rint(2 * np.asarray(self.kpoint.frac_coords)).astype(np.int)
+            gsph2fft_conj = linear_index(-gvecs - g0)
+
+        self._fft_tables[shape] = (gsph2fft, gsph2fft_conj)
+        return dict2namedtuple(gsph2fft=gsph2fft, gsph2fft_conj=gsph2fft_conj)
+
     def tofftmesh(self, mesh, arr_on_sphere):
         """
         Insert the array ``arr_on_sphere`` given on the sphere inside the FFT mesh.
+        If istwfk > 1, the coefficients of the missing half-sphere are reconstructed from u(-G-G0) = u(G)^*.
 
         Args:
-            mesh:
-            arr_on_sphere:
+            mesh: |Mesh3d| object.
+            arr_on_sphere: [..., npw] array.
+
+        Return: [..., nx, ny, nz] array. If ``arr_on_sphere`` is 1D or 2D with shape [1, npw], [nx, ny, nz].
         """
         arr_on_sphere = np.atleast_2d(arr_on_sphere)
         ishape = arr_on_sphere.shape
-        s0 = ishape[0]
         assert self.npw == ishape[-1]
+        tables = self.get_fft_tables(mesh)
 
-        arr_on_mesh = np.zeros((s0,) + mesh.shape, dtype=arr_on_sphere.dtype)
-
-        if self.istwfk == 1:
-            #do ipw=1,npw
-            #  i1=kg_k(1,ipw); if(i1<0)i1=i1+n1; i1=i1+1
-            #  i2=kg_k(2,ipw); if(i2<0)i2=i2+n2; i2=i2+1
-            #  i3=kg_k(3,ipw); if(i3<0)i3=i3+n3; i3=i3+1
-            #end do
-
-            n1, n2, n3 = mesh.shape
-            for sph_idx, gvec in enumerate(self.gvecs):
-                i1 = gvec[0]
-                if i1 < 0: i1 = i1 + n1
-                i2 = gvec[1]
-                if i2 < 0: i2 = i2 + n2
-                i3 = gvec[2]
-                if i3 < 0: i3 = i3 + n3
-                arr_on_mesh[..., i1, i2, i3] = arr_on_sphere[..., sph_idx]
+        arr_on_sphere = np.reshape(arr_on_sphere, (-1, self.npw))
+        arr_on_mesh = np.zeros((len(arr_on_sphere), mesh.size), dtype=arr_on_sphere.dtype)
+        if tables.gsph2fft_conj is not None:
+            arr_on_mesh[:, tables.gsph2fft_conj] = arr_on_sphere.conj()
+        # Stored coefficients are written last so that they win for the self-conjugate G-vectors.
+        arr_on_mesh[:, tables.gsph2fft] = arr_on_sphere
 
-        else:
-            raise NotImplementedError("istwfk = %s not implemented" % self.istwfk)
-
-        if s0 == 1:
+        if len(ishape) == 2 and ishape[0] == 1:
             # Reinstate input shape
-            arr_on_mesh.shape = mesh.shape
+            return np.reshape(arr_on_mesh, mesh.shape)
 
-        return arr_on_mesh
+        return np.reshape(arr_on_mesh, ishape[:-1] + tuple(mesh.shape))
 
     def fromfftmesh(self, mesh, arr_on_mesh):
         """
         Transfer ``arr_on_mesh`` given on the FFT mesh to the G-sphere.
-        """
-        indim =  arr_on_mesh.ndim
-        arr_on_mesh = mesh.reshape(arr_on_mesh)
-        ishape = arr_on_mesh.shape
-        s0 = ishape[0]
-
-        arr_on_sphere = np.empty((s0,) + (self.npw,), dtype=arr_on_mesh.dtype)
-
-        if self.istwfk == 1:
-            #do ig=1,npwout
-            #  i1=kg_kout(1,ig); if (i1<0) i1=i1+n1; i1=i1+1
-            #  i2=kg_kout(2,ig); if (i2<0) i2=i2+n2; i2=i2+1
-            #  i3=kg_kout(3,ig); if (i3<0) i3=i3+n3; i3=i3+1
-            #end do
-            n1, n2, n3 = mesh.shape
-
-            for sph_idx, gvec in enumerate(self.gvecs):
-                i1 = gvec[0]
-                if i1 < 0: i1 = i1 + n1
-                i2 = gvec[1]
-                if i2 < 0: i2 = i2 + n2
-                i3 = gvec[2]
-                if i3 < 0: i3 = i3 + n3
-                arr_on_sphere[..., sph_idx] = arr_on_mesh[..., i1, i2, i3]
 
-        else:
-            raise NotImplementedError("istwfk %s is not implemented" % self.istwfk)
+        Args:
+            mesh: |Mesh3d| object.
+            arr_on_mesh: array defined on the FFT mesh (see ``mesh.reshape``).
+
+        Return: [?, npw] array. 1D array if ``arr_on_mesh`` is 1D.
+        """
+        indim = arr_on_mesh.ndim
+        arr_on_mesh = np.reshape(mesh.reshape(arr_on_mesh), (-1, mesh.size))
+        arr_on_sphere = arr_on_mesh[:, self.get_fft_tables(mesh).gsph2fft]
 
-        if s0 == 1 and indim == 1:
+        if len(arr_on_sphere) == 1 and indim == 1:
             # Reinstate input shape
             arr_on_sphere.shape = self.npw
 
@@ -44,6 +44,7 @@ __all__ = [
     "rc_list",
     "kmesh_from_mpdivs",
     "Ktables",
+    "KpointHashTable",
     "find_points_along_path",
 ]
 
@@ -232,46 +233,77 @@ def map_grid2ibz(structure, ibz, ngkpt, has_timrev, pbc=False):
 
     # Extract rotations in reciprocal space (FM part).
     symrec_fm = [o.rot_g for o in abispg.fm_symmops]
-
-    # Compute TS k_ibz.
-    bzgrid2ibz = -np.ones(ngkpt, dtype=np.int)
-
-    for ik_ibz, kibz in enumerate(ibz):
-        gp_ibz = np.array(np.rint(kibz * ngkpt), dtype=np.int)
-        for rot in symrec_fm:
-            rot_gp = np.matmul(rot, gp_ibz)
-            gp_bz = rot_gp % ngkpt
-            bzgrid2ibz[gp_bz[0], gp_bz[1], gp_bz[2]] = ik_ibz
-            if has_timrev:
-                gp_bz = (-rot_gp) % ngkpt
-                bzgrid2ibz[gp_bz[0], gp_bz[1], gp_bz[2]] = ik_ibz
+    bz2ibz = map_grid2ibz_symrec(symrec_fm, ibz, ngkpt, has_timrev).bz2ibz
 
     if pbc:
         # Add periodic replicas.
-        bzgrid2ibz = add_periodic_replicas(bzgrid2ibz)
+        bz2ibz = add_periodic_replicas(np.reshape(bz2ibz, ngkpt)).flatten()
+
+    return bz2ibz
 
-    if np.any(bzgrid2ibz == -1):
-        #for ik_bz, ik_ibz in enumerate(self.bzgrid2ibz): print(ik_bz, ">>>", ik_ibz)
-        msg = "Found %s/%s invalid entries in bzgrid2ibz array" % ((bzgrid2ibz == -1).sum(), bzgrid2ibz.size)
+
+def map_grid2ibz_symrec(symrec, ibz, ngkpt, has_timrev):
+    """
+    Vectorized version of :func:`map_grid2ibz` operating on a list of rotations in reciprocal space.
+    The IBZ points are rotated with a single einsum and the images are identified
+    by their rank in the unit cell so that no search over the BZ is needed.
+
+    Args:
+        symrec: [nsym, 3, 3] array with the rotations in reciprocal space (reduced coordinates).
+        ibz: [*, 3] array with reduced coordinates in the in the IBZ.
+            Points must belong to the Gamma-centered ``ngkpt`` mesh.
+        ngkpt: Mesh divisions.
+        has_timrev: True if time-reversal can be used.
+
+    Return: named tuple with the following [nx * ny * nz] arrays (C-order, points in the unit cell):
+
+        bz2ibz: Index of the IBZ point.
+        bz2ibz_symm: Index of the symmetry operation such that kbz = tsign * symrec[isym] kibz + G.
+        bz2ibz_tsign: +1 or -1 if time-reversal is used.
+
+    If several operations map a point of the IBZ onto the same point of the grid,
+    the first operation (without time-reversal) is selected.
+    Raise ValueError if the IBZ does not cover the entire grid.
+    """
+    ngkpt = np.asarray(ngkpt, dtype=np.int)
+    symrec = np.reshape(symrec, (-1, 3, 3)).astype(np.int)
+    ibz = np.reshape(ibz, (-1, 3))
+    nsym, nibz, nbz = len(symrec), len(ibz), int(np.prod(ngkpt))
+
+    gp_ibz = np.rint(ibz * ngkpt)
+    # Rotate all IBZ points with a single matrix product (BLAS, exact for integers).
+    rot_gp = np.dot(np.reshape(symrec, (nsym * 3, 3)), gp_ibz.T)
+    rot_gp = np.reshape(np.rint(rot_gp).astype(np.int), (nsym, 3, nibz)).transpose(0, 2, 1)
+    tsigns = [1, -1] if has_timrev else [1]
+    ranks = np.stack([_gp2rank(ts * rot_gp, ngkpt) for ts in tsigns], axis=1)
+
+    # Assign the operations in reverse order so that the first one wins.
+    bz2ibz = -np.ones(nbz, dtype=np.int)
+    bz2ibz_symm = np.empty(nbz, dtype=np.int)
+    bz2ibz_tsign = np.empty(nbz, dtype=np.int)
+    ibz_inds = np.arange(nibz)
+    for isym in range(nsym - 1, -1, -1):
+        for it in range(len(tsigns) - 1, -1, -1):
+            rk = ranks[isym, it]
+            bz2ibz[rk] = ibz_inds
+            bz2ibz_symm[rk] = isym
+            bz2ibz_tsign[rk] = tsigns[it]
+
+    if np.any(bz2ibz == -1):
+        msg = "Found %s/%s invalid entries in bzgrid2ibz array" % ((bz2ibz == -1).sum(), bz2ibz.size)
         msg += "This can happen if there an inconsistency between the input IBZ and ngkpt"
         msg += "ngkpt: %s, has_timrev: %s" % (str(ngkpt), has_timrev)
         raise ValueError(msg)
 
-    bz2ibz = bzgrid2ibz.flatten()
-    return bz2ibz
+    return dict2namedtuple(bz2ibz=bz2ibz, bz2ibz_symm=bz2ibz_symm, bz2ibz_tsign=bz2ibz_tsign)
 
+
+def _gp2rank(gp, ngkpt):
     """
-    for ik_bz, kbz in enumerate(bz):
-        found = False
-        for ik_ibz, kibz in enumerate(ibz):
-            if found: break
-            for symmop in structure.spacegroup:
-                krot = symmop.rotate_k(kibz)
-                if issamek(krot, kbz):
-                    bz2ibz[ik_bz] = ik_ibz
-                    found = True
-                    break
+    Rank of the grid points ``gp`` (integer array with shape [..., 3]) in the unit cell (C-order).
     """
+    gp = gp % ngkpt
+    return (gp[..., 0] * ngkpt[1] + gp[..., 1]) * ngkpt[2] + gp[..., 2]
 
 
 def has_timrev_from_kptopt(kptopt):
@@ -339,33 +371,36 @@ def map_kpoints(other_kpoints, other_lattice, ref_lattice, ref_kpoints, ref_symr
 
             kpt_other = TS kpt_ref + G0
     """
-    ref_gprimd_inv = np.inv(np.asarray(ref_lattice).T)
+    ref_gprimd_inv = np.linalg.inv(np.asarray(ref_lattice).T)
     other_gprimd = np.asarray(other_lattice).T
     other_kpoints = np.asarray(other_kpoints).reshape((-1, 3))
     ref_kpoints = np.asarray(ref_kpoints).reshape((-1, 3))
+    ref_symrecs = np.reshape(ref_symrecs, (-1, 3, 3))
     o2r_map = len(other_kpoints) * [None]
 
     tsigns = (1, -1) if has_timrev else (1,)
     kmap = collections.namedtuple("kmap", "ik_ref, tsign, isym, g0")
 
-    for ik_oth, okpt in enumerate(other_kpoints):
-        # Get other k-point in reduced coordinates in the referece lattice.
-        okpt_red = np.matmul(ref_gprimd_inv, np.matmul(other_gprimd, okpt))
-
-        # k_other = TS k_ref + G0
-        found = False
-        for ik_ref, kref in enumerate(ref_kpoints):
-            if found: break
-            for tsign in tsign:
-                for isym, symrec in enumerate(ref_symrecs):
-                    krot = tsign * np.matmul(symrec, kref)
-                    if issamek(okpt_red, krot):
-                        g0 = np.rint(okpt_red - krot)
-                        o2r_map[ik_oth] = kmap(ik_ref, tsign, isym, g0)
-                        found = True
-                        break
+    # Get other k-points in reduced coordinates in the reference lattice.
+    okpts_red = np.matmul(np.matmul(ref_gprimd_inv, other_gprimd), other_kpoints.T).T
 
-        return o2r_map, o2r_map.count(None)
+    # Hash all the images TS k_ref. The order of the images defines the priority
+    # in case of multiple matches: ik_ref, then tsign, then isym.
+    nsym, ntr = len(ref_symrecs), len(tsigns)
+    krots = np.einsum("sij,kj->ksi", ref_symrecs, ref_kpoints)
+    krots = np.stack([tsign * krots for tsign in tsigns], axis=1).reshape((-1, 3))
+    table = KpointHashTable(krots)
+
+    # k_other = TS k_ref + G0
+    for ik_oth, okpt_red in enumerate(okpts_red):
+        idx = table.find(okpt_red)
+        if idx == -1: continue
+        ik_ref, rest = divmod(idx, ntr * nsym)
+        it, isym = divmod(rest, nsym)
+        g0 = np.rint(okpt_red - krots[idx])
+        o2r_map[ik_oth] = kmap(ik_ref, tsigns[it], isym, g0)
+
+    return o2r_map, o2r_map.count(None)
 
 
 #def find_irred_kpoints_kmesh(structure, kfrac_coords):
@@ -429,41 +464,29 @@ def find_irred_kpoints_generic(structure, kfrac_coords, verbose=1):
     Return:
         irred_map: Index of the i-th irreducible k-point in the input kfrac_coords array.
 
-    .. warning::
+    .. note::
 
-        In the worst case, the algorithm scales as nkpt ** 2 * nsym.
-        hence this routine should be used only if ``kfrac_coords`` represents
-        e.g. a path in the Brillouin zone or an arbitrary set of points.
+        The images of the irreducible points are stored in a :class:`KpointHashTable`
+        so that the algorithm scales as nkpt * nsym.
     """
     start = time.time()
-    print("Removing redundant k-points. This is gonna take a while... ")
 
-    # Wrap points in [0,1[ interval.
-    uc_kcoords = np.reshape(kfrac_coords, (-1, 3)) % 1
+    kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
+    # Rotations in reciprocal space including time-reversal.
+    rots = np.array([symmop.rot_g * symmop.time_sign for symmop in structure.abi_spacegroup])
 
-    irred_map = collections.deque()
-    irred_map.append(0)
-    kpts2irred = collections.deque()
-    kpts2irred.append((0, 0, +1))
+    irred_map = [0]
+    table = KpointHashTable(np.matmul(rots, kfrac_coords[0]))
 
-    for ik, kk in enumerate(uc_kcoords[1:]):
+    for ik, kk in enumerate(kfrac_coords[1:]):
         ik += 1
-        found = False
-        for ik_irr in irred_map:
-            kirr = kfrac_coords[ik_irr]
-            for isym, symmop in enumerate(structure.abi_spacegroup):
-                krot = symmop.rotate_k(kirr)
-                if issamek(krot, kk):
-                    found = True
-                    #kpts2irred[ik] = (ik_irr, isym, symmops.time_sign)
-                    break
-
-        if not found:
+        if table.find(kk) == -1:
             irred_map.append(ik)
+            table.add(np.matmul(rots, kk))
 
-    print("Completed in", time.time() - start, "[s]")
     if verbose:
-        print("Entered with ", len(uc_kcoords), "k-points")
+        print("Removing redundant k-points completed in", time.time() - start, "[s]")
+        print("Entered with ", len(kfrac_coords), "k-points")
         print("Found ", len(irred_map), "irred k-points")
 
     return dict2namedtuple(irred_map=np.array(irred_map, dtype=np.int))
@@ -845,7 +868,7 @@ class KpointList(collections.Sequence):
         return self._points[slice]
 
     def __contains__(self, kpoint):
-        return kpoint in self._points
+        return self.find(kpoint) != -1
 
     def __reversed__(self):
         return self._points.__reversed__()
@@ -875,23 +898,34 @@ class KpointList(collections.Sequence):
 
         Raises: `ValueError` if not found.
         """
-        try:
-            return self._points.index(kpoint)
-        except ValueError:
+        ik = self.find(kpoint)
+        if ik == -1:
             raise ValueError("Cannot find point: %s in KpointList:\n%s" % (repr(kpoint), repr(self)))
+        return ik
 
     def find(self, kpoint):
         """
         Returns: first index of kpoint. -1 if not found
         """
-        try:
-            return self.index(kpoint)
-        except ValueError:
-            return -1
+        return self.get_hash_table().find(kpoint)
 
     def count(self, kpoint):
         """Return number of occurrences of kpoint"""
-        return self._points.count(kpoint)
+        return len(self.get_hash_table().find_all(kpoint))
+
+    def get_hash_table(self, atol=None):
+        """
+        Return the :class:`KpointHashTable` used to find k-points in self.
+        The table is built lazily and cached for each value of ``atol``.
+
+        Args:
+            atol: Tolerance used to compare k-points. Use _ATOL_KDIFF is atol is None.
+        """
+        if atol is None: atol = _ATOL_KDIFF
+        tables = self.__dict__.setdefault("_hash_tables", {})
+        if atol not in tables:
+            tables[atol] = KpointHashTable(self.frac_coords, atol=atol)
+        return tables[atol]
 
     def find_closest(self, obj):
         """
@@ -992,15 +1026,13 @@ class KpointList(collections.Sequence):
         """
         Remove duplicated k-points from self. Returns new :class:`KpointList` instance.
         """
-        frac_coords, good_indices = [self[0].frac_coords], [0]
+        table, good_indices = KpointHashTable(self[0].frac_coords), [0]
 
         for i, kpoint in enumerate(self[1:]):
             i += 1
             # Add it only if it's not already in the list.
-            for prev_coords in frac_coords:
-                if issamek(kpoint.frac_coords, prev_coords): break
-            else:
-                frac_coords.append(kpoint.frac_coords)
+            if table.find(kpoint) == -1:
+                table.add(kpoint.frac_coords)
                 good_indices.append(i)
 
         good_kpoints = [self[i] for i in good_indices]
@@ -1060,20 +1092,90 @@ class KpointList(collections.Sequence):
             for ik, _ in enumerate(self):
                 k2kqg[ik] = (ik, g0)
         else:
-            # N**2 scaling but this algorithm can handle k-paths
+            # This algorithm can handle k-paths.
             # Note that in principle one could have multiple k+q in k-points
             # but only the first match is considered.
+            table = self.get_hash_table(atol=atol_kdiff)
             for ik, kpoint in enumerate(self):
                 kpq = kpoint.frac_coords + qfrac_coords
-                for ikq, ksearch in enumerate(self):
-                    if issamek(kpq, ksearch.frac_coords, atol=atol_kdiff):
-                        g0 = np.rint(kpq - ksearch.frac_coords)
-                        k2kqg[ik] = (ikq, g0)
-                        break
+                ikq = table.find(kpq)
+                if ikq != -1:
+                    g0 = np.rint(kpq - self.frac_coords[ikq])
+                    k2kqg[ik] = (ikq, g0)
 
         return k2kqg
 
 
+class KpointHashTable(object):
+    """
+    Hash table used to find k-points modulo reciprocal lattice vectors.
+
+    The points are folded into [0, 1[ and distributed in cubic buckets whose size is larger
+    than twice the tolerance so that each query needs to inspect at most 8 buckets.
+    Candidates are then compared with :func:`issamek` so that results are equivalent
+    to a linear search through the list.
+    """
+
+    def __init__(self, frac_coords=None, atol=None):
+        """
+        Args:
+            frac_coords: [nk, 3] array with the reduced coordinates of the initial points (optional).
+            atol: Tolerance used to compare k-points. Use _ATOL_KDIFF is atol is None.
+        """
+        self.atol = _ATOL_KDIFF if atol is None else atol
+        # issamek also uses a relative tolerance of 1e-5 (np.allclose) hence the additional term.
+        self._radius = self.atol + 1e-4
+        self._nb = max(1, int(1.0 / (2 * self._radius)))
+        self._buckets = collections.defaultdict(list)
+        self._coords = []
+        if frac_coords is not None: self.add(frac_coords)
+
+    def __len__(self):
+        return len(self._coords)
+
+    def _get_bucket_ids(self, frac_coords):
+        """Integer coordinates of the buckets containing ``frac_coords``."""
+        return np.floor((np.asarray(frac_coords) % 1) * self._nb).astype(np.int) % self._nb
+
+    def add(self, frac_coords):
+        """
+        Add a list of points to the table. Indices follow the order of insertion.
+        """
+        frac_coords = np.reshape(frac_coords, (-1, 3))
+        nb, start = self._nb, len(self._coords)
+        bids = self._get_bucket_ids(frac_coords)
+        keys = (bids[:, 0] * nb + bids[:, 1]) * nb + bids[:, 2]
+        for i, key in enumerate(keys.tolist()):
+            self._buckets[key].append(start + i)
+        self._coords.extend(frac_coords)
+
+    def find_all(self, kpoint):
+        """
+        Return sorted list with the indices of the points that are equal to ``kpoint`` modulo G.
+
+        Args:
+            kpoint: |Kpoint| or reduced coordinates.
+        """
+        kpoint = np.reshape(getattr(kpoint, "frac_coords", kpoint), (3,))
+        nb = self._nb
+        lo = self._get_bucket_ids(kpoint - self._radius)
+        hi = self._get_bucket_ids(kpoint + self._radius)
+        cands = []
+        for bx in set((lo[0], hi[0])):
+            for by in set((lo[1], hi[1])):
+                for bz in set((lo[2], hi[2])):
+                    cands.extend(self._buckets.get((bx * nb + by) * nb + bz, ()))
+
+        return [i for i in sorted(cands) if issamek(self._coords[i], kpoint, atol=self.atol)]
+
+    def find(self, kpoint):
+        """
+        Return the index of the first point equal to ``kpoint`` modulo G, -1 if not found.
+        """
+        inds = self.find_all(kpoint)
+        return inds[0] if inds else -1
+
+
 class KpointStar(KpointList):
     """
     Star of the kpoint. Note that the first k-point is assumed to be the base
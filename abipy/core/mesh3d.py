@@ -41,6 +41,11 @@ class Mesh3D(object):
            0-----4      +-----x
 
     """
+    # Library used for the FFTs: "numpy" or "pyfftw" (optional dependency, supports threads).
+    fft_backend = "numpy"
+    # Number of threads used by pyfftw.
+    fft_nthreads = 1
+
     def __init__(self, shape, vectors):
         """
         Construct ``Mesh3D`` object.
@@ -192,11 +197,30 @@ class Mesh3D(object):
         #shape = extra_dims + self.shape)
         return np.reshape(arr, (-1,) + self.shape)
 
+    def _get_fftn_ifftn(self):
+        """Return the functions used to compute the forward and the backward FFT."""
+        if self.fft_backend == "numpy":
+            return fftn, ifftn
+        elif self.fft_backend == "pyfftw":
+            try:
+                import pyfftw.interfaces.numpy_fft as fftw
+                import pyfftw.interfaces.cache
+            except ImportError:
+                raise ImportError("fft_backend is set to `pyfftw` but pyfftw is not installed")
+            pyfftw.interfaces.cache.enable()
+            nthreads = self.fft_nthreads
+            return (lambda a, axes=None: fftw.fftn(a, axes=axes, threads=nthreads),
+                    lambda a, axes=None: fftw.ifftn(a, axes=axes, threads=nthreads))
+        else:
+            raise ValueError("Invalid fft_backend: %s" % str(self.fft_backend))
+
     def fft_r2g(self, fr, shift_fg=False):
         """
         FFT of array ``fr`` given in real space.
+        Arrays with ndim > 3 are transformed with a single batched call over the last three axes.
         """
         ndim, shape = fr.ndim, fr.shape
+        fftn, _ = self._get_fftn_ifftn()
 
         if ndim == 1:
             fr = np.reshape(fr, self.shape)
@@ -209,7 +233,7 @@ class Mesh3D(object):
 
         elif ndim > 3:
             assert self.size == np.prod(shape[-3:])
-            axes = np.arange(ndim)[-3:]
+            axes = tuple(range(ndim))[-3:]
             fg = fftn(fr, axes=axes)
             if shift_fg: fg = fftshift(fg, axes=axes)
 
@@ -221,8 +245,10 @@ class Mesh3D(object):
     def fft_g2r(self, fg, fg_ishifted=False):
         """
         FFT of array ``fg`` given in G-space.
+        Arrays with ndim > 3 are transformed with a single batched call over the last three axes.
         """
         ndim, shape = fg.ndim, fg.shape
+        _, ifftn = self._get_fftn_ifftn()
 
         if ndim == 1:
             fg = np.reshape(fg, self.shape)
@@ -235,7 +261,7 @@ class Mesh3D(object):
 
         elif ndim > 3:
             assert self.size == np.prod(shape[-3:])
-            axes = np.arange(ndim)[-3:]
+            axes = tuple(range(ndim))[-3:]
             if fg_ishifted: fg = ifftshift(fg, axes=axes)
             fr = ifftn(fg, axes=axes)
 
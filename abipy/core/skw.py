@@ -6,18 +6,20 @@ For the theoretical background see :cite:`Euwema1969,Koelling1986,Pickett1988,Ma
 from __future__ import print_function, division, unicode_literals, absolute_import
 
 import abc
-import itertools
 import pickle
 import six
 import numpy as np
 import scipy
 import time
 
-from collections import deque, OrderedDict
+from collections import OrderedDict
 from monty.termcolor import cprint
 from monty.collections import dict2namedtuple
+from monty.functools import lazy_property
 from pymatgen.util.plotting import add_fig_kwargs, get_ax_fig_plt
-from abipy.tools import gaussian
+from abipy.tools import gaussian, gaussian_dos
+from abipy.tools.diskcache import DiskCache, get_cache_dir, hash_objects
+import abipy.core.abinit_units as abu
 from abipy.core.kpoints import Ktables, Kpath
 from abipy.core.symmetries import mati3inv
 
@@ -121,6 +123,40 @@ def map_bz2ibz(structure, ibz, ngkpt, has_timrev):
 #        self.is_shift, self.method, self.step, self.width = is_shift, method, step, width
 
 
+def _lru_get(od, key):
+    """Return od[key] (None if not present) and mark the item as recently used."""
+    value = od.pop(key, None)
+    if value is not None: od[key] = value
+    return value
+
+
+def _lru_put(od, key, value, maxitems):
+    """Insert (key, value) in the OrderedDict od and remove the least recently used items."""
+    od.pop(key, None)
+    od[key] = value
+    while len(od) > maxitems:
+        od.popitem(last=False)
+
+
+def _eigens_basename(key):
+    """Name of the file used to store the interpolated eigenvalues associated to key in the disk cache."""
+    return "eigens_%s.npz" % hash_objects(key)
+
+
+_SKW_CACHE = None
+
+
+def get_skw_cache():
+    """
+    Return the default |DiskCache| used to store SKW coefficients and interpolated energies.
+    Entries are stored in the ``skw`` subdirectory of :func:`abipy.tools.diskcache.get_cache_dir`.
+    """
+    global _SKW_CACHE
+    if _SKW_CACHE is None:
+        _SKW_CACHE = DiskCache(get_cache_dir("skw"), maxsize_mb=SkwInterpolator.disk_cache_maxsize_mb)
+    return _SKW_CACHE
+
+
 @six.add_metaclass(abc.ABCMeta)
 class ElectronInterpolator(object):
     """
@@ -138,6 +174,9 @@ class ElectronInterpolator(object):
     # Disable cache
     use_cache = True
 
+    # Max number of items stored in the in-memory caches (LRU policy).
+    max_cached_items = 16
+
     @classmethod
     def pickle_load(cls, filepath):
         """Loads the object from a pickle file."""
@@ -166,13 +205,14 @@ class ElectronInterpolator(object):
             bz:
             nbz
             grid:
+            bz2ibz: BZ --> IBZ mapping.
         """
         import spglib as spg
         mesh = np.array(mesh)
         mapping, grid = spg.get_ir_reciprocal_mesh(mesh, self.cell,
             is_shift=is_shift, is_time_reversal=self.has_timrev, symprec=self.symprec)
 
-        uniq, weights = np.unique(mapping, return_counts=True)
+        uniq, bz2ibz, weights = np.unique(mapping, return_inverse=True, return_counts=True)
         weights = np.asarray(weights, dtype=np.float) / len(grid)
         nkibz = len(uniq)
         ibz = grid[uniq] / mesh
@@ -182,16 +222,6 @@ class ElectronInterpolator(object):
         kshift = 0.0 if is_shift is None else 0.5 * np.asarray(is_shift)
         bz = (grid + kshift) / mesh
 
-        # All k-points and mapping to ir-grid points
-        bz2ibz = np.empty(len(bz), dtype=np.int)
-        for i, (ir_gp_id, gp) in enumerate(zip(mapping, grid)):
-            inds = np.where(uniq == ir_gp_id)
-            #print("inds", inds, "inds[0]", inds[0])
-            assert len(inds) == 1
-            bz2ibz[i] = inds[0]
-            #print("%3d ->%3d %s" % (i, ir_gp_id, (gp + [0.5, 0.5, 0.5]) / mesh))
-            #print("%3d ->%3d %s" % (i, ir_gp_id, (gp + kshift) / mesh))
-
         return dict2namedtuple(mesh=mesh, shift=kshift,
                                ibz=ibz, nibz=len(ibz), weights=weights,
                                bz=bz, nbz=len(bz), grid=grid, bz2ibz=bz2ibz)
@@ -291,6 +321,8 @@ class ElectronInterpolator(object):
             is_shift: three integers (spglib API). When is_shift is not None, the kmesh is shifted along
                 the axis in half of adjacent mesh points irrespective of the mesh numbers. None means unshited mesh.
             method: String defining the method for the computation of the DOS.
+                "gaussian" or "tetra" for the linear tetrahedron method with Blöchl corrections
+                (requires unshifted mesh).
             step: Energy step (eV) of the linear mesh.
             width: Standard deviation (eV) of the gaussian.
             mesh: Frequency mesh to use. If None, the mesh is computed automatically from the eigenvalues.
@@ -311,22 +343,44 @@ class ElectronInterpolator(object):
         nw = len(wmesh)
         values = np.zeros((self.nsppol, nw))
 
-        # TODO: Write cython version.
         if method == "gaussian":
             for spin in range(self.nsppol):
-                for ik, wtk in enumerate(k.weights):
-                    for band in range(self.nband):
-                        values[spin] += wtk * gaussian(wmesh, width, center=eigens[spin, ik, band])
+                values[spin] = gaussian_dos(wmesh, width, eigens[spin], k.weights[:, None])
 
             # Compute IDOS
             integral = scipy.integrate.cumtrapz(values, x=wmesh, initial=0.0)
 
+        elif method == "tetra":
+            values, integral = self.get_tetra(kmesh, is_shift).get_dos_idos(eigens, wmesh)
+
         else:
             raise ValueError("Method %s is not supported" % method)
 
         return dict2namedtuple(mesh=wmesh, values=values, integral=integral)
         #return ElectronDos(wmesh, values, integral, is_shift, method, step, width)
 
+    def get_tetra(self, kmesh, is_shift=None):
+        """
+        Build the |Tetrahedra| object for the IBZ returned by :meth:`get_sampling`.
+
+        Args:
+            kmesh: Three integers with the number of divisions along the reciprocal primitive axes.
+            is_shift: Must be None or zero as the tetrahedron method requires Gamma-centered meshes.
+        """
+        from abipy.core.tetra import Tetrahedra
+        if is_shift is not None and np.any(np.asarray(is_shift) != 0):
+            raise ValueError("Tetrahedron method requires unshifted meshes but got is_shift: %s" % str(is_shift))
+
+        k = self.get_sampling(kmesh, is_shift)
+        # spglib grid addresses use the first index as the fastest one and can be negative.
+        # Tetrahedra requires the BZ --> IBZ table in C-order with addresses in [0, mesh).
+        gp = k.grid % k.mesh
+        bz2ibz = np.empty(k.nbz, dtype=np.int)
+        bz2ibz[(gp[:, 0] * k.mesh[1] + gp[:, 1]) * k.mesh[2] + gp[:, 2]] = k.bz2ibz
+
+        reciprocal_matrix = np.linalg.inv(np.asarray(self.cell[0])).T
+        return Tetrahedra(reciprocal_matrix, k.mesh, bz2ibz)
+
     def get_jdos_q0(self, kmesh, is_shift=None, method="gaussian", step=0.1, width=0.2, wmesh=None):
         r"""
         Compute the join density of states at q==0
@@ -359,12 +413,10 @@ class ElectronInterpolator(object):
         if self.occtype == "insulator":
             if method == "gaussian":
                 for spin in range(self.nsppol):
-                    for ik, wtk in enumerate(k.weights):
-                        for icb in range(self.val_ib + 1, self.nband):
-                            ec = eigens[spin, ik, icb]
-                            for icv in range(self.val_ib):
-                                ev = eigens[spin, ik, icv]
-                                values[spin] += wtk * gaussian(wmesh, width, center=ec-ev)
+                    # Transition energies [nk, nc, nv]
+                    ec = eigens[spin, :, self.val_ib + 1:, None]
+                    ev = eigens[spin, :, None, :self.val_ib + 1]
+                    values[spin] = gaussian_dos(wmesh, width, ec - ev, k.weights[:, None, None])
             else:
                 raise ValueError("Method %s is not supported" % method)
 
@@ -454,7 +506,7 @@ class ElectronInterpolator(object):
 
     def _get_wmesh_step(self, eigens, wmesh, step):
         if wmesh is not None:
-            return wesh, wmesh[1] - wmesh[0]
+            return wmesh, wmesh[1] - wmesh[0]
 
         # Compute the linear mesh.
         epad = 1.0
@@ -503,7 +555,16 @@ class ElectronInterpolator(object):
         if not hasattr(self, "_cached_eigens"): self._cached_eigens = OrderedDict()
         kmesh = tuple(kmesh)
         if is_shift is not None: is_shift = tuple(is_shift)
-        arr = self._cached_eigens.get((kmesh, is_shift, kzone))
+        key = (kmesh, is_shift, kzone)
+        arr = _lru_get(self._cached_eigens, key)
+        if arr is None:
+            # Try the disk cache (if any). Only SkwInterpolator supports it at present.
+            disk_cache, cache_key = getattr(self, "disk_cache", None), getattr(self, "cache_key", None)
+            if disk_cache is not None and cache_key is not None:
+                data = disk_cache.load_npz(cache_key, _eigens_basename(key))
+                if data is not None:
+                    arr = data["eigens"]
+                    _lru_put(self._cached_eigens, key, arr, self.max_cached_items)
         if arr is not None: arr = arr.copy()
         return arr
 
@@ -515,7 +576,15 @@ class ElectronInterpolator(object):
         if not hasattr(self, "_cached_eigens"): self._cached_eigens = OrderedDict()
         kmesh = tuple(kmesh)
         if is_shift is not None: is_shift = tuple(is_shift)
-        self._cached_eigens[(kmesh, is_shift, kzone)] = eigens.copy()
+        key = (kmesh, is_shift, kzone)
+        _lru_put(self._cached_eigens, key, eigens.copy(), self.max_cached_items)
+
+        disk_cache, cache_key = getattr(self, "disk_cache", None), getattr(self, "cache_key", None)
+        if disk_cache is not None and cache_key is not None:
+            try:
+                disk_cache.save_npz(cache_key, _eigens_basename(key), eigens=eigens)
+            except (IOError, OSError) as exc:
+                cprint("Cannot save interpolated eigenvalues in cache: %s" % str(exc), "yellow")
 
     def _get_cached_edos(self, kmesh, is_shift):
         """
@@ -526,7 +595,7 @@ class ElectronInterpolator(object):
         if not hasattr(self, "_cached_edos"): self._cached_edos = OrderedDict()
         kmesh = tuple(kmesh)
         if is_shift is not None: is_shift = tuple(is_shift)
-        return self._cached_edos.get((kmesh, is_shift))
+        return _lru_get(self._cached_edos, (kmesh, is_shift))
 
     def _cache_edos(self, kmesh, is_shift, edos):
         """
@@ -536,7 +605,7 @@ class ElectronInterpolator(object):
         if not hasattr(self, "_cached_edos"): self._cached_edos = OrderedDict()
         kmesh = tuple(kmesh)
         if is_shift is not None: is_shift = tuple(is_shift)
-        self._cached_edos[(kmesh, is_shift)] = edos # .copy()
+        _lru_put(self._cached_edos, (kmesh, is_shift), edos, self.max_cached_items)
 
     @add_fig_kwargs
     def plot_dos_vs_kmeshes(self, kmeshes, is_shift=None, method="gaussian", step=0.1, width=0.2,
@@ -820,9 +889,20 @@ class SkwInterpolator(ElectronInterpolator):
     the names of the variables are chosen assuming we are interpolating electronic eigenvalues
     but the same object can be used to interpolate other quantities. Just set the first dimension to 1.
     """
+    # Max number of entries in the [nk, nsym, nr] workspace used to compute
+    # star functions for a block of k-points (see get_stark_kpts).
+    max_stark_nelem = 2 ** 22
+
+    # True if the coefficients should be saved in the default disk cache (see get_skw_cache).
+    # Disabled by default since the cache is written in the user's HOME (see get_cache_dir).
+    use_disk_cache = False
+    disk_cache_maxsize_mb = 1024
+
+    # Version of the data stored in the disk cache. Must be changed if the algorithm changes.
+    _CACHE_VERSION = 1
 
     def __init__(self, lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev,
-                 filter_params=None, verbose=1):
+                 filter_params=None, verbose=1, cache=None):
         """
         Args:
             lpratio: Ratio between the number of star-functions and the number of ab-initio k-points.
@@ -841,6 +921,9 @@ class SkwInterpolator(ElectronInterpolator):
             filter_params: List with parameters used to filter high-frequency components (Eq 9 of PhysRevB.61.1639)
                 First item gives rcut, second item sigma. Ignored if None.
             verbose: Verbosity level.
+            cache: |DiskCache| used to store the coefficients of the fit. The entry is keyed by
+                the hash of the input data so that the fit is skipped if the same input has been
+                already processed. None to use the default cache if ``use_disk_cache``, False to disable it.
         """
         self.verbose = verbose
         self.cell = cell
@@ -876,6 +959,18 @@ class SkwInterpolator(ElectronInterpolator):
         if lpratio <= 1:
             raise ValueError("lpratio must be > 1 but got %s" % lpratio)
 
+        # Reuse the coefficients computed in a previous run if the same input is found in the disk cache.
+        if cache is None: cache = get_skw_cache() if self.use_disk_cache else None
+        self.disk_cache = cache if cache else None
+        self.cache_key = None
+        if self.disk_cache is not None:
+            self.cache_key = hash_objects("SkwInterpolator", self._CACHE_VERSION, lpratio,
+                np.asarray(kpts, dtype=np.float), eigens, np.asarray(lattice, dtype=np.float),
+                np.asarray(symrel, dtype=np.int), bool(has_timrev),
+                None if filter_params is None else [float(f) for f in filter_params])
+            if self._load_fit():
+                return
+
         nrwant = lpratio * self.nkpt
         fact = 1/2 if has_inversion else 1
         rmax = int((1.0 + (lpratio * self.nkpt * self.ptg_nsym * fact) / 2.0) ** (1/3.)) * np.ones(3, dtype=np.int)
@@ -900,9 +995,7 @@ class SkwInterpolator(ElectronInterpolator):
 
         # Construct star functions for the ab-initio k-points.
         nsppol, nband, nkpt, nr = self.nsppol, self.nband, self.nkpt, self.nr
-        self.skr = np.empty((nkpt, nr), dtype=np.complex)
-        for ik, kpt in enumerate(kpts):
-            self.skr[ik] = self.get_stark(kpt)
+        self.skr = self.get_stark_kpts(kpts)[0]
 
         # Build H(k,k') matrix (Hermitian)
         hmat = np.empty((nkpt-1, nkpt-1), dtype=np.complex)
@@ -992,6 +1085,41 @@ class SkwInterpolator(ElectronInterpolator):
             cprint("MAE:", mae, "[meV]", "red")
 
         self.mae = mae
+        self._save_fit()
+
+    def _save_fit(self):
+        """Save the results of the fit in the disk cache."""
+        if self.disk_cache is None or self.cache_key is None: return
+        nan = np.nan
+        try:
+            self.disk_cache.save_npz(self.cache_key, "skw.npz", rpts=self.rpts, coefs=self.coefs,
+                mae=self.mae, rcut=nan if self.rcut is None else self.rcut,
+                rsigma=nan if self.rsigma is None else self.rsigma)
+        except (IOError, OSError) as exc:
+            cprint("Cannot save SKW coefficients in cache: %s" % str(exc), "yellow")
+
+    def _load_fit(self):
+        """
+        Initialize the object from the results of a previous fit stored in the disk cache.
+        Return True if success.
+        """
+        data = self.disk_cache.load_npz(self.cache_key, "skw.npz")
+        if data is None: return False
+        if self.verbose: print("Reading SKW coefficients from cache entry:", self.cache_key)
+
+        self.rpts, self.coefs = data["rpts"], data["coefs"]
+        self.nr = len(self.rpts)
+        self.mae = float(data["mae"])
+        rcut, rsigma = float(data["rcut"]), float(data["rsigma"])
+        self.rcut = None if np.isnan(rcut) else rcut
+        self.rsigma = None if np.isnan(rsigma) else rsigma
+        # Star functions for the ab-initio k-points are only needed to compute the coefficients.
+        self.skr = None
+
+        self.cached_kpt = np.ones(3) * np.inf
+        self.cached_kpt_dk1 = np.ones(3) * np.inf
+        self.cached_kpt_dk2 = np.ones(3) * np.inf
+        return True
 
     def __str__(self):
         return self.to_string()
@@ -1010,6 +1138,128 @@ class SkwInterpolator(ElectronInterpolator):
 
         return "\n".join(lines)
 
+    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False, kchunk=None):
+        """
+        Interpolate energies on an arbitrary set of k-points. Optionally, compute
+        gradients and Hessian matrices. The star functions are computed for blocks
+        of k-points and the energies are obtained with a single matrix product
+        with the coefficients (see also :meth:`get_stark_kpts`).
+
+        Args:
+            kfrac_coords: K-points in reduced coordinates.
+            dk1 (bool): True if gradient is wanted.
+            dk2 (bool): True to compute 2nd order derivatives.
+            kchunk: Number of k-points in each block. If None, the value is computed
+                from ``max_stark_nelem`` so that memory is bounded.
+
+        Return:
+            namedtuple with:
+            interpolated energies in eigens[nsppol, len(kfrac_coords), nband]
+            gradient in dedk[self.nsppol, len(kfrac_coords), self.nband, 3))
+            hessian in dedk2[self.nsppol, len(kfrac_coords), self.nband, 3, 3))
+
+            gradient and hessian are set to None if not computed.
+        """
+        start = time.time()
+
+        kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
+        new_nkpt = len(kfrac_coords)
+        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband))
+        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3))
+        dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3))
+
+        kchunk = self._get_kchunk(kchunk, dk2=dk2)
+        for ks in range(0, new_nkpt, kchunk):
+            ke = min(ks + kchunk, new_nkpt)
+            # Star functions do not depend on spin.
+            skr, skr_dk1, skr_dk2 = self.get_stark_kpts(kfrac_coords[ks:ke], dk1=dk1, dk2=dk2, kchunk=kchunk)
+            for spin in range(self.nsppol):
+                # [NK, NR] x [NR, NB]
+                new_eigens[spin, ks:ke] = np.matmul(skr, self.coefs[spin].T).real
+                if dk1:
+                    dedk[spin, ks:ke] = np.einsum("kir,br->kbi", skr_dk1, self.coefs[spin]).real
+                if dk2:
+                    dedk2[spin, ks:ke] = np.einsum("kijr,br->kbij", skr_dk2, self.coefs[spin]).real
+
+        if self.verbose:
+            print("Interpolation completed in %.3f (s)" % (time.time() - start))
+
+        return dict2namedtuple(eigens=new_eigens, dedk=dedk, dedk2=dedk2)
+
+    def get_effmass_tensors(self, kpts, spin=0, bands=None, kchunk=None):
+        """
+        Compute the effective mass tensors from the analytic Hessian of the interpolated energies.
+        Assumes energies in eV and lattice vectors in Angstrom (same convention as |ElectronBands|).
+
+        Args:
+            kpts: K-points in reduced coordinates (usually band extrema).
+            spin: Spin index.
+            bands: List of band indices. If None, all bands are considered.
+            kchunk: Number of k-points in each block (see :meth:`interp_kpts`).
+
+        Return:
+            namedtuple with:
+            kpts[nk, 3], bands[nb], interpolated energies in eigens[nk, nb],
+            inverse effective mass tensors (Cartesian coordinates, atomic units) in inv_masses[nk, nb, 3, 3],
+            effective mass tensors in units of the electron mass in masses[nk, nb, 3, 3],
+            eigenvalues (principal masses) and eigenvectors of the mass tensors in
+            principal_masses[nk, nb, 3] and principal_axes[nk, nb, 3, 3] (eigenvectors along the last axis).
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        bands = np.arange(self.nband) if bands is None else np.array(bands, dtype=np.int).ravel()
+
+        r = self.interp_kpts(kpts, dk1=False, dk2=True, kchunk=kchunk)
+        eigens = r.eigens[spin][:, bands]
+        d2 = r.dedk2[spin][:, bands]
+
+        # dedk2 is the derivative wrt 2 pi k_red and k_cart = 2 pi A^{-T} k_red with A having
+        # the lattice vectors along the columns so that d2E/dk_cart^2 = A d2E A^T.
+        amat = np.asarray(self.cell[0]).T / abu.Bohr_Ang
+        inv_masses = np.einsum("ai,kbij,cj->kbac", amat, d2, amat) / abu.Ha_eV
+        # Symmetrize to remove numerical noise.
+        inv_masses = 0.5 * (inv_masses + np.swapaxes(inv_masses, -1, -2))
+
+        masses = np.linalg.inv(inv_masses)
+        principal_masses, principal_axes = np.linalg.eigh(masses)
+
+        return dict2namedtuple(kpts=kpts, bands=bands, eigens=eigens, inv_masses=inv_masses, masses=masses,
+                               principal_masses=principal_masses, principal_axes=principal_axes)
+
+    def get_band_edges_effmass(self, kmesh, is_shift=None, spin=0):
+        """
+        Locate the valence band maximum and the conduction band minimum on the k-mesh
+        defined by ``kmesh`` and ``is_shift`` and compute the effective mass tensors at these points.
+        Requires ``occtype == "insulator"``.
+
+        Args:
+            kmesh: Three integers with the number of divisions along the reciprocal primitive axes.
+            is_shift: three integers (spglib API). When is_shift is not None, the kmesh is shifted along
+                the axis in half of adjacent mesh points irrespective of the mesh numbers. None means unshited mesh.
+            spin: Spin index.
+
+        Return:
+            namedtuple with ``vbm`` and ``cbm`` entries. Each entry is the object returned by
+            :meth:`get_effmass_tensors` for a single k-point and a single band.
+        """
+        if self.occtype != "insulator":
+            raise ValueError("get_band_edges_effmass requires occtype == insulator but got %s" % self.occtype)
+        if self.val_ib + 1 >= self.nband:
+            raise ValueError("Conduction band is not available. nband: %s, val_ib: %s" % (self.nband, self.val_ib))
+
+        k = self.get_sampling(kmesh, is_shift)
+        eigens = self._get_cached_eigens(kmesh, is_shift, "ibz")
+        if eigens is None:
+            eigens = self.interp_kpts(k.ibz).eigens
+            self._cache_eigens(kmesh, is_shift, eigens, "ibz")
+
+        ik_vbm = eigens[spin, :, self.val_ib].argmax()
+        ik_cbm = eigens[spin, :, self.val_ib + 1].argmin()
+
+        return dict2namedtuple(
+            vbm=self.get_effmass_tensors(k.ibz[ik_vbm], spin=spin, bands=[self.val_ib]),
+            cbm=self.get_effmass_tensors(k.ibz[ik_cbm], spin=spin, bands=[self.val_ib + 1]),
+        )
+
     def eval_sk(self, spin, kpt, der1=None, der2=None):
         """
         Interpolate eigenvalues for all bands at a given (spin, k-point).
@@ -1042,7 +1292,7 @@ class SkwInterpolator(ElectronInterpolator):
                     value = np.matmul(self.coefs[spin, :, :], skr_dk2[ii,jj])
                     if not self.iscomplexobj: value = value.real
                     der2[:, ii, jj] = value
-                    if ii != jj: der2[jj, ii] = der2[ii, jj]
+                    if ii != jj: der2[:, jj, ii] = der2[:, ii, jj]
 
         return oeigs
 
@@ -1111,6 +1361,61 @@ class SkwInterpolator(ElectronInterpolator):
 
         return skr
 
+    @lazy_property
+    def srpts(self):
+        """
+        Integer array of shape [ptg_nsym, nr, 3] with the rotated R-points S R.
+        Used to compute the star functions for many k-points since k.(S R) = (S^t k).R
+        """
+        return np.einsum("sij,rj->sri", self.ptg_symrel, self.rpts)
+
+    def _get_kchunk(self, kchunk, dk2=False):
+        """Number of k-points in each block used to compute star functions."""
+        if kchunk is not None: return max(1, int(kchunk))
+        # The [nk, 3, 3, nr] array with 2nd-order derivatives is larger than the workspace if nsym < 9.
+        return max(1, self.max_stark_nelem // (max(self.ptg_nsym, 9 if dk2 else 1) * self.nr))
+
+    def get_stark_kpts(self, kpts, dk1=False, dk2=False, kchunk=None):
+        """
+        Compute the star functions and, optionally, their 1st- and 2nd-order derivatives wrt k
+        for a set of k-points. Rotations and R-points are treated with matrix products
+        and the k-points are processed in blocks of ``kchunk`` points to bound memory.
+
+        Args:
+            kpts: K-points in reduced coordinates.
+            dk1: True if the 1st-order derivatives are wanted.
+            dk2: True if the 2nd-order derivatives are wanted.
+            kchunk: Number of k-points in each block. None to compute it from ``max_stark_nelem``.
+
+        Return:
+            (skr, skr_dk1, skr_dk2) where skr is a complex array of shape [nk, self.nr],
+            skr_dk1 is a complex array of shape [nk, 3, self.nr] (None if not dk1) and
+            skr_dk2 is a complex array of shape [nk, 3, 3, self.nr] (None if not dk2).
+            Same conventions as :meth:`get_stark`, :meth:`get_stark_dk1` and :meth:`get_stark_dk2`.
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        nk, nsym, nr = len(kpts), self.ptg_nsym, self.nr
+        srpts = self.srpts
+        srpts_t = np.reshape(srpts, (-1, 3)).T
+
+        skr = np.empty((nk, nr), dtype=np.complex)
+        skr_dk1 = None if not dk1 else np.empty((nk, 3, nr), dtype=np.complex)
+        skr_dk2 = None if not dk2 else np.empty((nk, 3, 3, nr), dtype=np.complex)
+
+        kchunk = self._get_kchunk(kchunk, dk2=dk2)
+        for ks in range(0, nk, kchunk):
+            ke = min(ks + kchunk, nk)
+            # exp(i 2pi k.(S R)) for all k in the block, all rotations and all R-points.
+            eiskr = np.exp(2.j * np.pi * np.matmul(kpts[ks:ke], srpts_t))
+            eiskr.shape = (ke - ks, nsym, nr)
+            skr[ks:ke] = eiskr.sum(axis=1) / nsym
+            if dk1:
+                skr_dk1[ks:ke] = (1.j / nsym) * np.einsum("ksr,sri->kir", eiskr, srpts)
+            if dk2:
+                skr_dk2[ks:ke] = (-1.0 / nsym) * np.einsum("ksr,sri,srj->kijr", eiskr, srpts, srpts)
+
+        return skr, skr_dk1, skr_dk2
+
     def get_stark_dk1(self, kpt):
         """
         Compute the 1st-order derivative of the star function wrt k
@@ -1122,17 +1427,10 @@ class SkwInterpolator(ElectronInterpolator):
             complex array [3, self.nr]  with the derivative of the
             star function wrt k in reduced coordinates.
         """
-        srk_dk1 = np.zeros((3, self.nr), dtype=np.complex)
-        two_pi = 2.0 * np.pi
-        rpts_t = self.rpts.T
-
-        for omat in self.ptg_symrel:
-            sk = two_pi * np.matmul(omat.T, kpt)
-            exp_skr = np.exp(1.j * np.matmul(self.rpts, sk))
-            for ir, rr in enumerate(self.rpts):
-                srk_dk1[:, ir] += exp_skr[ir] * np.matmul(omat, rr)
-            #for ir, or in enumerate(np.matmul(omat, rpts_t).T):
-            #    srk_dk1[:, ir] += exp_skr[ir] * or
+        # exp(i 2pi k.(S R)) for all rotations and R-points: [nsym, nr]
+        srpts = self.srpts
+        eiskr = np.exp(2.j * np.pi * np.matmul(srpts, kpt))
+        srk_dk1 = np.einsum("sr,sri->ir", eiskr, srpts)
 
         srk_dk1 *= 1.j / self.ptg_nsym
         return srk_dk1
@@ -1148,25 +1446,12 @@ class SkwInterpolator(ElectronInterpolator):
             Complex numpy array of shape [3, 3, self.nr] with the 2nd-order derivatives
             of the star function wrt k in reduced coordinates.
         """
-        srk_dk2 = np.zeros((3, 3, self.nr), dtype=np.complex)
-        raise NotImplementedError()
-        #work = zero
-        #do isym=1,self.ptg_nsym
-        #   sk = two_pi * matmul(transpose(self%ptg_symrel(:,:,isym)), kpt)
-        #   do ir=1,self%nr
-        #     sr = matmul(self%ptg_symrel(:,:,isym), self%rpts(:,ir))
-        #     eiskr = exp(j_dpc * dot_product(sk, self%rpts(:,ir)))
-        #     do jj=1,3
-        #        do ii=1,jj
-        #            work(ii,jj,ir) = work(ii,jj,ir) + eiskr * sr(ii) * sr(jj)
-
-        #work = - work / self.ptg_nsym
-
-        #do jj=1,3
-        #   do ii=1,jj
-        #       srk_dk2(:, ii, jj) = work(ii, jj, :)
-        #       if (ii /= jj) srk_dk2(:,jj,ii) = work(:,ii,jj)
+        # exp(i 2pi k.(S R)) for all rotations and R-points: [nsym, nr]
+        srpts = self.srpts
+        eiskr = np.exp(2.j * np.pi * np.matmul(srpts, kpt))
+        srk_dk2 = np.einsum("sr,sri,srj->ijr", eiskr, srpts, srpts)
 
+        srk_dk2 *= -1.0 / self.ptg_nsym
         return srk_dk2
 
     #def find_stationary_points(self, kmesh, bstart=None, bstop=None, is_shift=None)
@@ -1199,87 +1484,39 @@ class SkwInterpolator(ElectronInterpolator):
             tuple: (rpts, r2vals, ok)
         """
         msize = (2 * rmax + 1).prod()
-        rtmp = np.empty((msize, 3), dtype=np.int)
-        r2tmp = np.empty(msize)
         if self.verbose: print("rmax", rmax, "msize:", msize)
 
         start = time.time()
-        for cnt, l in enumerate(itertools.product(range(-rmax[0], rmax[0] + 1),
-            range(-rmax[1], rmax[1] + 1), range(-rmax[2], rmax[2] + 1))):
-              rtmp[cnt] = l
-              r2tmp[cnt] = np.dot(l, np.matmul(self.rmet, l))
+        # Same ordering as itertools.product (last index runs fastest).
+        rtmp = np.stack(np.meshgrid(*[np.arange(-rmax[i], rmax[i] + 1) for i in range(3)], indexing="ij"), axis=-1)
+        rtmp = np.reshape(rtmp, (-1, 3)).astype(np.int)
+        r2tmp = np.einsum("ri,ij,rj->r", rtmp, self.rmet, rtmp)
         if self.verbose: print("gen points", time.time() - start)
 
-        start = time.time()
         # Sort r2tmp and rtmp
-        iperm = np.argsort(r2tmp)
+        start = time.time()
+        iperm = np.argsort(r2tmp, kind="mergesort")
         r2tmp = r2tmp[iperm]
         rtmp = rtmp[iperm]
-        #return rtmp, r2tmp, True
-
-        # Find shells
-        r2sh = np.empty(msize, dtype=np.int)    # Correspondence between R and shell index.
-        shlim = np.empty(msize, dtype=np.int)   # For each shell, the index of the initial G-vector.
-        nsh = 1
-        r2sh[0] = 0
-        shlim[0] = 0
-        r2_prev = 0.0
-        for ir in range(1, msize):
-            if (abs(r2tmp[ir] - r2_prev) > r2tmp[ir] * 1e-8):
-                r2_prev = r2tmp[ir]
-                shlim[nsh] = ir
-                nsh += 1
-            r2sh[ir] = nsh
-        shlim[nsh] = msize
-        if self.verbose:
-            print("nshells", nsh)
-            print("shells", time.time() - start)
 
         # Find R-points generating the stars.
-        # This is the most CPU critical part. I think it's difficult to do better than this without cython
-        start = time.time()
-        rgen = deque()
-
-        for ish in range(nsh):
-            ss, ee = shlim[ish], shlim[ish + 1]
-            if ss + 1 == ee:
-                rgen.append(rtmp[ss])
-                continue
-
-            if True:
-                # This is faster
-                rs = set([tuple(rtmp[ss])])
-                for ir in range(ss + 1, ee):
-                    rvec = rtmp[ir]
-                    if all(tuple(np.matmul(rot, rvec)) not in rs for rot in self.ptg_symrel):
-                        rs.add(tuple(rvec))
-            else:
-                rs = deque([rtmp[ss]])
-                for ir in range(ss + 1, ee):
-                    for rot in self.ptg_symrel:
-                        rot_r = np.matmul(rot, rtmp[ir])
-                        if any(np.all(rot_r == x) for x in rs): break
-                    else:
-                        # We have new R-point.
-                        #print("Adding new point")
-                        rs.append(rtmp[ir])
-
-            #print(len(rs), rs)
-            rgen.extend(rs)
-        #print(rgen)
+        # Each point is labelled by the lexicographically minimal element of its star so that
+        # two points belong to the same star iff they have the same label.
+        # The generator of the star is the first point (smallest |R|) with that label.
+        labels = star_labels(rtmp, self.ptg_symrel)
+        _, first = np.unique(labels, return_index=True)
+        first.sort()
+        rgen = rtmp[first]
         if self.verbose: print("stars", time.time() - start)
 
         start = time.time()
-        rgen = np.array(rgen, dtype=np.int)
         nstars = len(rgen)
 
         # Store rpts and compute ||R||**2.
         ok = nstars >= nrwant
         nr = min(nstars, nrwant)
         rpts = rgen[:nr].copy()
-        r2vals = np.empty(nr)
-        for ir in range(nr):
-            r2vals[ir] = np.dot(rpts[ir], np.matmul(self.rmet, rpts[ir]))
+        r2vals = np.einsum("ri,ij,rj->r", rpts, self.rmet, rpts)
 
         if self.verbose:
             print("r2max ", rpts[nr-1])
@@ -1292,6 +1529,50 @@ class SkwInterpolator(ElectronInterpolator):
         return rpts, r2vals, ok
 
 
+def star_labels(rpts, symrel, chunk=2**22):
+    """
+    Label the stars of a set of lattice points.
+
+    Each point R is mapped to an integer that encodes the lexicographically minimal
+    element of {S R} where S runs over the rotations in `symrel`. Points belonging to the same
+    star have the same label. The rotated images are computed for blocks of points to bound memory.
+
+    Args:
+        rpts: [npts, 3] integer array with the lattice points in reduced coordinates.
+        symrel: [nsym, 3, 3] integer array with the rotations in reduced coordinates. Must form a group.
+        chunk: Max number of rotated images computed in a single block.
+
+    Return:
+        int64 array of shape [npts] with the labels.
+    """
+    rpts = np.reshape(rpts, (-1, 3))
+    symrel = np.reshape(symrel, (-1, 3, 3))
+    npts = len(rpts)
+
+    # Rotated coordinates are bounded by rmax * max_i sum_j |S_ij|.
+    rmax = np.abs(rpts).max() if npts else 0
+    bound = rmax * np.abs(symrel).sum(axis=2).max()
+    base = 2 * bound + 1
+    if base ** 3 >= np.iinfo(np.int64).max:
+        raise ValueError("Lattice points are too large to be encoded in int64 labels. rmax: %s" % rmax)
+    weights = np.array([base ** 2, base, 1], dtype=np.int64)
+
+    # Encode (S R + bound) with base so that the ordering of the labels is the lexicographical
+    # ordering of the rotated vectors. Since (S R + bound).w = R.(S^t w) + bound * sum(w),
+    # the keys of all the rotated images are obtained with a single integer matrix product.
+    stw = np.einsum("sij,i->js", symrel.astype(np.int64), weights)
+    shift = bound * weights.sum()
+    rpts = rpts.astype(np.int64)
+
+    labels = np.empty(npts, dtype=np.int64)
+    step = max(1, chunk // len(symrel))
+    for start in range(0, npts, step):
+        stop = min(start + step, npts)
+        labels[start:stop] = np.matmul(rpts[start:stop], stw).min(axis=1) + shift
+
+    return labels
+
+
 def extract_point_group(symrel, has_timrev):
     """
     Extract the point group rotations from the spacegroup. Add time-reversal
@@ -144,6 +144,30 @@ def cod_search(formula, primitive=False):
     return restapi.CodStructures(structures, cod_ids, data=data)
 
 
+# LRU cache with the SpacegroupAnalyzer objects built by Structure.spget_analyzer.
+_SPGA_CACHE = OrderedDict()
+
+
+def clear_spga_cache():
+    """Remove all the entries from the cache used by :meth:`Structure.spget_analyzer`."""
+    _SPGA_CACHE.clear()
+
+
+def _spga_fingerprint(structure, symprec, angle_tolerance, decimals=8):
+    """
+    Return string with the fingerprint of the structure used as key in the spglib cache.
+    The fingerprint is computed from the lattice, the species, the fractional coordinates
+    (all rounded to ``decimals`` digits), the magnetic moments and the tolerances.
+    """
+    from abipy.tools.diskcache import hash_objects
+    # Add 0.0 to convert -0.0 to 0.0
+    return hash_objects(np.round(structure.lattice.matrix, decimals) + 0.0,
+                        [site.species_string for site in structure],
+                        np.round(structure.frac_coords, decimals) + 0.0,
+                        structure.site_properties.get("magmom"),
+                        float(symprec), float(angle_tolerance))
+
+
 class Structure(pymatgen.Structure, NotebookWriter):
     """
     Extends :class:`pymatgen.core.structure.Structure` with Abinit-specific methods.
@@ -156,6 +180,10 @@ class Structure(pymatgen.Structure, NotebookWriter):
     .. rubric:: Inheritance Diagram
     .. inheritance-diagram:: Structure
     """
+    # Max number of SpacegroupAnalyzer objects stored in the cache used by spget_analyzer (LRU policy).
+    # Set it to 0 to disable the cache.
+    spga_cache_size = 128
+
     @classmethod
     def as_structure(cls, obj):
         """
@@ -603,7 +631,7 @@ class Structure(pymatgen.Structure, NotebookWriter):
         Returns:
             The structure in a conventional standardized cell
         """
-        spga = SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+        spga = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
         new = spga.get_conventional_standard_structure(international_monoclinic=international_monoclinic)
         return self.__class__.as_structure(new)
 
@@ -647,14 +675,15 @@ class Structure(pymatgen.Structure, NotebookWriter):
 
         # Refine structure
         if symprec is not None and angle_tolerance is not None:
-            sym_finder = SpacegroupAnalyzer(structure=structure, symprec=symprec, angle_tolerance=angle_tolerance)
+            sym_finder = structure.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
             structure = sym_finder.get_refined_structure()
 
         # Convert to primitive structure.
         if primitive:
             if primitive_standard:
                 # Setyawan, W., & Curtarolo, S.
-                sym_finder_prim = SpacegroupAnalyzer(structure=structure, symprec=symprec, angle_tolerance=angle_tolerance)
+                structure = self.__class__.as_structure(structure)
+                sym_finder_prim = structure.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
                 structure = sym_finder_prim.get_primitive_standard_structure(international_monoclinic=False)
             else:
                 # Find most primitive structure.
@@ -727,6 +756,51 @@ class Structure(pymatgen.Structure, NotebookWriter):
             return self.lattice.reciprocal_lattice.matrix
         raise ValueError("Wrong value for space: %s " % str(space))
 
+    def spget_analyzer(self, symprec=1e-3, angle_tolerance=5):
+        """
+        Return pymatgen :class:`SpacegroupAnalyzer` for this structure.
+
+        Analyzers are stored in a LRU cache (see ``spga_cache_size``) indexed by the fingerprint
+        of the structure (lattice, species, rounded fractional coordinates, magnetic moments)
+        and the tolerances so that spglib_ is called only once for identical structures.
+        The object is shared hence the symmetry dataset should not be modified in place.
+
+        Args:
+            symprec (float): Symmetry precision for distance.
+            angle_tolerance (float): Tolerance on angles.
+        """
+        maxsize = self.__class__.spga_cache_size
+        if not maxsize:
+            return SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+
+        key = _spga_fingerprint(self, symprec, angle_tolerance)
+        spga = _SPGA_CACHE.pop(key, None)
+        if spga is None:
+            # Use a copy so that the analyzer is not affected by in-place modifications of self.
+            spga = SpacegroupAnalyzer(self.copy(), symprec=symprec, angle_tolerance=angle_tolerance)
+
+        # Insert as most recently used and remove the least recently used items.
+        _SPGA_CACHE[key] = spga
+        while len(_SPGA_CACHE) > maxsize:
+            _SPGA_CACHE.popitem(last=False)
+
+        return spga
+
+    def get_space_group_info(self, symprec=1e-2, angle_tolerance=5.0):
+        """
+        Convenience method to quickly get the spacegroup of a structure.
+        Same as the pymatgen version but uses the cache of :meth:`spget_analyzer`.
+
+        Args:
+            symprec (float): Symmetry precision for distance.
+            angle_tolerance (float): Tolerance on angles.
+
+        Returns:
+            (spacegroup_symbol, international_number)
+        """
+        spga = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
+        return spga.get_space_group_symbol(), spga.get_space_group_number()
+
     def spget_lattice_type(self, symprec=1e-3, angle_tolerance=5):
         """
         Call spglib to get the lattice for the structure, e.g., (triclinic,
@@ -740,7 +814,7 @@ class Structure(pymatgen.Structure, NotebookWriter):
         Returns:
             (str): Lattice type for structure or None if type cannot be detected.
         """
-        spgan = SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+        spgan = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
         return spgan.get_lattice_type()
 
     def spget_equivalent_atoms(self, symprec=1e-3, angle_tolerance=5, printout=False):
@@ -765,7 +839,7 @@ class Structure(pymatgen.Structure, NotebookWriter):
             for irr_pos in irred_pos:
                 eqmap[irr_pos]   # List of symmetrical positions associated to the irr_pos atom.
         """
-        spgan = SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+        spgan = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
         spgdata = spgan.get_symmetry_dataset()
         equivalent_atoms = spgdata["equivalent_atoms"]
         irred_pos = []
@@ -800,7 +874,7 @@ class Structure(pymatgen.Structure, NotebookWriter):
             angle_tolerance (float): Tolerance on angles.
             verbose (int): Verbosity level.
         """
-        spgan = SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+        spgan = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
         spgdata = spgan.get_symmetry_dataset()
         # Get spacegroup number computed by Abinit if available.
         abispg_number = None if self.abi_spacegroup is None else self.abi_spacegroup.spgid
@@ -1120,8 +1194,9 @@ class Structure(pymatgen.Structure, NotebookWriter):
         spglib_symbol, spglib_number, spglib_lattice_type = None, None, None
         if with_spglib:
             try:
-                spglib_symbol, spglib_number = self.get_space_group_info(symprec=symprec, angle_tolerance=angle_tolerance)
-                spglib_lattice_type = self.spget_lattice_type(symprec=symprec, angle_tolerance=angle_tolerance)
+                spga = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
+                spglib_symbol, spglib_number = spga.get_space_group_symbol(), spga.get_space_group_number()
+                spglib_lattice_type = spga.get_lattice_type()
             except Exception as exc:
                 cprint("Spglib couldn't find space group symbol and number for composition %s" % str(self.composition), "red")
                 print("Exception:\n", exc)
@@ -1405,78 +1480,57 @@ class Structure(pymatgen.Structure, NotebookWriter):
             scale_matrix = np.eye(3, 3)
             return scale_matrix
 
+        return self.get_smallest_supercells([qpoint], max_supercell)[0]
+
+    def get_smallest_supercells(self, qpoints, max_supercell):
+        """
+        Compute the scaling matrices of the smallest supercells commensurate with a list of q-points.
+        The table with the candidate lattice vectors is computed once and shared by all the q-points.
+
+        Args:
+            qpoints: List of q vectors in reduced coordinates in reciprocal space. Shape (nq, 3)
+            max_supercell: vector with the maximum supercell size
+
+        Returns: |numpy-array| of shape (nq, 3, 3) with the scaling matrices of the supercells.
+        """
+        qpoints = np.reshape(qpoints, (-1, 3))
         l = max_supercell
 
         # Inspired from Exciting Fortran code phcell.F90
-        # It should be possible to improve this code taking advantage of python !
-        scale_matrix = np.zeros((3, 3), dtype=np.int)
-        dmin = np.inf
-        found = False
-
-        # Try to reduce the matrix
-        rprimd = self.lattice.matrix
-        for l1 in np.arange(-l[0], l[0]+1):
-            for l2 in np.arange(-l[1], l[1]+1):
-                for l3 in np.arange(-l[2], l[2]+1):
-                    lnew = np.array([l1, l2, l3])
-                    ql = np.dot(lnew, qpoint)
-                    # Check if integer and non zero !
-                    if np.abs(ql - np.round(ql)) < 1e-6:
-                        Rl = np.dot(lnew, rprimd)
-                        # Normalize the displacement so that the maximum atomic displacement is 1 Angstrom.
-                        dnorm = np.sqrt(np.dot(Rl,Rl))
-                        if dnorm < (dmin-1e-6) and dnorm > 1e-6:
-                            found = True
-                            scale_matrix[:, 0] = lnew
-                            dmin = dnorm
-        if not found:
-            raise ValueError('max_supercell is not large enough for this q-point')
-
-        found = False
-        dmin = np.inf
-        for l1 in np.arange(-l[0], l[0]+1):
-            for l2 in np.arange(-l[1], l[1]+1):
-                for l3 in np.arange(-l[2], l[2]+1):
-                    lnew = np.array([l1, l2, l3])
-                    # Check if not parallel !
-                    cp = np.cross(lnew, scale_matrix[:,0])
-                    if np.dot(cp,cp) > 1e-6:
-                        ql = np.dot(lnew, qpoint)
-                        # Check if integer and non zero !
-                        if np.abs(ql - np.round(ql)) < 1e-6:
-                            Rl = np.dot(lnew, rprimd)
-                            dnorm = np.sqrt(np.dot(Rl, Rl))
-                            if dnorm < (dmin-1e-6) and dnorm > 1e-6:
-                                found = True
-                                scale_matrix[:, 1] = lnew
-                                dmin = dnorm
-        if not found:
-            raise ValueError('max_supercell is not large enough for this q-point')
-
-        dmin = np.inf
-        found = False
-        for l1 in np.arange(-l[0], l[0]+1):
-            for l2 in np.arange(-l[1], l[1]+1):
-                for l3 in np.arange(-l[2], l[2]+1):
-                    lnew = np.array([l1, l2, l3])
-                    # Check if not parallel !
-                    cp = np.dot(np.cross(lnew, scale_matrix[:, 0]), scale_matrix[:, 1])
-                    if cp > 1e-6:
-                        # Should be positive as (R3 X R1).R2 > 0 for abinit !
-                        ql = np.dot(lnew, qpoint)
-                        # Check if integer and non zero !
-                        if np.abs(ql - np.round(ql)) < 1e-6:
-                            Rl = np.dot(lnew, rprimd)
-                            dnorm = np.sqrt(np.dot(Rl,Rl))
-                            if dnorm < (dmin-1e-6) and dnorm > 1e-6:
-                                found = True
-                                scale_matrix[:, 2] = lnew
-                                dmin = dnorm
-        if not found:
-            raise ValueError('max_supercell is not large enough for this q-point')
-
-        # Fortran 2 python!!!
-        return scale_matrix.T
+        # Candidate vectors are ordered as in the Fortran loops so that, in the case of
+        # vectors with the same length, the first one found by the Fortran code is selected.
+        lvecs = np.array(np.meshgrid(*[np.arange(-l[i], l[i] + 1) for i in range(3)], indexing="ij"))
+        lvecs = lvecs.reshape(3, -1).T
+        dnorms = np.sqrt(np.sum(np.dot(lvecs, self.lattice.matrix) ** 2, axis=1))
+        nonzero = dnorms > 1e-6
+
+        def find_shortest(mask):
+            """Index of the shortest vector in lvecs[mask]."""
+            if not np.any(mask):
+                raise ValueError('max_supercell is not large enough for this q-point')
+            dn = np.where(mask, dnorms, np.inf)
+            return np.argmax(dn < dn.min() + 1e-6)
+
+        scale_matrices = np.zeros((len(qpoints), 3, 3), dtype=np.int)
+        for iq, qpoint in enumerate(qpoints):
+            if np.allclose(qpoint, 0):
+                scale_matrices[iq] = np.eye(3, 3)
+                continue
+
+            # Check if integer and non zero !
+            ql = np.dot(lvecs, qpoint)
+            mask = (np.abs(ql - np.round(ql)) < 1e-6) & nonzero
+
+            v1 = lvecs[find_shortest(mask)]
+            # Check if not parallel !
+            cp = np.cross(lvecs, v1)
+            v2 = lvecs[find_shortest(mask & (np.sum(cp * cp, axis=1) > 1e-6))]
+            # Should be positive as (R3 X R1).R2 > 0 for abinit !
+            v3 = lvecs[find_shortest(mask & (np.dot(cp, v2) > 1e-6))]
+
+            scale_matrices[iq] = [v1, v2, v3]
+
+        return scale_matrices
 
     def get_trans_vect(self, scale_matrix):
         """
@@ -1866,7 +1920,7 @@ class Structure(pymatgen.Structure, NotebookWriter):
             Suggested value of shiftk.
         """
         # Find lattice type.
-        sym = SpacegroupAnalyzer(self, symprec=symprec, angle_tolerance=angle_tolerance)
+        sym = self.spget_analyzer(symprec=symprec, angle_tolerance=angle_tolerance)
         lattice_type, spg_symbol = sym.get_lattice_type(), sym.get_space_group_symbol()
 
         # Check if the cell is primitive
@@ -64,3 +64,41 @@ class TestGSphere(AbipyTest):
                 int_r = mesh.integrate(fr)
                 int_g = fg[...,0,0,0]
                 self.assert_almost_equal(int_r, int_g)
+
+    def test_tofftmesh(self):
+        """Scatter/gather between G-sphere and FFT mesh"""
+        lattice = np.eye(3)
+        mesh = Mesh3D((8, 9, 10), lattice)
+        r = range(-3, 4)
+        gvecs = np.array([(i, j, k) for i in r for j in r for k in r if i**2 + j**2 + k**2 <= 9])
+
+        gsphere = GSphere(2, lattice, [0, 0, 0], gvecs, istwfk=1)
+        ug = np.random.rand(2, len(gvecs)) + 1j * np.random.rand(2, len(gvecs))
+        ug_mesh = gsphere.tofftmesh(mesh, ug)
+        assert ug_mesh.shape == (2,) + mesh.shape
+        self.assert_equal(ug_mesh[1, -1, 2, -2], ug[1, gsphere.index([-1, 2, -2])])
+        assert np.count_nonzero(ug_mesh[0]) == len(gvecs)
+        self.assert_equal(gsphere.fromfftmesh(mesh, ug_mesh), ug)
+        assert gsphere.tofftmesh(mesh, ug[0]).shape == mesh.shape
+        self.assert_equal(gsphere.fromfftmesh(mesh, gsphere.tofftmesh(mesh, ug[0]).flatten()), ug[0])
+
+        with self.assertRaises(ValueError):
+            GSphere(2, lattice, [0, 0, 0], gvecs, istwfk=1).tofftmesh(Mesh3D((4, 4, 4), lattice), ug)
+
+        # istwfk 2: only half of the sphere is stored, u(-G) = u(G)^*
+        half = np.array([g for g in gvecs if (g[2] > 0 or (g[2] == 0 and g[1] > 0) or
+                                              (g[2] == 0 and g[1] == 0 and g[0] >= 0))])
+        uhalf = np.random.rand(len(half)) + 1j * np.random.rand(len(half))
+        i0 = np.where(np.all(half == 0, axis=1))[0][0]
+        uhalf[i0] = uhalf[i0].real
+        gsphere2 = GSphere(2, lattice, [0, 0, 0], half, istwfk=2)
+        ug_mesh = gsphere2.tofftmesh(mesh, uhalf)
+        assert np.count_nonzero(ug_mesh) == len(gvecs)
+        self.assert_almost_equal(ug_mesh[np.mod(-half[:, 0], 8), np.mod(-half[:, 1], 9), np.mod(-half[:, 2], 10)],
+                                 uhalf.conj())
+        # The function in real space is real.
+        assert np.abs(mesh.fft_g2r(ug_mesh).imag).max() < 1e-10
+        self.assert_equal(gsphere2.fromfftmesh(mesh, ug_mesh), uhalf)
+
+        with self.assertRaises(ValueError):
+            GSphere(2, lattice, [0.25, 0, 0], half, istwfk=2)
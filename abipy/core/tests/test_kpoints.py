@@ -11,7 +11,7 @@ from pymatgen.core.lattice import Lattice
 from abipy import abilab
 from abipy.core.kpoints import (wrap_to_ws, wrap_to_bz, issamek, Kpoint, KpointList, IrredZone, Kpath, KpointsReader,
     has_timrev_from_kptopt, KSamplingInfo, as_kpoints, rc_list, kmesh_from_mpdivs, map_grid2ibz,
-    set_atol_kdiff, set_spglib_tols)  #Ktables,
+    map_grid2ibz_symrec, map_kpoints, find_irred_kpoints_generic, KpointHashTable, set_atol_kdiff, set_spglib_tols)  #Ktables,
 from abipy.core.testing import AbipyTest
 
 
@@ -224,6 +224,18 @@ class TestKpointList(AbipyTest):
         assert len(add_klist) == 4
         assert add_klist == add_klist.remove_duplicated()
 
+        with self.assertRaises(ValueError):
+            klist.index([1/4, 0, 0])
+
+        # Test hash table.
+        table = KpointHashTable(klist.frac_coords)
+        assert len(table) == 3
+        assert table.find([1, 1, -1]) == 0 and table.find([1/2, -1/2, 3/2]) == 1
+        assert table.find([1/3 + 1e-10, 1/3, 1/3 - 1]) == 2
+        assert table.find([1/4, 0, 0]) == -1
+        table.add([[0, 0, 1 - 1e-12]])
+        assert table.find_all([0, 0, 0]) == [0, 3]
+
 
 class TestIrredZone(AbipyTest):
 
@@ -583,6 +595,32 @@ class TestKmappingTools(AbipyTest):
 
         assert not errors
 
+        # Low-level API with symmetry tables.
+        symrec = np.array([o.rot_g for o in abispg.fm_symmops])
+        tables = map_grid2ibz_symrec(symrec, self.kibz, self.ngkpt, self.has_timrev)
+        self.assert_equal(tables.bz2ibz, bz2ibz)
+        assert np.all(np.abs(tables.bz2ibz_tsign) == 1)
+        kibz = np.reshape(self.kibz, (-1, 3))
+        for ik_bz, kbz in enumerate(bz):
+            ik_ibz, isym = tables.bz2ibz[ik_bz], tables.bz2ibz_symm[ik_bz]
+            krot = tables.bz2ibz_tsign[ik_bz] * np.matmul(symrec[isym], kibz[ik_ibz])
+            assert issamek(krot, kbz)
+
+        with self.assertRaises(ValueError):
+            map_grid2ibz_symrec(symrec, kibz[:-1], self.ngkpt, self.has_timrev)
+
+        # Map the BZ onto the IBZ with map_kpoints.
+        rec_lattice = self.mgb2.reciprocal_lattice.matrix
+        o2r_map, nmissing = map_kpoints(bz, rec_lattice, rec_lattice, kibz, symrec, self.has_timrev)
+        assert nmissing == 0
+        for kbz, m in zip(bz[::7], o2r_map[::7]):
+            self.assert_almost_equal(m.tsign * np.matmul(symrec[m.isym], kibz[m.ik_ref]) + m.g0, kbz)
+
+        # Reduce the BZ with find_irred_kpoints_generic.
+        r = find_irred_kpoints_generic(self.mgb2, bz, verbose=0)
+        assert len(r.irred_map) == len(kibz)
+        assert r.irred_map[0] == 0
+
     #def test_with_from_structure_with_symrec(self):
     #    """Generate Ktables from a structure with Abinit symmetries."""
     #    self.mgb2 = self.get_abistructure.mgb2("mgb2_kpath_FATBANDS.nc")
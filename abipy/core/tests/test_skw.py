@@ -1,16 +1,38 @@
 """Tests for core.skw module"""
 from __future__ import print_function, division, unicode_literals
 
+import tempfile
 import numpy as np
 import abipy.data as abidata
 
 from abipy.core.testing import AbipyTest
-from abipy.core.skw import SkwInterpolator
+from abipy.core.skw import SkwInterpolator, star_labels
+from abipy.tools.diskcache import DiskCache
 
 
 class TestSkwInterpolator(AbipyTest):
     """Unit tests for SkwInterpolator."""
 
+    def test_star_labels(self):
+        """Testing star_labels."""
+        # C6 rotations + inversion in reduced coordinates (hexagonal lattice).
+        c6 = np.array([[1, -1, 0], [1, 0, 0], [0, 0, 1]])
+        symrel = [np.linalg.matrix_power(c6, i) for i in range(6)]
+        symrel = np.array(symrel + [-s for s in symrel])
+
+        rpts = np.array([[1, 0, 0], [0, 1, 0], [1, 1, 0], [-1, 0, 0], [0, 0, 1], [0, 0, -1], [2, -1, 3]])
+        labels = star_labels(rpts, symrel)
+        assert labels.shape == (len(rpts),)
+        assert labels[0] == labels[1] == labels[3]
+        assert labels[0] != labels[2]
+        assert labels[4] == labels[5]
+        # Labels follow the lexicographic order of the minimal rotated image.
+        for ir, rr in enumerate(rpts):
+            rmin = min(tuple(np.matmul(s, rr)) for s in symrel)
+            for jr, rj in enumerate(rpts):
+                jmin = min(tuple(np.matmul(s, rj)) for s in symrel)
+                assert (labels[ir] < labels[jr]) == (rmin < jmin)
+
     def test_silicon_interpolation(self):
         """Testing interpolation of Si band energies with SKW method."""
 
@@ -58,13 +80,52 @@ class TestSkwInterpolator(AbipyTest):
         assert res1.dedk.shape == (skw.nsppol, len(new_kcoords), skw.nband, 3)
         # Group velocities at Gamma should be zero by symmetry.
         self.assert_almost_equal(res1.dedk[0, 0], 0.0)
-        #assert 0
-        #res12 = skw.interp_kpts(new_kcoords, dk1=True, dk2=True)
-        #print(res12.dedk2)
+
+        # Batched star functions should reproduce the per-point implementation.
+        for ik, kpt in enumerate(new_kcoords):
+            self.assert_almost_equal(skw.eval_sk(0, kpt), res1.eigens[0, ik])
+            der1 = np.empty((skw.nband, 3))
+            skw.eval_sk(0, kpt, der1=der1)
+            self.assert_almost_equal(der1, res1.dedk[0, ik])
+        res_chunk = skw.interp_kpts(new_kcoords, dk1=True, kchunk=2)
+        self.assert_almost_equal(res_chunk.eigens, res1.eigens)
+        self.assert_almost_equal(res_chunk.dedk, res1.dedk)
+        skr, skr_dk1, skr_dk2 = skw.get_stark_kpts(new_kcoords, dk1=True, dk2=True)
+        self.assert_almost_equal(skr[2], skw.get_stark(new_kcoords[2]))
+        self.assert_almost_equal(skr_dk1[2], skw.get_stark_dk1(new_kcoords[2]))
+        self.assert_almost_equal(skr_dk2[2], skw.get_stark_dk2(new_kcoords[2]))
+
+        # Hessian matrices should be symmetric and consistent with finite differences of the gradient.
+        res12 = skw.interp_kpts(new_kcoords, dk1=True, dk2=True)
+        assert res12.dedk2.shape == (skw.nsppol, len(new_kcoords), skw.nband, 3, 3)
+        self.assert_almost_equal(res12.dedk, res1.dedk)
+        self.assert_almost_equal(res12.dedk2, np.swapaxes(res12.dedk2, -1, -2))
+        der2 = np.empty((skw.nband, 3, 3))
+        skw.eval_sk(0, new_kcoords[2], der2=der2)
+        self.assert_almost_equal(der2, res12.dedk2[0, 2])
+        hstep = 1e-4
+        for ii in range(3):
+            dk = np.zeros(3)
+            dk[ii] = hstep
+            dp = skw.interp_kpts(new_kcoords[2] + dk, dk1=True).dedk[0, 0]
+            dm = skw.interp_kpts(new_kcoords[2] - dk, dk1=True).dedk[0, 0]
+            self.assert_almost_equal((dp - dm) / (2 * np.pi * 2 * hstep), res12.dedk2[0, 2, :, :, ii], decimal=5)
+
+        # Effective masses at the band edges (Si: VBM at Gamma with degenerate bands).
+        emass = skw.get_effmass_tensors([0, 0, 0], bands=[skw.val_ib + 1])
+        assert emass.masses.shape == (1, 1, 3, 3) and emass.principal_masses.shape == (1, 1, 3)
+        self.assert_almost_equal(emass.masses[0, 0], np.linalg.inv(emass.inv_masses[0, 0]))
+        edges = skw.get_band_edges_effmass(kmesh, is_shift=is_shift)
+        assert np.all(edges.vbm.bands == [skw.val_ib]) and np.all(edges.cbm.bands == [skw.val_ib + 1])
+        assert edges.vbm.eigens[0, 0] < edges.cbm.eigens[0, 0]
 
         # Test interpolation routines (high-level API).
         edos = skw.get_edos(kmesh, is_shift=None, method="gaussian", step=0.1, width=0.2, wmesh=None)
         jdos = skw.get_jdos_q0(kmesh, is_shift=None, method="gaussian", step=0.1, width=0.2, wmesh=None)
+        tetra_edos = skw.get_edos(kmesh, is_shift=None, method="tetra", wmesh=edos.mesh)
+        self.assert_almost_equal(tetra_edos.integral[0, -1], skw.nband)
+        with self.assertRaises(ValueError):
+            skw.get_edos(kmesh, is_shift=[1, 1, 1], method="tetra")
         #nest = skw.get_nesting_at_e0(qpoints, kmesh, e0, width=0.2, is_shift=None)
 
         # Test pickle
@@ -72,6 +133,33 @@ class TestSkwInterpolator(AbipyTest):
         skw.pickle_dump(tmpname)
         new = SkwInterpolator.pickle_load(tmpname)
 
+        # Test disk cache: second object should be initialized from the cache without fitting.
+        cache = DiskCache(tempfile.mkdtemp(), maxsize_mb=10)
+        skw1 = SkwInterpolator(lpratio, kcoords, ebands.eigens, ebands.fermie, ebands.nelect, cell,
+                               fm_symrel, has_timrev, filter_params=None, verbose=1, cache=cache)
+        assert skw1.cache_key in cache and skw1.skr is not None
+        skw1._cache_eigens(kmesh, is_shift, k.ibz[:, :1], "ibz")
+        skw2 = SkwInterpolator(lpratio, kcoords, ebands.eigens, ebands.fermie, ebands.nelect, cell,
+                               fm_symrel, has_timrev, filter_params=None, verbose=1, cache=cache)
+        assert skw2.cache_key == skw1.cache_key and skw2.skr is None
+        assert skw2.nr == skw1.nr and skw2.mae == skw1.mae
+        self.assert_equal(skw2.rpts, skw1.rpts)
+        self.assert_almost_equal(skw2.interp_kpts(new_kcoords).eigens, new_eigens)
+        self.assert_equal(skw2._get_cached_eigens(kmesh, is_shift, "ibz"), k.ibz[:, :1])
+        skw3 = SkwInterpolator(lpratio, kcoords, ebands.eigens, ebands.fermie, ebands.nelect, cell,
+                               fm_symrel, has_timrev, filter_params=None, verbose=1, cache=False)
+        assert skw3.cache_key is None and skw3.disk_cache is None
+        assert not SkwInterpolator.use_disk_cache
+
+        # Failures while writing the cache should not break the computation.
+        class ReadOnlyCache(DiskCache):
+            def save_npz(self, key, basename, **arrays):
+                raise OSError("Read-only cache")
+
+        skw2.disk_cache = ReadOnlyCache(cache.dirpath, maxsize_mb=10)
+        skw2._cache_eigens([3, 3, 3], is_shift, k.ibz[:, :1], "ibz")
+        skw2._save_fit()
+
         # Test plotting API.
         if self.has_matplotlib():
             kmeshes = [[2, 2, 2], [4, 4, 4]]
@@ -285,6 +285,57 @@ xred       0.0000000000    0.0000000000    0.0000000000
         formulas = [struct.composition.reduced_formula for struct in dfs.structures]
         assert formulas == ["MgB2", "SiC", "AlAs"]
 
+    def test_spget_analyzer_cache(self):
+        """Testing cache of SpacegroupAnalyzer objects."""
+        from abipy.core.structure import clear_spga_cache
+        clear_spga_cache()
+        mgb2 = abidata.structure_from_ucell("MgB2")
+        spga = mgb2.spget_analyzer(symprec=1e-2, angle_tolerance=5.0)
+        assert mgb2.get_space_group_info() == (spga.get_space_group_symbol(), spga.get_space_group_number())
+        assert mgb2.get_dict4pandas()["spglib_num"] == 191
+
+        # Same structure (up to rounding) --> same object. Different tolerances --> new object.
+        other = mgb2.copy()
+        other.translate_sites(0, [1e-12, 0, 0])
+        assert other.spget_analyzer(symprec=1e-2, angle_tolerance=5.0) is spga
+        assert mgb2.spget_analyzer(symprec=1e-3, angle_tolerance=5.0) is not spga
+
+        # In-place modifications change the fingerprint.
+        other.perturb(0.1)
+        assert other.spget_analyzer(symprec=1e-2, angle_tolerance=5.0) is not spga
+
+        # LRU policy.
+        old_size = Structure.spga_cache_size
+        try:
+            Structure.spga_cache_size = 1
+            mgb2.spget_analyzer(symprec=1e-3, angle_tolerance=5.0)
+            assert mgb2.spget_analyzer(symprec=1e-2, angle_tolerance=5.0) is not spga
+            Structure.spga_cache_size = 0
+            assert mgb2.spget_analyzer() is not mgb2.spget_analyzer()
+        finally:
+            Structure.spga_cache_size = old_size
+            clear_spga_cache()
+
+    def test_get_smallest_supercells(self):
+        """Testing get_smallest_supercells."""
+        rprimd = np.array([[0.5, 0.5, 0], [0.5, 0, 0.5], [0, 0.5, 0.5]]) * 10.60 * 0.529
+        structure = Structure(Lattice(rprimd), ["Ga", "As"], [[0, 0, 0], [0.25, 0.25, 0.25]])
+        qpoints = [[0, 0, 0], [1/2, 1/2, 1/2], [1/2, 0, 0], [1/4, 1/4, 0], [1/3, 0, 1/3]]
+        mx_sc = [3, 3, 3]
+
+        scale_matrices = structure.get_smallest_supercells(qpoints, mx_sc)
+        assert scale_matrices.shape == (len(qpoints), 3, 3)
+        self.assert_equal(scale_matrices[0], np.eye(3))
+        for qpt, scale_matrix in zip(qpoints, scale_matrices):
+            self.assert_equal(structure.get_smallest_supercell(qpt, max_supercell=mx_sc), scale_matrix)
+            # Supercell vectors must be commensurate with q and (R3 X R1).R2 > 0
+            ql = np.dot(scale_matrix, qpt)
+            self.assert_almost_equal(ql, np.round(ql))
+            assert np.linalg.det(scale_matrix) > 0
+
+        with self.assertRaises(ValueError):
+            structure.get_smallest_supercells([[1/5, 0, 0]], [2, 2, 2])
+
     def test_frozen_phonon_methods(self):
         """Testing frozen phonon methods (This is not a real test, just to show how to use it!)"""
         rprimd = np.array([[0.5, 0.5, 0], [0.5, 0, 0.5], [0, 0.5, 0.5]])
@@ -0,0 +1,74 @@
+"""Tests for core.tetra module"""
+from __future__ import print_function, division, unicode_literals
+
+import itertools
+import numpy as np
+
+from abipy.core.testing import AbipyTest
+from abipy.core.tetra import Tetrahedra
+
+
+def _cubic_model(ngkpt):
+    """Two tight-binding bands on a simple cubic lattice and BZ --> IBZ table obtained with the Oh group."""
+    n = ngkpt[0]
+    grid = np.reshape(np.stack(np.meshgrid(*[np.arange(n)] * 3, indexing="ij"), axis=-1), (-1, 3))
+    rots = []
+    for perm in itertools.permutations(range(3)):
+        for signs in itertools.product([1, -1], repeat=3):
+            mat = np.zeros((3, 3), dtype=np.int)
+            for i, p in enumerate(perm): mat[i, p] = signs[i]
+            rots.append(mat)
+
+    def lin(g):
+        return ((g[..., 0] % n) * n + g[..., 1] % n) * n + g[..., 2] % n
+
+    canon = np.min([lin(np.matmul(grid, r.T)) for r in rots], axis=0)
+    uniq, bz2ibz = np.unique(canon, return_inverse=True)
+
+    kibz = grid[uniq] / n
+    cos = np.cos(2 * np.pi * kibz).sum(axis=1)
+    eigens = np.stack([-2 * cos, 1 - 0.5 * cos], axis=-1)
+    return bz2ibz, eigens, grid / n
+
+
+class TestTetrahedra(AbipyTest):
+
+    def test_cubic_model(self):
+        """Testing tetrahedron method with tight-binding bands on a cubic lattice."""
+        ngkpt = [12, 12, 12]
+        bz2ibz, eigens, kbz = _cubic_model(ngkpt)
+        tetra = Tetrahedra(np.eye(3), ngkpt, bz2ibz)
+        repr(tetra); str(tetra)
+        assert tetra.nibz == len(eigens)
+        self.assert_almost_equal(tetra.tetra_wtq.sum(), 1.0)
+
+        wmesh = np.linspace(-7, 7, 281)
+        dos, idos = tetra.get_dos_idos(eigens, wmesh)
+        assert dos.shape == idos.shape == wmesh.shape
+        self.assert_almost_equal(idos[0], 0.0)
+        self.assert_almost_equal(idos[-1], 2.0)
+        self.assert_almost_equal(np.trapz(dos, x=wmesh), 2.0, decimal=3)
+
+        # Results should not depend on the symmetry reduction.
+        full = Tetrahedra(np.eye(3), ngkpt, np.arange(len(bz2ibz)))
+        full_eigens = eigens[bz2ibz]
+        fdos, fidos = full.get_dos_idos(full_eigens, wmesh)
+        self.assert_almost_equal(fdos, dos)
+        self.assert_almost_equal(fidos, idos)
+
+        # Leading dimensions are preserved (e.g. spin).
+        dos2, _ = tetra.get_dos_idos(np.array([eigens, eigens + 1]), wmesh)
+        assert dos2.shape == (2, len(wmesh))
+        self.assert_almost_equal(dos2[0], dos)
+
+        # Integration weights should reproduce the DOS and the IDOS.
+        for blochl in (True, False):
+            r = tetra.get_dos(eigens, wmesh, with_weights=True, blochl=blochl)
+            assert r.dweights.shape == r.iweights.shape == (tetra.nibz, 2, len(wmesh))
+            self.assert_almost_equal(r.dweights.sum(axis=(0, 1)), dos)
+            self.assert_almost_equal(r.iweights.sum(axis=(0, 1)), idos)
+            self.assert_almost_equal(r.values, dos)
+            self.assert_almost_equal(r.integral, idos)
+
+        with self.assertRaises(ValueError):
+            tetra.get_dos_idos(eigens[:-1], wmesh)
@@ -0,0 +1,372 @@
+# coding: utf-8
+"""
+Linear tetrahedron method with Blöchl corrections :cite:`Blochl1994`.
+
+The tetrahedra are constructed from a Gamma-centered homogeneous mesh and the vertices
+are mapped to the IBZ with the BZ --> IBZ table produced by :func:`abipy.core.kpoints.map_grid2ibz`
+so that the same engine can be used for electron energies and phonon frequencies.
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import itertools
+import numpy as np
+
+from monty.collections import dict2namedtuple
+
+__all__ = [
+    "Tetrahedra",
+]
+
+
+class Tetrahedra(object):
+    """
+    Tetrahedra obtained by dividing each sub-cell of a Gamma-centered mesh into 6 tetrahedra
+    sharing the shortest main diagonal. Tetrahedra whose vertices map onto the same set
+    of IBZ points are merged and their weight is increased accordingly.
+
+    .. rubric:: Inheritance Diagram
+    .. inheritance-diagram:: Tetrahedra
+    """
+    # Max number of (tetrahedron, band, frequency) entries treated in a single block.
+    max_npairs = 2 ** 22
+
+    def __init__(self, reciprocal_matrix, ngkpt, bz2ibz):
+        """
+        Args:
+            reciprocal_matrix: [3, 3] array with the reciprocal lattice vectors along the rows.
+            ngkpt: Mesh divisions.
+            bz2ibz: 1d array with the BZ --> IBZ mapping for the points of the mesh in C-order
+                (same convention as :func:`abipy.core.kpoints.map_grid2ibz` with pbc=False).
+        """
+        self.ngkpt = np.array(ngkpt, dtype=np.int)
+        self.bz2ibz = np.asarray(bz2ibz, dtype=np.int).ravel()
+        nbz = self.ngkpt.prod()
+        if len(self.bz2ibz) != nbz:
+            raise ValueError("Expecting bz2ibz with %d entries but got %d" % (nbz, len(self.bz2ibz)))
+        self.nibz = self.bz2ibz.max() + 1
+
+        # Find the shortest main diagonal of the sub-cell.
+        dvecs = np.asarray(reciprocal_matrix, dtype=np.float) / self.ngkpt[:, None]
+        corners = np.array(list(itertools.product((0, 1), repeat=3)))
+        best = None
+        for start in corners[:4]:
+            end = 1 - start
+            length = np.linalg.norm(np.matmul(end - start, dvecs))
+            if best is None or length < best[0] - 1e-10:
+                best = (length, start, end - start)
+        _, start, signs = best
+
+        # The 6 tetrahedra go from start to the opposite corner changing one coordinate at a time.
+        shifts = []
+        for perm in itertools.permutations(range(3)):
+            verts = [start.copy()]
+            for idir in perm:
+                v = verts[-1].copy()
+                v[idir] += signs[idir]
+                verts.append(v)
+            shifts.append(verts)
+        shifts = np.array(shifts)  # [6, 4, 3]
+
+        # Grid points of all the sub-cells and indices of the vertices in the IBZ.
+        gp = np.reshape(np.stack(np.meshgrid(*[np.arange(n) for n in self.ngkpt], indexing="ij"), axis=-1), (-1, 3))
+        ivert = (gp[:, None, None, :] + shifts[None]) % self.ngkpt
+        ivert = np.reshape(ivert, (-1, 4, 3))
+        ivert = (ivert[..., 0] * self.ngkpt[1] + ivert[..., 1]) * self.ngkpt[2] + ivert[..., 2]
+        tetra_ibz = np.sort(self.bz2ibz[ivert], axis=1)
+
+        # Merge equivalent tetrahedra. Each one has volume 1 / (6 * nbz) in units of the BZ volume.
+        self.tetra_ibz, counts = np.unique(tetra_ibz, axis=0, return_counts=True)
+        self.tetra_wtq = counts / (6.0 * nbz)
+        self.ntetra = len(self.tetra_ibz)
+
+    @classmethod
+    def from_ibz(cls, structure, ibz, ngkpt, has_timrev):
+        """
+        Build the object from the |Structure| with Abinit symmetries and the
+        reduced coordinates of the k-points in the IBZ of the Gamma-centered ``ngkpt`` mesh.
+        """
+        from abipy.core.kpoints import map_grid2ibz
+        if hasattr(ibz, "frac_coords"): ibz = ibz.frac_coords
+        bz2ibz = map_grid2ibz(structure, ibz, ngkpt, has_timrev, pbc=False)
+        return cls(structure.reciprocal_lattice.matrix, ngkpt, bz2ibz)
+
+    @classmethod
+    def from_kpoints(cls, structure, kpoints, has_timrev):
+        """
+        Build the object from a |KpointList| with points in the IBZ of a Gamma-centered Monkhorst-Pack mesh.
+        Raise ValueError if the sampling is not compatible with the tetrahedron method.
+        """
+        errors = []
+        eapp = errors.append
+        if not kpoints.is_ibz:
+            eapp("Tetrahedron method requires an IBZ sampling but got %s" % type(kpoints))
+        elif not kpoints.is_mpmesh:
+            eapp("Tetrahedron method requires Monkhorst-Pack meshes.\nksampling: %s" % str(kpoints.ksampling))
+        else:
+            mpdivs, shifts = kpoints.mpdivs_shifts
+            if shifts is not None and not np.all(np.asarray(shifts) == 0.0):
+                eapp("Tetrahedron method requires Gamma-centered meshes but got shifts: %s" % str(shifts))
+        if errors:
+            raise ValueError("\n".join(errors))
+
+        return cls.from_ibz(structure, kpoints.frac_coords, mpdivs, has_timrev)
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, verbose=0):
+        """String representation."""
+        return "Tetrahedra: ngkpt: %s, nibz: %d, number of irreducible tetrahedra: %d" % (
+            str(self.ngkpt), self.nibz, self.ntetra)
+
+    def _get_items(self, eigens):
+        """
+        Energies at the vertices of the tetrahedra for all bands.
+
+        Return: (ene, iperm, wts, tetra, bands) where ene is a [ntetra * nband, 4] array with the sorted
+        energies, iperm gives the vertex associated to the sorted energies, wts the weight
+        of the tetrahedron and tetra, bands the index of the tetrahedron and of the band.
+        """
+        nband = eigens.shape[-1]
+        ene = np.reshape(np.swapaxes(eigens[self.tetra_ibz], 1, 2), (-1, 4))
+        iperm = np.argsort(ene, axis=1)
+        ene = ene[np.arange(len(ene))[:, None], iperm]
+        tetra = np.repeat(np.arange(self.ntetra), nband)
+        bands = np.tile(np.arange(nband), self.ntetra)
+        return ene, iperm, self.tetra_wtq[tetra], tetra, bands
+
+    def _iter_pairs(self, ene, wmesh):
+        """
+        Iterate over blocks of (item, mesh point) pairs with e1 <= w < e4.
+        Yield (items, iw) with the index of the item and of the mesh point for each pair.
+        """
+        i1 = np.searchsorted(wmesh, ene[:, 0], side="left")
+        i4 = np.searchsorted(wmesh, ene[:, 3], side="left")
+        counts = i4 - i1
+        nitems = len(ene)
+        cum = np.cumsum(counts)
+        start = 0
+        while start < nitems:
+            # Find the last item such that the number of pairs is below max_npairs.
+            base = cum[start - 1] if start > 0 else 0
+            stop = max(start + 1, np.searchsorted(cum, base + self.max_npairs, side="right"))
+            stop = min(stop, nitems)
+            c = counts[start:stop]
+            items = np.repeat(np.arange(start, stop), c)
+            offsets = np.repeat(np.cumsum(c) - c, c)
+            iw = i1[items] + np.arange(len(items)) - offsets
+            yield items, iw
+            start = stop
+
+    def get_dos_idos(self, eigens, wmesh):
+        """
+        Compute the DOS and the integrated DOS on the mesh ``wmesh``.
+
+        Args:
+            eigens: [..., nibz, nband] array with energies (frequencies) in the IBZ.
+            wmesh: Sorted array with the mesh points.
+
+        Return:
+            (dos, idos) arrays with shape [..., nw]. The DOS of each band is normalized to one.
+        """
+        eigens = np.asarray(eigens)
+        wmesh = np.asarray(wmesh)
+        lead_shape = eigens.shape[:-2]
+        eigens = np.reshape(eigens, (-1,) + eigens.shape[-2:])
+        self._check_eigens(eigens)
+        nw = len(wmesh)
+
+        dos = np.zeros((len(eigens), nw))
+        idos = np.zeros((len(eigens), nw))
+        for iset, eig in enumerate(eigens):
+            ene, _, wts, _, _ = self._get_items(eig)
+            # Points above e4 get the full weight of the tetrahedron.
+            i4 = np.searchsorted(wmesh, ene[:, 3], side="left")
+            idos[iset] = np.cumsum(np.bincount(i4, weights=wts, minlength=nw + 1)[:nw])
+            for items, iw in self._iter_pairs(ene, wmesh):
+                d, i = _tetra_dos_idos(ene[items], wmesh[iw])
+                dos[iset] += np.bincount(iw, weights=wts[items] * d, minlength=nw)
+                idos[iset] += np.bincount(iw, weights=wts[items] * i, minlength=nw)
+
+        return np.reshape(dos, lead_shape + (nw,)), np.reshape(idos, lead_shape + (nw,))
+
+    def get_weights(self, eigens, wmesh, blochl=True):
+        """
+        Compute the integration weights for each point in the IBZ, each band and each point of the mesh.
+
+        Args:
+            eigens: [nibz, nband] array with energies (frequencies) in the IBZ.
+            wmesh: Sorted array with the mesh points.
+            blochl: True if Blöchl corrections should be included.
+
+        Return:
+            (dweights, iweights) arrays of shape [nibz, nband, nw] with the weights for the DOS and the IDOS.
+            The weights include the multiplicity of the k-point so that sum(dweights, axis=(0, 1)) gives
+            the DOS and the integral of the DOS of each band is one.
+        """
+        eigens = np.asarray(eigens)
+        wmesh = np.asarray(wmesh)
+        self._check_eigens(eigens[None])
+        nband, nw = eigens.shape[-1], len(wmesh)
+        size = self.nibz * nband
+
+        ene, iperm, wts, tetra, bands = self._get_items(eigens)
+        # Index of the IBZ point associated to the sorted energies.
+        ivert = self.tetra_ibz[tetra[:, None], iperm]
+        ikb = ivert * nband + bands[:, None]
+
+        # Points above e4: each vertex gets 1/4 of the weight of the tetrahedron.
+        i4 = np.searchsorted(wmesh, ene[:, 3], side="left")
+        iweights = np.zeros(size * (nw + 1))
+        for iv in range(4):
+            iweights += np.bincount(ikb[:, iv] * (nw + 1) + i4, weights=0.25 * wts, minlength=size * (nw + 1))
+        iweights = np.cumsum(np.reshape(iweights, (size, nw + 1)), axis=1)[:, :nw].copy()
+        iweights = iweights.ravel()
+        dweights = np.zeros(size * nw)
+
+        for items, iw in self._iter_pairs(ene, wmesh):
+            dw, w = _tetra_vertex_weights(ene[items], wmesh[iw], blochl=blochl)
+            for iv in range(4):
+                index = ikb[items, iv] * nw + iw
+                dweights += np.bincount(index, weights=wts[items] * dw[:, iv], minlength=size * nw)
+                iweights += np.bincount(index, weights=wts[items] * w[:, iv], minlength=size * nw)
+
+        return np.reshape(dweights, (self.nibz, nband, nw)), np.reshape(iweights, (self.nibz, nband, nw))
+
+    def get_dos(self, eigens, wmesh, with_weights=False, blochl=True):
+        """
+        High-level interface that computes DOS, IDOS and, optionally, the integration weights.
+
+        Args:
+            eigens: [nsppol, nibz, nband] or [nibz, nband] array with energies (frequencies) in the IBZ.
+            wmesh: Sorted array with the mesh points.
+            with_weights: True if integration weights should be computed.
+            blochl: True if Blöchl corrections should be included in the weights.
+
+        Return: namedtuple with mesh, values[..., nw], integral[..., nw] and
+            dweights, iweights ([..., nibz, nband, nw] arrays, None if not with_weights).
+        """
+        eigens = np.asarray(eigens)
+        values, integral = self.get_dos_idos(eigens, wmesh)
+        dweights, iweights = None, None
+        if with_weights:
+            eig3 = np.reshape(eigens, (-1,) + eigens.shape[-2:])
+            ws = [self.get_weights(e, wmesh, blochl=blochl) for e in eig3]
+            shape = eigens.shape + (len(wmesh),)
+            dweights = np.reshape([w[0] for w in ws], shape)
+            iweights = np.reshape([w[1] for w in ws], shape)
+
+        return dict2namedtuple(mesh=np.asarray(wmesh), values=values, integral=integral,
+                               dweights=dweights, iweights=iweights)
+
+    def _check_eigens(self, eigens):
+        if eigens.shape[-2] != self.nibz:
+            raise ValueError("Expecting %d points in the IBZ but got array of shape %s" % (self.nibz, eigens.shape))
+
+
+def _tetra_dos_idos(ene, w):
+    """
+    DOS and IDOS of single tetrahedra with sorted energies ``ene[n, 4]`` at the points ``w[n]``.
+    Assumes e1 <= w < e4. Normalized so that the IDOS is one above e4.
+    """
+    e1, e2, e3, e4 = ene.T
+    dos = np.empty(len(w))
+    idos = np.empty(len(w))
+
+    # e1 <= w < e2
+    m = w < e2
+    x = w[m] - e1[m]
+    den = (e2 - e1)[m] * (e3 - e1)[m] * (e4 - e1)[m]
+    dos[m] = 3 * x ** 2 / den
+    idos[m] = x ** 3 / den
+
+    # e2 <= w < e3
+    m = (w >= e2) & (w < e3)
+    x = w[m] - e2[m]
+    e21, e31, e41 = (e2 - e1)[m], (e3 - e1)[m], (e4 - e1)[m]
+    e32, e42 = (e3 - e2)[m], (e4 - e2)[m]
+    fact = (e31 + e42) / (e32 * e42)
+    dos[m] = (3 * e21 + 6 * x - 3 * fact * x ** 2) / (e31 * e41)
+    idos[m] = (e21 ** 2 + 3 * e21 * x + 3 * x ** 2 - fact * x ** 3) / (e31 * e41)
+
+    # e3 <= w < e4
+    m = w >= e3
+    y = e4[m] - w[m]
+    den = (e4 - e1)[m] * (e4 - e2)[m] * (e4 - e3)[m]
+    dos[m] = 3 * y ** 2 / den
+    idos[m] = 1 - y ** 3 / den
+
+    return dos, idos
+
+
+def _tetra_vertex_weights(ene, w, blochl=True):
+    """
+    Integration weights for the 4 vertices of single tetrahedra with sorted energies ``ene[n, 4]``
+    at the points ``w[n]``. Assumes e1 <= w < e4.
+
+    Return: (dw, iw) arrays of shape [n, 4] with the weights for the DOS and the IDOS.
+    """
+    e1, e2, e3, e4 = ene.T
+    n = len(w)
+    dw = np.empty((n, 4))
+    iw = np.empty((n, 4))
+    # DOS of the tetrahedron and its derivative (used for Blöchl corrections).
+    dos = np.empty(n)
+    ddos = np.empty(n)
+
+    # e1 <= w < e2
+    m = w < e2
+    x = w[m] - e1[m]
+    e21, e31, e41 = (e2 - e1)[m], (e3 - e1)[m], (e4 - e1)[m]
+    den = e21 * e31 * e41
+    dos[m] = 3 * x ** 2 / den
+    ddos[m] = 6 * x / den
+    for iv, eij in zip((1, 2, 3), (e21, e31, e41)):
+        iw[m, iv] = x ** 4 / (4 * den * eij)
+        dw[m, iv] = x ** 3 / (den * eij)
+    iw[m, 0] = x ** 3 / den - iw[m, 1:].sum(axis=1)
+    dw[m, 0] = dos[m] - dw[m, 1:].sum(axis=1)
+
+    # e2 <= w < e3
+    m = (w >= e2) & (w < e3)
+    x1, x2 = w[m] - e1[m], w[m] - e2[m]
+    y3, y4 = e3[m] - w[m], e4[m] - w[m]
+    e21, e31, e41 = (e2 - e1)[m], (e3 - e1)[m], (e4 - e1)[m]
+    e32, e42 = (e3 - e2)[m], (e4 - e2)[m]
+    d1, d2, d3 = 4 * e41 * e31, 4 * e41 * e32 * e31, 4 * e42 * e32 * e41
+    c1, c2, c3 = x1 ** 2 / d1, x1 * x2 * y3 / d2, x2 ** 2 * y4 / d3
+    dc1, dc2, dc3 = 2 * x1 / d1, (x2 * y3 + x1 * y3 - x1 * x2) / d2, (2 * x2 * y4 - x2 ** 2) / d3
+    c12, c23, c123 = c1 + c2, c2 + c3, c1 + c2 + c3
+    dc12, dc23, dc123 = dc1 + dc2, dc2 + dc3, dc1 + dc2 + dc3
+    iw[m, 0] = c1 + c12 * y3 / e31 + c123 * y4 / e41
+    dw[m, 0] = dc1 + (dc12 * y3 - c12) / e31 + (dc123 * y4 - c123) / e41
+    iw[m, 1] = c123 + c23 * y3 / e32 + c3 * y4 / e42
+    dw[m, 1] = dc123 + (dc23 * y3 - c23) / e32 + (dc3 * y4 - c3) / e42
+    iw[m, 2] = c12 * x1 / e31 + c23 * x2 / e32
+    dw[m, 2] = (dc12 * x1 + c12) / e31 + (dc23 * x2 + c23) / e32
+    iw[m, 3] = c123 * x1 / e41 + c3 * x2 / e42
+    dw[m, 3] = (dc123 * x1 + c123) / e41 + (dc3 * x2 + c3) / e42
+    fact = (e31 + e42) / (e32 * e42)
+    dos[m] = (3 * e21 + 6 * x2 - 3 * fact * x2 ** 2) / (e31 * e41)
+    ddos[m] = (6 - 6 * fact * x2) / (e31 * e41)
+
+    # e3 <= w < e4
+    m = w >= e3
+    y = e4[m] - w[m]
+    e41, e42, e43 = (e4 - e1)[m], (e4 - e2)[m], (e4 - e3)[m]
+    den = e41 * e42 * e43
+    dos[m] = 3 * y ** 2 / den
+    ddos[m] = -6 * y / den
+    for iv, eij in zip((0, 1, 2), (e41, e42, e43)):
+        iw[m, iv] = 0.25 - y ** 4 / (4 * den * eij)
+        dw[m, iv] = y ** 3 / (den * eij)
+    iw[m, 3] = 1 - y ** 3 / den - iw[m, :3].sum(axis=1)
+    dw[m, 3] = dos[m] - dw[m, :3].sum(axis=1)
+
+    if blochl:
+        # Blöchl correction: D_T(w) / 40 * sum_j (e_j - e_i). Does not change the sum over vertices.
+        corr = ene.sum(axis=1)[:, None] - 4 * ene
+        iw += dos[:, None] * corr / 40
+        dw += ddos[:, None] * corr / 40
+
+    return dw, iw
@@ -4,8 +4,13 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 
 import sys
 import os
+import time
+import shutil
+import signal
 import tempfile
 import itertools
+import threading
+import subprocess
 import numpy as np
 import pandas as pd
 import abipy.core.abinit_units as abu
@@ -16,21 +21,24 @@ from monty.string import marquee, list_strings
 from monty.collections import AttrDict, dict2namedtuple, tree
 from monty.functools import lazy_property
 from monty.termcolor import cprint
-from monty.dev import deprecated
+from monty.dev import deprecated, get_ncpus
 from pymatgen.core.units import eV_to_Ha, bohr_to_angstrom, ang_to_bohr, Energy
 from abipy.flowtk import NetcdfReader, AnaddbTask
 from abipy.core.mixins import TextFile, Has_Structure, NotebookWriter
 from abipy.core.symmetries import AbinitSpaceGroup
 from abipy.core.structure import Structure
-from abipy.core.kpoints import KpointList, Kpoint
+from abipy.core.kpoints import KpointList, Kpoint, KpointHashTable
 from abipy.iotools import ETSF_Reader
 from abipy.tools.numtools import data_from_cplx_mode
 from abipy.abio.inputs import AnaddbInput
-from abipy.dfpt.phonons import PhononDosPlotter, PhononBandsPlotter, InteratomicForceConstants
+from abipy.dfpt.phonons import (PhononBands, PhononDosPlotter, PhononBandsPlotter, InteratomicForceConstants,
+    PhbstFile, PhdosFile)
 from abipy.dfpt.elastic import ElasticData
+from abipy.dfpt.ifcinterp import IfcInterpolator, get_ddb_dynmats, impose_asr, diagonalize_dynmat
 from abipy.core.abinit_units import phfactor_ev2units, phunit_tag
 from abipy.tools.plotting import Marker, add_fig_kwargs, get_ax_fig_plt, set_axlims
 from abipy.tools import duck
+from abipy.tools.diskcache import DiskCache, get_cache_dir, hash_objects, hash_file
 from abipy.tools.tensors import DielectricTensor, ZstarTensor, Stress
 from abipy.abio.robots import Robot
 
@@ -39,6 +47,9 @@ try:
 except ImportError:  # py2k
     from abipy.tools.functools_lru_cache import lru_cache
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 class DdbError(Exception):
     """Error class raised by DDB."""
@@ -58,14 +69,243 @@ class AnaddbError(DdbError):
     def __str__(self):
         lines = ["\nworkdir = %s" % self.task.workdir]
         app = lines.append
+        if self.args: app(str(self.args[0]))
 
-        if self.report.errors:
+        if self.report is not None and self.report.errors:
             app("Found %d errors" % len(self.report.errors))
             lines += [str(err) for err in self.report.errors]
 
         return "\n".join(lines)
 
 
+# Thread-local options used by DdbFile._run_anaddb_task (set by AnaddbTaskPool in the worker threads).
+_ANADDB_LOCAL = threading.local()
+
+
+def _get_descendant_pids(pid):
+    """Return list with the pids of all the descendants of process ``pid`` (uses ``ps``)."""
+    out = subprocess.check_output(["ps", "-A", "-o", "pid=,ppid="])
+    children = {}
+    for line in out.decode("utf-8").splitlines():
+        tokens = line.split()
+        if len(tokens) != 2: continue
+        children.setdefault(int(tokens[1]), []).append(int(tokens[0]))
+
+    pids, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            pids.append(child)
+            stack.append(child)
+    return pids
+
+
+def _kill_process_tree(pid):
+    """
+    Kill process ``pid`` and all its descendants with SIGKILL.
+    Needed for jobs executed via the shell since killing the bash process does not kill its children
+    (e.g. anaddb or mpirun). The processes are stopped first so that no new child can be spawned
+    while the tree is built.
+    """
+    pids = [pid]
+    for i in range(2):
+        try:
+            pids = [pid] + _get_descendant_pids(pid)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            logger.warning("Cannot get the children of process %s:\n%s" % (pid, str(exc)))
+        for p in pids:
+            try:
+                os.kill(p, signal.SIGSTOP)
+            except OSError:
+                pass
+
+    for p in pids:
+        try:
+            os.kill(p, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class AnaddbTaskPool(object):
+    """
+    Bounded pool of threads used to run anaddb in parallel.
+
+    Each job is a function that calls one of the ``anaget`` methods of |DdbFile|.
+    anaddb is executed in a separated process with its own temporary working directory
+    so that the threads only wait for the processes and read the results.
+    Results are returned in the same order as the input items.
+
+    .. rubric:: Example
+
+        pool = AnaddbTaskPool(num_workers=4, timeout=600)
+        phbands_list = pool.map(lambda ddb: ddb.anaget_phmodes_at_qpoint(qpoint=(0, 0, 0)), ddb_list)
+    """
+
+    def __init__(self, num_workers=None, mpi_procs=1, timeout=None):
+        """
+        Args:
+            num_workers: Max number of anaddb processes running at the same time.
+                None to use all the CPUs available (divided by ``mpi_procs``).
+            mpi_procs: Number of MPI processes used by each anaddb run.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
+                The shell script and all its child processes (anaddb, mpirun) are killed
+                and |AnaddbError| is raised if the limit is exceeded.
+        """
+        if num_workers is None:
+            num_workers = get_ncpus() // max(mpi_procs, 1)
+        self.num_workers = max(int(num_workers), 1)
+        self.timeout = timeout
+
+    def map(self, func, items):
+        """
+        Apply ``func`` to the list of ``items``. Return list with the results.
+        If some jobs raise, the exception of the first failed job is raised
+        once all the other jobs are completed.
+        """
+        items = list(items)
+        results, errors = [None] * len(items), [None] * len(items)
+
+        try:
+            from Queue import Queue, Empty # py2k
+        except ImportError:
+            from queue import Queue, Empty # py3k
+
+        q = Queue()
+        for i, item in enumerate(items):
+            q.put((i, item))
+
+        def worker():
+            _ANADDB_LOCAL.timeout = self.timeout
+            try:
+                while True:
+                    try:
+                        i, item = q.get_nowait()
+                    except Empty:
+                        return
+                    try:
+                        results[i] = func(item)
+                    except Exception as exc:
+                        errors[i] = exc
+            finally:
+                _ANADDB_LOCAL.timeout = None
+
+        num_workers = min(self.num_workers, len(items))
+        if num_workers <= 1:
+            # Sequential version.
+            worker()
+        else:
+            threads = [threading.Thread(target=worker) for i in range(num_workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+
+        for exc in errors:
+            if exc is not None: raise exc
+
+        return results
+
+
+_ANADDB_CACHE = None
+
+
+def get_anaddb_cache():
+    """
+    Return the default |DiskCache| used to store the netcdf files produced by anaddb.
+    Entries are stored in the ``anaddb`` subdirectory of :func:`abipy.tools.diskcache.get_cache_dir`.
+    """
+    global _ANADDB_CACHE
+    if _ANADDB_CACHE is None:
+        _ANADDB_CACHE = DiskCache(get_cache_dir("anaddb"), maxsize_mb=DdbFile.anaddb_cache_maxsize_mb)
+    return _ANADDB_CACHE
+
+
+class CachedAnaddbRun(object):
+    """
+    Results of a previous anaddb run restored from the cache. Provides the subset of the
+    AnaddbTask API used by |DdbFile| to read the results (workdir, open_phbst, open_phdos).
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+
+    def __repr__(self):
+        return "<%s, workdir=%s>" % (self.__class__.__name__, self.workdir)
+
+    def open_phbst(self):
+        """Open the PHBST file and return |PhbstFile| object."""
+        return PhbstFile(os.path.join(self.workdir, "run.abo_PHBST.nc"))
+
+    def open_phdos(self):
+        """Open the PHDOS file and return |PhdosFile| object."""
+        return PhdosFile(os.path.join(self.workdir, "run.abo_PHDOS.nc"))
+
+
+class DdbBlock(dict):
+    """
+    Block of a DDB file. Dictionary with the following keys:
+
+        "qpt": reduced coordinates of the q-point (None if not present).
+        "dord": order of the derivative.
+        "data": list of strings with the lines of the block.
+
+    Only the byte offsets of the block are stored when the DDB file is indexed.
+    The lines are read from file when "data" is accessed for the first time
+    and :meth:`get_values` parses the entries into a |numpy-array|.
+    """
+
+    # Number of header lines in the block for each derivative order.
+    _DORD2NHEAD = {0: 1, 1: 1, 2: 2, 3: 4}
+
+    def __init__(self, filepath, start, stop, dord, qpt, nelements, values=None):
+        """
+        Args:
+            filepath: Path of the DDB file.
+            start, stop: Byte offsets of the block in the file.
+            dord: Order of the derivative.
+            qpt: Reduced coordinates of the q-point (list) or None.
+            nelements: Number of elements declared in the header of the block.
+            values: Entries of the block already parsed (e.g. from the sidecar cache). None to parse on demand.
+        """
+        super(DdbBlock, self).__init__(qpt=qpt, dord=dord)
+        self.filepath, self.start, self.stop, self.nelements = filepath, start, stop, nelements
+        self._values = values
+
+    def __missing__(self, key):
+        if key != "data": raise KeyError(key)
+        data = self._read_lines()
+        dict.__setitem__(self, "data", data)
+        return data
+
+    def __setitem__(self, key, value):
+        if key == "data": self._values = None
+        super(DdbBlock, self).__setitem__(key, value)
+
+    def _read_lines(self):
+        """Read the lines of the block from file."""
+        with open(self.filepath, "rb") as fh:
+            fh.seek(self.start)
+            text = fh.read(self.stop - self.start).decode("utf-8")
+
+        # Don't use lstrip because we may reuse the lines to write new DDB.
+        return [l.rstrip() for l in text.splitlines() if l and not l.isspace()]
+
+    def get_values(self):
+        """
+        Parse the entries of the block. Return [nelements, 2 * dord + 2] |numpy-array|.
+        Each row contains the (idir, ipert) indices (Fortran convention) followed by the real
+        and the imaginary part of the derivative. The array is computed only once.
+        """
+        if self._values is None:
+            dord = self["dord"]
+            lines = self["data"] if "data" in self else self._read_lines()
+            lines = lines[self._DORD2NHEAD[dord]:]
+            values = np.array(" ".join(lines).replace("D", "E").split(), dtype=np.float)
+            self._values = np.reshape(values, (-1, 2 * dord + 2))
+
+        return self._values
+
+
 class DdbFile(TextFile, Has_Structure, NotebookWriter):
     """
     This object provides an interface to the DDB_ file produced by ABINIT
@@ -88,10 +328,25 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
     Error = DdbError
     AnaddbError = AnaddbError
 
+    # True if the header and the blocks should be read from/written to the sidecar cache.
+    # Can be changed globally e.g. before building a |DdbRobot| with many DDB files.
+    use_sidecar_cache = False
+
+    # Version of the format used in the sidecar cache. Increase it if the format changes.
+    _SIDECAR_VERSION = 1
+
+    # True if the netcdf files produced by anaddb should be stored in the cache returned by get_anaddb_cache.
+    # anaddb is not executed if the same DDB file and the same AnaddbInput have been already processed.
+    use_anaddb_cache = False
+    anaddb_cache_maxsize_mb = 2048
+
+    # Version of the entries in the anaddb cache. Increase it to invalidate the results of previous versions.
+    _ANADDB_CACHE_VERSION = 1
+
     @classmethod
-    def from_file(cls, filepath):
+    def from_file(cls, filepath, cache=None):
         """Needed for the :class:`TextFile` abstract interface."""
-        return cls(filepath)
+        return cls(filepath, cache=cache)
 
     @classmethod
     def from_mpid(cls, material_id, api_key=None, endpoint=None):
@@ -126,10 +381,23 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         """
         return obj if isinstance(obj, cls) else cls.from_file(obj)
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, cache=None):
+        """
+        Args:
+            filepath: Path of the DDB file.
+            cache: True if the header and the blocks should be read from the sidecar cache
+                (created if not present or out of date). None to use the class attribute ``use_sidecar_cache``.
+        """
         super(DdbFile, self).__init__(filepath)
+        cache = self.use_sidecar_cache if cache is None else cache
 
-        self._header = self._parse_header()
+        data = self._read_sidecar() if cache else None
+        if data is not None:
+            self._header = data.header
+            # Bypass the lazy_property so that the text file is not indexed.
+            self.__dict__["blocks"] = data.blocks
+        else:
+            self._header = self._parse_header()
 
         self._structure = Structure.from_abivars(**self.header)
         # Add AbinitSpacegroup (needed in guessed_ngkpt)
@@ -144,6 +412,12 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         frac_coords = self._read_qpoints()
         self._qpoints = KpointList(self.structure.lattice.reciprocal_lattice, frac_coords, weights=None, names=None)
 
+        if cache and data is None:
+            try:
+                self.write_sidecar()
+            except (IOError, OSError) as exc:
+                logger.warning("Cannot write sidecar cache for %s:\n%s" % (self.filepath, str(exc)))
+
     def __str__(self):
         """String representation."""
         return self.to_string()
@@ -319,27 +593,115 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
 
     def _read_qpoints(self):
         """Read the list q-points from the DDB file. Returns |numpy-array|."""
-        # 2nd derivatives (non-stat.)  - # elements :      36
-        # qpt  2.50000000E-01  0.00000000E+00  0.00000000E+00   1.0
-
-        # Since there are multiple occurrences of qpt in the DDB file
+        # Since there are multiple occurrences of the same q-point in the DDB file
         # we use seen to remove duplicates.
-        self.seek(0)
-        tokens, seen = [], set()
+        qpoints, seen = [], set()
+        for block in self.blocks:
+            qpt = block["qpt"]
+            if qpt is None or tuple(qpt) in seen: continue
+            seen.add(tuple(qpt))
+            qpoints.append(qpt)
 
-        for line in self:
-            line = line.strip()
-            if line.startswith("qpt") and line not in seen:
-                seen.add(line)
-                tokens.append(line.replace("qpt", ""))
+        return np.reshape(qpoints, (-1, 3))
+
+    @property
+    def sidecar_path(self):
+        """
+        Path of the sidecar cache (npz format) associated to the DDB file.
+        The file is hidden and located in the same directory as the DDB.
+        """
+        dirname, basename = os.path.split(os.path.abspath(self.filepath))
+        return os.path.join(dirname, "." + basename + ".abipy.npz")
 
-        qpoints, weights = [], []
-        for tok in tokens:
-            nums = list(map(float, tok.split()))
-            qpoints.append(nums[:3])
-            weights.append(nums[3])
+    def write_sidecar(self, path=None):
+        """
+        Write the header, the index and the parsed entries of the blocks to the sidecar cache.
+        The size and the modification time of the DDB file are stored as well
+        and used to invalidate the cache when the DDB file changes.
 
-        return np.reshape(qpoints, (-1, 3))
+        Args:
+            path: Path of the npz file. None to use :attr:`sidecar_path`.
+
+        Return: path of the npz file.
+        """
+        path = self.sidecar_path if path is None else path
+        stat = os.stat(self.filepath)
+
+        arrays = OrderedDict()
+        arrays["sidecar_version"] = np.array(self._SIDECAR_VERSION)
+        arrays["ddb_size"] = np.array(stat.st_size)
+        arrays["ddb_mtime"] = np.array(stat.st_mtime)
+
+        # Header: values are stored in separated arrays, kinds are used to restore the python type.
+        keys, kinds = [], []
+        for key, value in self.header.items():
+            if key == "lines":
+                arrays["header_lines"] = np.array(value, dtype=np.unicode_)
+                continue
+            kind = "array" if isinstance(value, np.ndarray) else ("list" if isinstance(value, list) else "scalar")
+            keys.append(key)
+            kinds.append(kind)
+            arrays["h_" + key] = np.array(value)
+        arrays["header_keys"] = np.array(keys, dtype=np.unicode_)
+        arrays["header_kinds"] = np.array(kinds, dtype=np.unicode_)
+
+        # Blocks: index and entries concatenated in a single array.
+        blocks = self.blocks
+        values = [b.get_values().ravel() for b in blocks]
+        arrays["block_dord"] = np.array([b["dord"] for b in blocks], dtype=np.int)
+        arrays["block_qpt"] = np.reshape([b["qpt"] if b["qpt"] is not None else 3 * [np.nan]
+                                          for b in blocks], (-1, 3))
+        arrays["block_nelements"] = np.array([b.nelements for b in blocks], dtype=np.int)
+        arrays["block_start"] = np.array([b.start for b in blocks], dtype=np.int64)
+        arrays["block_stop"] = np.array([b.stop for b in blocks], dtype=np.int64)
+        arrays["block_vstart"] = np.cumsum([0] + [len(v) for v in values]).astype(np.int64)
+        arrays["block_values"] = np.concatenate(values) if values else np.empty(0)
+
+        # Write to temporary file and rename so that other processes never read partial files.
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp_", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                np.savez_compressed(fh, **arrays)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+        return path
+
+    def _read_sidecar(self, path=None):
+        """
+        Read the header and the blocks from the sidecar cache.
+        Return None if the cache does not exist or is not consistent with the DDB file.
+        """
+        path = self.sidecar_path if path is None else path
+        if not os.path.exists(path): return None
+
+        try:
+            stat = os.stat(self.filepath)
+            with np.load(path, allow_pickle=False) as data:
+                if (int(data["sidecar_version"]) != self._SIDECAR_VERSION or
+                    int(data["ddb_size"]) != stat.st_size or float(data["ddb_mtime"]) != stat.st_mtime):
+                    return None
+
+                h = AttrDict(lines=data["header_lines"].tolist())
+                for key, kind in zip(data["header_keys"].tolist(), data["header_kinds"].tolist()):
+                    value = data["h_" + key]
+                    h[key] = dict(array=lambda v: v, list=lambda v: v.tolist(), scalar=lambda v: v.item())[kind](value)
+
+                blocks = []
+                vstart, values = data["block_vstart"], data["block_values"]
+                for i, (dord, qpt) in enumerate(zip(data["block_dord"].tolist(), data["block_qpt"])):
+                    qpt = None if np.any(np.isnan(qpt)) else qpt.tolist()
+                    vals = np.reshape(values[vstart[i]:vstart[i+1]], (-1, 2 * dord + 2))
+                    blocks.append(DdbBlock(self.filepath, int(data["block_start"][i]), int(data["block_stop"][i]),
+                                           dord, qpt, int(data["block_nelements"][i]), values=vals))
+
+        except Exception as exc:
+            logger.warning("Ignoring sidecar cache %s:\n%s" % (path, str(exc)))
+            return None
+
+        return dict2namedtuple(header=h, blocks=blocks)
 
     @lazy_property
     def computed_dynmat(self):
@@ -358,102 +720,109 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         dynmat = OrderedDict()
         for block in self.blocks:
             # skip the blocks that are not related to second order derivatives
-            first_line = block["data"][0].strip()
-            if not first_line.startswith("2nd derivatives"):
-                continue
+            if block["dord"] != 2: continue
 
             # Build q-point object.
             qpt = Kpoint(frac_coords=block["qpt"], lattice=self.structure.reciprocal_lattice, weight=None, name=None)
 
             # Build pandas dataframe with df_columns and (idir1, ipert1, idir2, ipert2) as index.
-            # Each line in data represents an element of the dynamical matric
+            # Each row in values represents an element of the dynamical matric
             # idir1 ipert1 idir2 ipert2 re_D im_D
-            df_rows, df_index = [], []
-            for line in block["data"]:
-                line = line.strip()
-                if line.startswith("2nd derivatives") or line.startswith("qpt"):
-                    continue
-                try:
-                    toks = line.split()
-                    idir1, ipert1 = p1 = (int(toks[0]), int(toks[1]))
-                    idir2, ipert2 = p2 = (int(toks[2]), int(toks[3]))
-                    toks[4] = toks[4].replace("D", "E")
-                    toks[5] = toks[5].replace("D", "E")
-                    cvalue = float(toks[4]) + 1j*float(toks[5])
-                except Exception as exc:
-                    cprint("exception while parsing line: %s" % line, "red")
-                    raise exc
-
-                df_index.append(p1 + p2)
-                df_rows.append(dict(idir1=idir1, ipert1=ipert1, idir2=idir2, ipert2=ipert2, cvalue=cvalue))
+            try:
+                values = block.get_values()
+            except Exception as exc:
+                cprint("exception while parsing block at offset: %s" % block.start, "red")
+                raise exc
 
-            dynmat[qpt] = pd.DataFrame(df_rows, index=df_index, columns=df_columns)
+            perts = np.array(values[:, :4], dtype=np.int)
+            df_index = [tuple(p) for p in perts.tolist()]
+            dynmat[qpt] = pd.DataFrame(OrderedDict([
+                ("idir1", perts[:, 0]), ("ipert1", perts[:, 1]), ("idir2", perts[:, 2]), ("ipert2", perts[:, 3]),
+                ("cvalue", values[:, 4] + 1j * values[:, 5])]), index=df_index, columns=df_columns)
 
         return dynmat
 
     @lazy_property
     def blocks(self):
         """
-        DDB blocks. List of dictionaries, Each dictionary contains the following keys.
+        DDB blocks. List of :class:`DdbBlock` dictionaries, Each dictionary contains the following keys.
         "qpt" with the reduced coordinates of the q-point.
+        "dord" with the order of the derivative.
         "data" that is a list of strings with the entries of the dynamical matrix for this q-point.
+        The lines are read from file only when "data" is accessed.
         """
         return self._read_blocks()
 
     def _read_blocks(self):
-        # skip until the beginning of the db
-        self.seek(0)
-        while "Number of data blocks" not in self._file.readline():
-            pass
-
+        """
+        Index the database section of the DDB file in a single pass.
+        Only the byte offsets, the q-point, the order and the number of elements of each block
+        are stored so that big DDB files can be opened without loading all the data in memory.
+        Return: list of :class:`DdbBlock`.
+        """
         blocks = []
-        block_lines = []
-        qpt = None
-        dord = None
+        block = None
+        order2dord = {"Total energy": 0, "1st derivatives": 1, "2nd derivatives": 2, "3rd derivatives": 3}
+
+        with open(self.filepath, "rb") as fh:
+            # skip until the beginning of the db
+            offset = 0
+            while True:
+                line = fh.readline()
+                if not line:
+                    raise self.Error("Cannot find `Number of data blocks` in %s" % self.filepath)
+                offset += len(line)
+                if b"Number of data blocks" in line: break
+
+            # Use readline instead of iterating over fh to have the correct offsets in py2.
+            while True:
+                line = fh.readline()
+                if not line: break
+                pos = offset
+                offset += len(line)
+                # skip empty lines
+                if line.isspace(): continue
+
+                if b"List of bloks and their characteristics" in line:
+                    # This line is present only if DDB has been produced by mrgddb
+                    break
+
+                # new block --> detect order
+                if b"# elements" in line:
+                    if block is not None: block.stop = pos
+                    tokens = line.decode("utf-8").split()
+                    s = " ".join(tokens[:2])
+                    dord = order2dord.get(s, None)
+                    if dord is None:
+                        raise RuntimeError("Cannot detect derivative order from string: `%s`" % s)
+                    block = DdbBlock(self.filepath, pos, None, dord, None, int(tokens[-1]))
+                    blocks.append(block)
+
+                elif b"qpt" in line and block is not None:
+                    block["qpt"] = list(map(float, line.decode("utf-8").split()[1:4]))
+
+            if block is not None: block.stop = pos if line else offset
 
-        for line in self:
-            # skip empty lines
-            if line.isspace():
-                continue
-
-            if "List of bloks and their characteristics" in line:
-                # add last block when we reach the last part of the file.
-                # This line is present only if DDB has been produced by mrgddb
-                if block_lines:
-                    blocks.append({"data": block_lines, "qpt": qpt, "dord": dord})
-                    block_lines = []
-                    qpt = None
-                break
-
-            # Don't use lstring because we may reuse block_lines to write new DDB.
-            line = line.rstrip()
-
-            # new block --> detect order
-            if "# elements" in line:
-                if block_lines:
-                    blocks.append({"data": block_lines, "qpt": qpt, "dord": dord})
-
-                tokens = line.split()
-                num_elements = int(tokens[-1])
-                s = " ".join(tokens[:2])
-                dord = {"Total energy": 0,
-                        "1st derivatives": 1,
-                        "2nd derivatives": 2,
-                        "3rd derivatives": 3}.get(s, None)
-                if dord is None:
-                    raise RuntimeError("Cannot detect derivative order from string: `%s`" % s)
-
-                block_lines = []
-                qpt = None
-
-            block_lines.append(line)
-            if "qpt" in line:
-                qpt = list(map(float, line.split()[1:4]))
+        return blocks
 
-        if block_lines:
-            blocks.append({"data": block_lines, "qpt": qpt, "dord": dord})
+    @lazy_property
+    def _qpt2blocks(self):
+        """
+        Hash table with the q-points of the blocks and list with the indices of the blocks
+        used to find blocks by q-point.
+        """
+        iblocks = [i for i, b in enumerate(self.blocks) if b["qpt"] is not None]
+        table = KpointHashTable([self.blocks[i]["qpt"] for i in iblocks] if iblocks else None, atol=1e-5)
+        return table, iblocks
 
-        return blocks
+    def _find_iblock(self, qpt):
+        """Index of the first block with q-point ``qpt``, None if not found."""
+        if hasattr(qpt, "frac_coords"): qpt = qpt.frac_coords
+        table, iblocks = self._qpt2blocks
+        for i in table.find_all(qpt):
+            b = self.blocks[iblocks[i]]
+            if np.allclose(b["qpt"], qpt): return iblocks[i]
+        return None
 
     @property
     def qpoints(self):
@@ -916,6 +1285,85 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
 
             return ncfile.phbands
 
+    def get_phmodes_at_qpoint(self, qpoint=None, asr=2):
+        """
+        Compute the phonon modes at one of the q-points in the DDB by diagonalizing the dynamical matrix
+        in-process. Equivalent to :meth:`anaget_phmodes_at_qpoint` without LO-TO splitting
+        but anaddb is not executed. The ASR is imposed only if the DDB contains Gamma.
+
+        Args:
+            qpoint: Reduced coordinates of the qpoint where phonon modes are computed.
+                Can be None if the DDB contains a single q-point.
+            asr: Acoustic sum rule (same meaning as the anaddb variable).
+
+        Return: |PhononBands| object.
+        """
+        if qpoint is None:
+            qpoint = self.qpoints[0]
+            if len(self.qpoints) != 1:
+                raise ValueError("%s contains %s qpoints and the choice is ambiguous.\n"
+                                 "Please specify the qpoint." % (self, len(self.qpoints)))
+
+        try:
+            iq = self.qindex(qpoint)
+        except Exception:
+            raise ValueError("input qpoint %s not in %s.\nddb.qpoints:\n%s" % (
+                qpoint, self.filepath, self.qpoints))
+        qpoint = self.qpoints[iq]
+
+        data = get_ddb_dynmats(self)
+        iq = [i for i, q in enumerate(data.qpoints) if np.allclose(q, qpoint.frac_coords)][0]
+        dynmat = data.dynmats[iq]
+        igam = [i for i, q in enumerate(data.qpoints) if np.allclose(q, 0)]
+        if asr != 0 and igam:
+            dynmat = impose_asr(dynmat, data.dynmats[igam[0]], asr=asr)
+
+        r = diagonalize_dynmat(dynmat, data.masses_amu)
+        qpoints = KpointList(self.structure.reciprocal_lattice, [qpoint.frac_coords], weights=None, names=None)
+        phbands = PhononBands(self.structure, qpoints, r.phfreqs, r.phdispl_cart, amu=data.amu)
+        self._add_params(phbands)
+
+        return phbands
+
+    def get_ifc_interpolator(self, ngqpt=None, asr=2):
+        """
+        Build the in-process Fourier interpolator of the dynamical matrix from the blocks of the DDB.
+        Objects are cached so that the IFCs are computed only once for given (ngqpt, asr).
+        The dipole-dipole interaction is not included (a warning is printed if the DDB contains
+        Becs or the dielectric tensor). See :class:`IfcInterpolator`.
+
+        Args:
+            ngqpt: Number of divisions for the q-mesh in the DDB file. Auto-detected if None (default).
+            asr: Acoustic sum rule (same meaning as the anaddb variable).
+        """
+        if ngqpt is None: ngqpt = self.guessed_ngqpt
+        key = (tuple(int(n) for n in ngqpt), asr)
+        cache = self.__dict__.setdefault("_ifc_interpolators", {})
+        if key not in cache:
+            if self.has_bec_terms() or self.has_epsinf_terms():
+                cprint("DDB %s contains Becs or Eps_inf but the dipole-dipole interaction is not included.\n"
+                       "Results differ from anaddb with dipdip 1 close to Gamma." % self.filepath, "yellow")
+            cache[key] = IfcInterpolator.from_ddb(self, ngqpt=ngqpt, asr=asr)
+
+        return cache[key]
+
+    def interpolate_phbands(self, qpoints, ngqpt=None, asr=2):
+        """
+        Compute the phonon band structure at arbitrary q-points with the in-process Fourier interpolation
+        of the dynamical matrix. Much faster than :meth:`anaget_phbst_and_phdos_files` since anaddb
+        is not executed but the dipole-dipole interaction and the LO-TO splitting are not included.
+
+        Args:
+            qpoints: |KpointList| or [nq, 3] array with reduced coordinates.
+            ngqpt: Number of divisions for the q-mesh in the DDB file. Auto-detected if None (default).
+            asr: Acoustic sum rule (same meaning as the anaddb variable).
+
+        Return: |PhononBands| object.
+        """
+        phbands = self.get_ifc_interpolator(ngqpt=ngqpt, asr=asr).get_phbands(qpoints)
+        self._add_params(phbands)
+        return phbands
+
     def anaget_phbst_and_phdos_files(self, nqsmall=10, qppa=None, ndivsm=20, line_density=None, asr=2, chneut=1, dipdip=1,
                                      dos_method="tetra", lo_to_splitting="automatic", ngqpt=None, qptbounds=None,
                                      anaddb_kwargs=None, verbose=0, spell_check=True,
@@ -1012,7 +1460,7 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
 
     def anacompare_asr(self, asr_list=(0, 2), chneut_list=(1,), dipdip=1, lo_to_splitting="automatic",
                        nqsmall=10, ndivsm=20, dos_method="tetra", ngqpt=None,
-                       verbose=0, mpi_procs=1):
+                       verbose=0, mpi_procs=1, num_cpus=None, timeout=None):
         """
         Invoke anaddb to compute the phonon band structure and the phonon DOS with different
         values of the ``asr`` input variable (acoustic sum rule treatment).
@@ -1035,6 +1483,8 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             ngqpt: Number of divisions for the ab-initio q-mesh in the DDB file. Auto-detected if None (default)
             verbose: Verbosity level.
             mpi_procs: Number of MPI processes used by anaddb.
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return:
             |PhononBandsPlotter| object.
@@ -1042,27 +1492,13 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             Client code can use ``plotter.combiplot()`` or ``plotter.gridplot()``
             to visualize the results.
         """
-        phbands_plotter = PhononBandsPlotter()
-
-        for asr, chneut in itertools.product(asr_list, chneut_list):
-            phbst_file, phdos_file = self.anaget_phbst_and_phdos_files(
-                nqsmall=nqsmall, ndivsm=ndivsm, asr=asr, chneut=chneut, dipdip=dipdip, dos_method=dos_method,
-                lo_to_splitting=lo_to_splitting, ngqpt=ngqpt, qptbounds=None,
-                anaddb_kwargs=None, verbose=verbose, mpi_procs=mpi_procs, workdir=None, manager=None)
-
-            label = "asr: %d, dipdip: %d, chneut: %d" % (asr, dipdip, chneut)
-            if phdos_file is not None:
-                phbands_plotter.add_phbands(label, phbst_file.phbands, phdos=phdos_file.phdos)
-                phdos_file.close()
-            else:
-                phbands_plotter.add_phbands(label, phbst_file.phbands)
-            phbst_file.close()
-
-        return phbands_plotter
+        params = [(asr, chneut, dipdip) for asr, chneut in itertools.product(asr_list, chneut_list)]
+        return self._anacompare_phbands(params, lo_to_splitting, nqsmall, ndivsm, dos_method, ngqpt,
+                                        verbose, mpi_procs, num_cpus, timeout)
 
     def anacompare_dipdip(self, chneut_list=(1,), asr=2, lo_to_splitting="automatic",
                           nqsmall=10, ndivsm=20, dos_method="tetra", ngqpt=None,
-                          verbose=0, mpi_procs=1):
+                          verbose=0, mpi_procs=1, num_cpus=None, timeout=None):
         """
         Invoke anaddb to compute the phonon band structure and the phonon DOS with different
         values of the ``asr`` input variable (acoustic sum rule treatment).
@@ -1083,6 +1519,8 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             ngqpt: Number of divisions for the ab-initio q-mesh in the DDB file. Auto-detected if None (default)
             verbose: Verbosity level.
             mpi_procs: Number of MPI processes used by anaddb.
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return:
             |PhononDosPlotter| object.
@@ -1090,28 +1528,42 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             Client code can use ``plotter.combiplot()`` or ``plotter.gridplot()``
             to visualize the results.
         """
-        phbands_plotter = PhononBandsPlotter()
-
+        params = []
         for dipdip in (0, 1):
             my_chneut_list = chneut_list if dipdip != 0 else [0]
-            for chneut in my_chneut_list:
-                phbst_file, phdos_file = self.anaget_phbst_and_phdos_files(
-                    nqsmall=nqsmall, ndivsm=ndivsm, asr=asr, chneut=chneut, dipdip=dipdip, dos_method=dos_method,
-                    lo_to_splitting=lo_to_splitting, ngqpt=ngqpt, qptbounds=None,
-                    anaddb_kwargs=None, verbose=verbose, mpi_procs=mpi_procs, workdir=None, manager=None)
-
-                label = "asr: %d, dipdip: %d, chneut: %d" % (asr, dipdip, chneut)
-                if phdos_file is not None:
-                    phbands_plotter.add_phbands(label, phbst_file.phbands, phdos=phdos_file.phdos)
-                    phdos_file.close()
-                else:
-                    phbands_plotter.add_phbands(label, phbst_file.phbands)
-                phbst_file.close()
+            params.extend((asr, chneut, dipdip) for chneut in my_chneut_list)
+
+        return self._anacompare_phbands(params, lo_to_splitting, nqsmall, ndivsm, dos_method, ngqpt,
+                                        verbose, mpi_procs, num_cpus, timeout)
+
+    def _anacompare_phbands(self, params, lo_to_splitting, nqsmall, ndivsm, dos_method, ngqpt,
+                            verbose, mpi_procs, num_cpus, timeout):
+        """
+        Run anaddb in parallel for each (asr, chneut, dipdip) in params. Return |PhononBandsPlotter|.
+        """
+        def do_work(p):
+            asr, chneut, dipdip = p
+            return self.anaget_phbst_and_phdos_files(
+                nqsmall=nqsmall, ndivsm=ndivsm, asr=asr, chneut=chneut, dipdip=dipdip, dos_method=dos_method,
+                lo_to_splitting=lo_to_splitting, ngqpt=ngqpt, qptbounds=None,
+                anaddb_kwargs=None, verbose=verbose, mpi_procs=mpi_procs, workdir=None, manager=None)
+
+        pool = AnaddbTaskPool(num_workers=num_cpus, mpi_procs=mpi_procs, timeout=timeout)
+        phbands_plotter = PhononBandsPlotter()
+
+        for (asr, chneut, dipdip), (phbst_file, phdos_file) in zip(params, pool.map(do_work, params)):
+            label = "asr: %d, dipdip: %d, chneut: %d" % (asr, dipdip, chneut)
+            if phdos_file is not None:
+                phbands_plotter.add_phbands(label, phbst_file.phbands, phdos=phdos_file.phdos)
+                phdos_file.close()
+            else:
+                phbands_plotter.add_phbands(label, phbst_file.phbands)
+            phbst_file.close()
 
         return phbands_plotter
 
     def anacompare_phdos(self, nqsmalls, asr=2, chneut=1, dipdip=1, dos_method="tetra", ngqpt=None,
-                         verbose=0, num_cpus=1, stream=sys.stdout):
+                         verbose=0, num_cpus=1, stream=sys.stdout, timeout=None):
         """
         Invoke Anaddb to compute Phonon DOS with different q-meshes. The ab-initio dynamical matrix
         reported in the DDB_ file will be Fourier-interpolated on the list of q-meshes specified
@@ -1127,6 +1579,7 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             verbose: Verbosity level.
             num_cpus: Number of CPUs (threads) used to parallellize the calculation of the DOSes. Autodetected if None.
             stream: File-like object used for printing.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return:
             ``namedtuple`` with the following attributes::
@@ -1147,40 +1600,9 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             phdos_file.close()
             return phdos
 
-        if num_cpus == 1:
-            # Sequential version
-            phdoses = [do_work(nqs) for nqs in nqsmalls]
-
-        else:
-            # Threads
-            if verbose:
-                print("Computing %d phonon DOS with %d threads" % (len(nqsmalls), num_cpus) )
-            phdoses = [None] * len(nqsmalls)
-
-            def worker():
-                while True:
-                    nqsm, phdos_index = q.get()
-                    phdos = do_work(nqsm)
-                    phdoses[phdos_index] = phdos
-                    q.task_done()
-
-            from threading import Thread
-            try:
-                from Queue import Queue # py2k
-            except ImportError:
-                from queue import Queue # py3k
-
-            q = Queue()
-            for i in range(num_cpus):
-                t = Thread(target=worker)
-                t.daemon = True
-                t.start()
-
-            for i, nqsmall in enumerate(nqsmalls):
-                q.put((nqsmall, i))
-
-            # block until all tasks are done
-            q.join()
+        if verbose and num_cpus > 1:
+            print("Computing %d phonon DOS with %d threads" % (len(nqsmalls), num_cpus))
+        phdoses = AnaddbTaskPool(num_workers=num_cpus, timeout=timeout).map(do_work, nqsmalls)
 
         # Compute relative difference wrt last phonon DOS. Be careful because the DOSes may be defined
         # on different frequency meshes ==> spline on the mesh of the last DOS.
@@ -1371,10 +1793,55 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         path = os.path.join(task.workdir, "anaddb.nc")
         return ElasticData.from_file(path) if not retpath else path
 
+    @property
+    def content_hash(self):
+        """
+        sha1 hash of the content of the DDB file. The value is recomputed if the file is modified.
+        """
+        stat = os.stat(self.filepath)
+        stamp = (stat.st_size, stat.st_mtime)
+        if getattr(self, "_content_hash", None) is None or self._content_hash[0] != stamp:
+            self._content_hash = (stamp, hash_file(self.filepath))
+        return self._content_hash[1]
+
+    def _get_anaddb_cache_key(self, anaddb_input):
+        """
+        Key of the entry in the anaddb cache. The key starts with the hash of the DDB file
+        so that all the entries associated to the file can be removed with :meth:`clear_anaddb_cache`.
+        """
+        return "%s_%s" % (self.content_hash, hash_objects(self._ANADDB_CACHE_VERSION, str(anaddb_input)))
+
+    def clear_anaddb_cache(self, cache=None):
+        """
+        Remove the results associated to this DDB file from the anaddb cache.
+
+        Args:
+            cache: |DiskCache| object. None to use the default cache returned by :func:`get_anaddb_cache`.
+
+        Return: Number of entries removed.
+        """
+        cache = get_anaddb_cache() if cache is None else cache
+        return len(cache.remove_prefix(self.content_hash + "_"))
+
     def _run_anaddb_task(self, anaddb_input, mpi_procs, workdir, manager, verbose):
         """
         Execute an |AnaddbInput| via the shell. Return AnaddbTask.
-        """
+        If ``use_anaddb_cache`` and workdir is None, the results of previous runs are taken from the cache
+        and a |CachedAnaddbRun| is returned.
+        """
+        cache, key = None, None
+        if self.use_anaddb_cache and workdir is None:
+            cache = get_anaddb_cache()
+            key = self._get_anaddb_cache_key(anaddb_input)
+            entry = cache.get_entry(key)
+            if entry is not None:
+                # Copy the files to a new directory so that the entry can be evicted while the files are open.
+                workdir = tempfile.mkdtemp(prefix="anaddb_")
+                for basename in os.listdir(entry):
+                    shutil.copy(os.path.join(entry, basename), os.path.join(workdir, basename))
+                if verbose: print("Results of anaddb taken from cache entry:", entry)
+                return CachedAnaddbRun(workdir)
+
         task = AnaddbTask.temp_shell_task(anaddb_input, ddb_node=self.filepath,
                 mpi_procs=mpi_procs, workdir=workdir, manager=manager)
 
@@ -1382,13 +1849,32 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
             print("ANADDB INPUT:\n", anaddb_input)
             print("workdir:", task.workdir)
 
-        # Run the task here.
-        task.start_and_wait(autoparal=False)
+        # Run the task here. The timeout is set by AnaddbTaskPool.
+        timeout = getattr(_ANADDB_LOCAL, "timeout", None)
+        if timeout is None:
+            task.start_and_wait(autoparal=False)
+        else:
+            task.start(autoparal=False)
+            start = time.time()
+            while task.process.poll() is None:
+                if time.time() - start > timeout:
+                    _kill_process_tree(task.process.pid)
+                    task.process.wait()
+                    raise self.AnaddbError("anaddb killed after %s seconds" % timeout, task=task, report=None)
+                time.sleep(0.1)
+            task.wait()
 
         report = task.get_event_report()
         if not report.run_completed:
             raise self.AnaddbError(task=task, report=report)
 
+        if cache is not None:
+            ncpaths = [os.path.join(task.workdir, f) for f in os.listdir(task.workdir) if f.endswith(".nc")]
+            try:
+                if ncpaths: cache.add_files(key, ncpaths)
+            except (IOError, OSError) as exc:
+                logger.warning("Cannot save anaddb results in cache:\n%s" % str(exc))
+
         return task
 
     def write(self, filepath, filter_blocks=None):
@@ -1396,6 +1882,10 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         Writes the DDB file in filepath. Requires the blocks data.
         Only the information stored in self.header.lines and in self.blocks will be used to produce the file
         """
+        if os.path.exists(filepath) and os.path.exists(self.filepath) and os.path.samefile(filepath, self.filepath):
+            # Blocks are indexed by byte offsets in the file: load the data of all the blocks before overwriting it.
+            for b in self.blocks: b["data"]
+
         lines = list(self.header.lines)
 
         if filter_blocks is None:
@@ -1426,11 +1916,9 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         Extracts the block data for the selected qpoint.
         Returns a list of lines containing the block information
         """
-        if hasattr(qpt, "frac_coords"): qpt = qpt.frac_coords
-
-        for b in self.blocks:
-            if b['qpt'] is not None and np.allclose(b['qpt'], qpt):
-                return b["data"]
+        iblock = self._find_iblock(qpt)
+        if iblock is not None:
+            return self.blocks[iblock]["data"]
 
     def replace_block_for_qpoint(self, qpt, data):
         """
@@ -1441,14 +1929,10 @@ class DdbFile(TextFile, Has_Structure, NotebookWriter):
         Return:
             True if qpt has been found and data has been replaced.
         """
-        if hasattr(qpt, "frac_coords"): qpt = qpt.frac_coords
-
-        for b in self.blocks:
-            if b['qpt'] is not None and np.allclose(b['qpt'], qpt):
-                b["data"] = data
-                return True
-
-        return False
+        iblock = self._find_iblock(qpt)
+        if iblock is None: return False
+        self.blocks[iblock]["data"] = data
+        return True
 
     def write_notebook(self, nbpath=None):
         """
@@ -1876,6 +2360,8 @@ class DielectricTensorGenerator(Has_Structure):
 class DdbRobot(Robot):
     """
     This robot analyzes the results contained in multiple DDB_ files.
+    Set ``DdbFile.use_sidecar_cache = True`` before building the robot to read the headers
+    and the blocks of the DDB files from the sidecar caches.
 
     .. rubric:: Inheritance Diagram
     .. inheritance-diagram:: DdbRobot
@@ -2000,7 +2486,7 @@ class DdbRobot(Robot):
     #    return retcode, results
 
     def get_dataframe_at_qpoint(self, qpoint=None, units="eV", asr=2, chneut=1, dipdip=1,
-	    with_geo=True, with_spglib=True, abspath=False, funcs=None):
+	    with_geo=True, with_spglib=True, abspath=False, funcs=None, method="anaddb", num_cpus=None, timeout=None):
         """
 	Call anaddb to compute the phonon frequencies at a single q-point using the DDB files treated
 	by the robot and the given anaddb input arguments. LO-TO splitting is not included.
@@ -2017,10 +2503,17 @@ class DdbRobot(Robot):
             funcs: Function or list of functions to execute to add more data to the DataFrame.
                 Each function receives a |DdbFile| object and returns a tuple (key, value)
                 where key is a string with the name of column and value is the value to be inserted.
+            method: "anaddb" to call anaddb, "native" to diagonalize the dynamical matrix in-process
+                (much faster, chneut and dipdip are not used). See :meth:`DdbFile.get_phmodes_at_qpoint`.
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return:
             |pandas-DataFrame|
         """
+        if method not in ("anaddb", "native"):
+            raise ValueError("Invalid method: %s" % str(method))
+
         # If qpoint is None, all the DDB must contain have the same q-point .
         if qpoint is None:
             if not all(len(ddb.qpoints) == 1 for ddb in self.abifiles):
@@ -2030,16 +2523,20 @@ class DdbRobot(Robot):
             if any(np.any(ddb.qpoints[0] != qpoint) for ddb in self.abifiles):
                 raise ValueError("All the q-points in the DDB files must be equal")
 
+        # Call anaddb to get the phonon frequencies. Note lo_to_splitting set to False.
+        if method == "anaddb":
+            phbands_list = self._map_anaddb(lambda ddb: ddb.anaget_phmodes_at_qpoint(qpoint=qpoint, asr=asr,
+                chneut=chneut, dipdip=dipdip, lo_to_splitting=False), num_cpus, timeout)
+        else:
+            phbands_list = [ddb.get_phmodes_at_qpoint(qpoint=qpoint, asr=asr) for ddb in self.abifiles]
+
         rows, row_names = [], []
-        for i, (label, ddb) in enumerate(self.items()):
+        for i, ((label, ddb), phbands) in enumerate(zip(self.items(), phbands_list)):
             row_names.append(label)
             d = OrderedDict()
             #d = {aname: getattr(ddb, aname) for aname in attrs}
             #d.update({"qpgap": mdf.get_qpgap(spin, kpoint)})
 
-            # Call anaddb to get the phonon frequencies. Note lo_to_splitting set to False.
-            phbands = ddb.anaget_phmodes_at_qpoint(qpoint=qpoint, asr=asr, chneut=chneut,
-               dipdip=dipdip, lo_to_splitting=False)
             # [nq, nmodes] array
             freqs = phbands.phfreqs[0, :] * phfactor_ev2units(units)
 
@@ -2059,21 +2556,27 @@ class DdbRobot(Robot):
         row_names = row_names if not abspath else self._to_relpaths(row_names)
         return pd.DataFrame(rows, index=row_names, columns=list(rows[0].keys()))
 
-    def anaget_phonon_plotters(self, **kwargs):
+    def _map_anaddb(self, func, num_cpus, timeout):
+        """
+        Call ``func(ddb)`` for all the DDB files of the robot using a bounded pool of threads.
+        Return list of results in the same order as the DDB files.
+        """
+        return AnaddbTaskPool(num_workers=num_cpus, timeout=timeout).map(func, self.abifiles)
+
+    def anaget_phonon_plotters(self, num_cpus=None, timeout=None, **kwargs):
         r"""
         Invoke anaddb to compute phonon bands and DOS using the arguments passed via \*\*kwargs.
+        The DDB files are processed in parallel with at most ``num_cpus`` anaddb processes
+        (None to use all the CPUs). ``timeout`` gives the max wall time in seconds for each run.
         Collect results and return `namedtuple` with the following attributes:
 
             phbands_plotter: |PhononBandsPlotter| object.
             phdos_plotter: |PhononDosPlotter| object.
         """
-	# TODO: Multiprocessing?
         if "workdir" in kwargs:
             raise ValueError("Cannot specify `workdir` when multiple DDB file are executed.")
 
-        phbands_plotter, phdos_plotter = PhononBandsPlotter(), PhononDosPlotter()
-
-        for label, ddb in self.items():
+        def do_work(ddb):
             # Invoke anaddb to get phonon bands and DOS.
             phbst_file, phdos_file = ddb.anaget_phbst_and_phdos_files(**kwargs)
 
@@ -2084,6 +2587,11 @@ class DdbRobot(Robot):
                 anaddb_path = os.path.join(os.path.dirname(phbst_file.filepath), "anaddb.nc")
                 phbst_file.phbands.read_non_anal_from_file(anaddb_path)
 
+            return phbst_file, phdos_file
+
+        phbands_plotter, phdos_plotter = PhononBandsPlotter(), PhononDosPlotter()
+
+        for label, (phbst_file, phdos_file) in zip(self.keys(), self._map_anaddb(do_work, num_cpus, timeout)):
             phbands_plotter.add_phbands(label, phbst_file, phdos=phdos_file)
             phbst_file.close()
             if phdos_file is not None:
@@ -2093,7 +2601,7 @@ class DdbRobot(Robot):
         return dict2namedtuple(phbands_plotter=phbands_plotter, phdos_plotter=phdos_plotter)
 
     def anacompare_elastic(self, ddb_header_keys=None, with_structure=True, with_spglib=True,
-                           with_path=False, manager=None, verbose=0, **kwargs):
+                           with_path=False, manager=None, verbose=0, num_cpus=None, timeout=None, **kwargs):
         """
         Compute elastic and piezoelectric properties for all DDBs in the robot and build DataFrame.
 
@@ -2105,16 +2613,18 @@ class DdbRobot(Robot):
             with_path: True to add DDB path to dataframe
             manager: |TaskManager| object. If None, the object is initialized from the configuration file
             verbose: verbosity level. Set it to a value > 0 to get more information
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
             kwargs: Keyword arguments passed to `ddb.anaget_elastic`.
 
         Return: DataFrame and list of ElastData objects.
         """
         ddb_header_keys = [] if ddb_header_keys is None else list_strings(ddb_header_keys)
-        df_list, elastdata_list = [], []
-        for label, ddb in self.items():
-            # Invoke anaddb to compute elastic data.
-            edata = ddb.anaget_elastic(verbose=verbose, **kwargs)
-            elastdata_list.append(edata)
+        # Invoke anaddb to compute elastic data.
+        elastdata_list = self._map_anaddb(lambda ddb: ddb.anaget_elastic(verbose=verbose, **kwargs),
+                                          num_cpus, timeout)
+        df_list = []
+        for ddb, edata in zip(self.abifiles, elastdata_list):
 
 	    # Build daframe with properties derived from the elastic tensor.
             df = edata.get_elastic_properties_dataframe()
@@ -2138,7 +2648,8 @@ class DdbRobot(Robot):
         return dict2namedtuple(df=pd.concat(df_list, ignore_index=True),
                                elastdata_list=elastdata_list)
 
-    def anacompare_becs(self, ddb_header_keys=None, chneut=1, tol=1e-3, with_path=False, verbose=0):
+    def anacompare_becs(self, ddb_header_keys=None, chneut=1, tol=1e-3, with_path=False, verbose=0,
+                        num_cpus=None, timeout=None):
         """
         Compute Born effective charges for all DDBs in the robot and build DataFrame.
         with Voigt indices as columns + metadata. Useful for convergence studies.
@@ -2150,6 +2661,8 @@ class DdbRobot(Robot):
             tol: Elements below this value are set to zero.
             with_path: True to add DDB path to dataframe
             verbose: verbosity level. Set it to a value > 0 to get more information
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return: ``namedtuple`` with the following attributes::
 
@@ -2157,11 +2670,11 @@ class DdbRobot(Robot):
             becs_list: list of Becs objects.
         """
         ddb_header_keys = [] if ddb_header_keys is None else list_strings(ddb_header_keys)
-        df_list, becs_list = [], []
-        for label, ddb in self.items():
-            # Invoke anaddb to compute Becs
-            _, becs = ddb.anaget_epsinf_and_becs(chneut=chneut, verbose=verbose)
-            becs_list.append(becs)
+        # Invoke anaddb to compute Becs
+        becs_list = [r[1] for r in self._map_anaddb(
+            lambda ddb: ddb.anaget_epsinf_and_becs(chneut=chneut, verbose=verbose), num_cpus, timeout)]
+        df_list = []
+        for ddb, becs in zip(self.abifiles, becs_list):
             df = becs.get_voigt_dataframe(tol=tol)
 
             # Add metadata to the dataframe.
@@ -2179,7 +2692,8 @@ class DdbRobot(Robot):
         return dict2namedtuple(df=pd.concat(df_list, ignore_index=True).sort_values(by="site_index"),
                                becs_list=becs_list)
 
-    def anacompare_epsinf(self, ddb_header_keys=None, chneut=1, tol=1e-3, with_path=False, verbose=0):
+    def anacompare_epsinf(self, ddb_header_keys=None, chneut=1, tol=1e-3, with_path=False, verbose=0,
+                          num_cpus=None, timeout=None):
         r"""
         Compute (eps^\inf) electronic dielectric tensor for all DDBs in the robot and build DataFrame.
         with Voigt indices as columns + metadata. Useful for convergence studies.
@@ -2191,6 +2705,8 @@ class DdbRobot(Robot):
             tol: Elements below this value are set to zero.
             with_path: True to add DDB path to dataframe
             verbose: verbosity level. Set it to a value > 0 to get more information
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return: ``namedtuple`` with the following attributes::
 
@@ -2198,11 +2714,11 @@ class DdbRobot(Robot):
             epsinf_list: List of |DielectricTensor| objects with eps^{inf}
         """
         ddb_header_keys = [] if ddb_header_keys is None else list_strings(ddb_header_keys)
-        df_list, epsinf_list = [], []
-        for label, ddb in self.items():
-            # Invoke anaddb to compute e_inf
-            einf, _ = ddb.anaget_epsinf_and_becs(chneut=chneut, verbose=verbose)
-            epsinf_list.append(einf)
+        # Invoke anaddb to compute e_inf
+        epsinf_list = [r[0] for r in self._map_anaddb(
+            lambda ddb: ddb.anaget_epsinf_and_becs(chneut=chneut, verbose=verbose), num_cpus, timeout)]
+        df_list = []
+        for ddb, einf in zip(self.abifiles, epsinf_list):
             df = einf.get_voigt_dataframe(tol=tol)
 
             # Add metadata to the dataframe.
@@ -2220,7 +2736,8 @@ class DdbRobot(Robot):
         return dict2namedtuple(df=pd.concat(df_list, ignore_index=True),
                                epsinf_list=epsinf_list)
 
-    def anacompare_eps0(self, ddb_header_keys=None, asr=2, chneut=1, tol=1e-3, with_path=False, verbose=0):
+    def anacompare_eps0(self, ddb_header_keys=None, asr=2, chneut=1, tol=1e-3, with_path=False, verbose=0,
+                        num_cpus=None, timeout=None):
         """
         Compute (eps^0) dielectric tensor for all DDBs in the robot and build DataFrame.
         with Voigt indices as columns + metadata. Useful for convergence studies.
@@ -2232,6 +2749,8 @@ class DdbRobot(Robot):
             tol: Elements below this value are set to zero.
             with_path: True to add DDB path to dataframe
             verbose: verbosity level. Set it to a value > 0 to get more information
+            num_cpus: Max number of anaddb runs executed in parallel. None to use all the CPUs.
+            timeout: Max wall time in seconds for each anaddb run. None for no limit.
 
         Return: ``namedtuple`` with the following attributes::
 
@@ -2240,11 +2759,11 @@ class DdbRobot(Robot):
             dgen_list: List of DielectricTensorGenerator.
         """
         ddb_header_keys = [] if ddb_header_keys is None else list_strings(ddb_header_keys)
-        df_list, eps0_list, dgen_list = [], [], []
-        for label, ddb in self.items():
-            # Invoke anaddb to compute e_0
-            gen = ddb.anaget_dielectric_tensor_generator(asr=asr, chneut=chneut, dipdip=1, verbose=verbose)
-            dgen_list.append(gen)
+        # Invoke anaddb to compute e_0
+        dgen_list = self._map_anaddb(lambda ddb: ddb.anaget_dielectric_tensor_generator(
+            asr=asr, chneut=chneut, dipdip=1, verbose=verbose), num_cpus, timeout)
+        df_list, eps0_list = [], []
+        for ddb, gen in zip(self.abifiles, dgen_list):
             eps0_list.append(gen.eps0)
             df = gen.eps0.get_voigt_dataframe(tol=tol)
 
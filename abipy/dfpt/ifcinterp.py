@@ -0,0 +1,364 @@
+# coding: utf-8
+"""
+Fourier interpolation of the dynamical matrix with interatomic force constants (IFCs)
+computed in-process from the blocks of a DDB file.
+
+The dynamical matrices in the IBZ are symmetrized to the full ab-initio q-mesh, Fourier transformed to
+real-space IFCs and interpolated at arbitrary q-points by summing the IFCs with Wigner-Seitz weights.
+The non-analytical dipole-dipole part is not treated so results for polar materials
+differ from the anaddb results (dipdip 1) away from the q-points of the mesh.
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import numpy as np
+import abipy.core.abinit_units as abu
+
+from collections import OrderedDict
+from monty.collections import dict2namedtuple
+from abipy.core.kpoints import KpointList, map_grid2ibz_symrec
+from abipy.dfpt.phonons import PhononBands
+
+
+__all__ = [
+    "get_ddb_dynmats",
+    "impose_asr",
+    "diagonalize_dynmat",
+    "IfcInterpolator",
+]
+
+
+def get_ddb_dynmats(ddb):
+    """
+    Extract the dynamical matrices in Cartesian coordinates from the second-order blocks of a DDB file.
+    Only the entries associated to atomic perturbations are considered.
+    Entries with the same q-point in different blocks are merged.
+
+    Args:
+        ddb: |DdbFile| object.
+
+    Return: named tuple with the following attributes:
+
+        qpoints: [nq, 3] array with the reduced coordinates of the q-points.
+        dynmats: [nq, 3 * natom, 3 * natom] complex array in Ha/Bohr^2. Index is 3 * iatom + idir.
+        masses_amu: [natom] array with the atomic masses in amu.
+        amu: dictionary {atomic_number: mass} (same format as in |PhononBands|).
+    """
+    natom = len(ddb.structure)
+    # Reciprocal lattice vectors (rows) without 2 pi, in Bohr^-1.
+    gprimd = ddb.structure.lattice.reciprocal_lattice_crystallographic.matrix * abu.Bohr_Ang
+
+    qkeys, dyn_red, filled = OrderedDict(), [], []
+    for block in ddb.blocks:
+        if block["dord"] != 2: continue
+        values = block.get_values()
+        perts = np.array(values[:, :4], dtype=np.int) - 1
+        mask = (perts[:, 1] < natom) & (perts[:, 3] < natom)
+        if not np.any(mask): continue
+
+        qkey = tuple(np.round(block["qpt"], decimals=8))
+        iq = qkeys.get(qkey, None)
+        if iq is None:
+            iq = qkeys[qkey] = len(dyn_red)
+            dyn_red.append(np.zeros((natom, 3, natom, 3), dtype=np.complex))
+            filled.append(np.zeros((natom, 3, natom, 3), dtype=np.bool))
+
+        p, v = perts[mask], values[mask]
+        dyn_red[iq][p[:, 1], p[:, 0], p[:, 3], p[:, 2]] = v[:, 4] + 1j * v[:, 5]
+        filled[iq][p[:, 1], p[:, 0], p[:, 3], p[:, 2]] = True
+
+    for qkey, iq in qkeys.items():
+        if not np.all(filled[iq]):
+            raise ValueError("DDB file %s does not contain all the atomic perturbations for q-point %s" % (
+                             ddb.filepath, str(qkey)))
+
+    qpoints = np.reshape(list(qkeys.keys()), (-1, 3))
+    # Derivatives wrt reduced displacements --> Cartesian: D_cart = G^T D_red G.
+    dynmats = np.einsum("ji,qajbl,lk->qaibk", gprimd, np.array(dyn_red), gprimd)
+
+    h = ddb.header
+    masses_amu = np.array([np.reshape(h.amu, -1)[typ - 1] for typ in np.reshape(h.typat, -1)])
+    amu = {int(z): float(m) for z, m in zip(np.reshape(h.znucl, -1), np.reshape(h.amu, -1))}
+
+    return dict2namedtuple(qpoints=qpoints, dynmats=np.reshape(dynmats, (-1, 3 * natom, 3 * natom)),
+                           masses_amu=masses_amu, amu=amu)
+
+
+def impose_asr(dynmats, dyn_gamma, asr=2):
+    """
+    Impose the acoustic sum rule by correcting the on-site terms of the dynamical matrices
+    with the correction computed from the dynamical matrix at Gamma.
+
+    Args:
+        dynmats: [..., 3 * natom, 3 * natom] array with the dynamical matrices in Cartesian coordinates.
+        dyn_gamma: [3 * natom, 3 * natom] array with the dynamical matrix at Gamma.
+        asr: 0 to disable the correction, 1 for the asymmetric version, 2 for the symmetric one
+            (same meaning as the anaddb variable).
+
+    Return: Corrected array (new object).
+    """
+    dynmats = np.array(dynmats)
+    if asr == 0: return dynmats
+    if asr not in (1, 2):
+        raise ValueError("Invalid value for asr: %s" % str(asr))
+
+    natom = len(dyn_gamma) // 3
+    corr = np.reshape(np.real(dyn_gamma), (natom, 3, natom, 3)).sum(axis=2)
+    if asr == 2: corr = 0.5 * (corr + corr.transpose(0, 2, 1))
+    for iat in range(natom):
+        dynmats[..., 3*iat:3*iat+3, 3*iat:3*iat+3] -= corr[iat]
+
+    return dynmats
+
+
+def diagonalize_dynmat(dynmats, masses_amu):
+    """
+    Diagonalize a set of dynamical matrices.
+
+    Args:
+        dynmats: [nq, 3 * natom, 3 * natom] array with the dynamical matrices in Cartesian coordinates (Ha/Bohr^2).
+        masses_amu: [natom] array with the atomic masses in amu.
+
+    Return: named tuple with the following attributes:
+
+        phfreqs: [nq, 3 * natom] array with the phonon frequencies in eV.
+            Negative values are used for unstable modes.
+        phdispl_cart: [nq, 3 * natom, 3 * natom] array with the phonon displacements in Angstrom
+            (same convention as |PhononBands|).
+    """
+    masses = np.repeat(np.asarray(masses_amu, dtype=np.float) * abu.amu_emass, 3)
+    sqrt_m = np.sqrt(masses)
+    dynmats = np.reshape(dynmats, (-1, len(masses), len(masses)))
+    dmass = dynmats / np.outer(sqrt_m, sqrt_m)
+    dmass = 0.5 * (dmass + np.conj(dmass.transpose(0, 2, 1)))
+
+    # np.linalg.eigh works on stacks of matrices.
+    w2, eigvec = np.linalg.eigh(dmass)
+    phfreqs = np.sign(w2) * np.sqrt(np.abs(w2)) * abu.Ha_eV
+    phdispl_cart = (eigvec / sqrt_m[None, :, None]).transpose(0, 2, 1) * abu.Bohr_Ang
+
+    return dict2namedtuple(phfreqs=phfreqs, phdispl_cart=phdispl_cart)
+
+
+class IfcInterpolator(object):
+    """
+    Fourier interpolation of the dynamical matrix based on real-space interatomic force constants.
+
+    .. rubric:: Example
+
+        ifcs = IfcInterpolator.from_ddb(ddb)
+        phbands = ifcs.get_phbands([[0, 0, 0], [0.1, 0, 0]])
+    """
+
+    # Tolerance in Bohr used to detect Wigner-Seitz images at the same distance.
+    ws_tol = 1e-5
+
+    @classmethod
+    def from_ddb(cls, ddb, ngqpt=None, asr=2):
+        """
+        Build the object from a |DdbFile|. The q-points in the DDB must contain the IBZ of
+        the Gamma-centered q-mesh ``ngqpt``, the other points are ignored.
+
+        Args:
+            ddb: |DdbFile| object.
+            ngqpt: Divisions of the ab-initio q-mesh. None to use ``ddb.guessed_ngqpt``.
+            asr: Acoustic sum rule (same meaning as the anaddb variable).
+        """
+        ngqpt = np.array(ddb.guessed_ngqpt if ngqpt is None else ngqpt, dtype=np.int)
+        data = get_ddb_dynmats(ddb)
+
+        # Select the q-points belonging to the mesh.
+        ongrid = np.all(np.abs(data.qpoints * ngqpt - np.rint(data.qpoints * ngqpt)) < 1e-6, axis=1)
+        qibz, dyn_ibz = data.qpoints[ongrid], data.dynmats[ongrid]
+        if len(qibz) == 0:
+            raise ValueError("DDB file %s does not contain q-points belonging to ngqpt %s" % (ddb.filepath, ngqpt))
+
+        structure = ddb.structure
+        spgroup = structure.abi_spacegroup
+        try:
+            dynmats = symmetrize_dynmats(structure, spgroup.symrel, spgroup.tnons, spgroup.symrec,
+                                         qibz, dyn_ibz, ngqpt, has_timrev=True)
+        except ValueError as exc:
+            raise ValueError("The q-points in DDB file %s do not cover the IBZ of ngqpt %s\n%s" % (
+                             ddb.filepath, ngqpt, str(exc)))
+
+        return cls(structure, ngqpt, dynmats, data.masses_amu, asr=asr, amu=data.amu)
+
+    def __init__(self, structure, ngqpt, dynmats, masses_amu, asr=2, amu=None):
+        """
+        Args:
+            structure: |Structure| object.
+            ngqpt: Divisions of the Gamma-centered q-mesh.
+            dynmats: [nq, 3 * natom, 3 * natom] array with the dynamical matrices in Cartesian coordinates
+                for all the q-points of the mesh (C-order, points in the unit cell).
+            masses_amu: [natom] array with the atomic masses in amu.
+            asr: Acoustic sum rule (same meaning as the anaddb variable).
+            amu: dictionary {atomic_number: mass} passed to |PhononBands|.
+        """
+        self.structure = structure
+        self.ngqpt = np.array(ngqpt, dtype=np.int)
+        self.masses_amu = np.array(masses_amu, dtype=np.float)
+        self.asr, self.amu = asr, amu
+        self.natom = len(self.masses_amu)
+        nbz, n3 = int(np.prod(self.ngqpt)), 3 * self.natom
+
+        dynmats = np.reshape(dynmats, (nbz, n3, n3))
+        dynmats = 0.5 * (dynmats + np.conj(dynmats.transpose(0, 2, 1)))
+
+        # IFC(R) = 1/N sum_q D(q) e^{-iqR} --> forward FFT on the q-mesh.
+        ifc = np.fft.fftn(np.reshape(dynmats, tuple(self.ngqpt) + (n3, n3)), axes=(0, 1, 2)) / nbz
+        self.max_imag_ifc = np.abs(ifc.imag).max()
+        ifc = np.reshape(ifc.real, (nbz, n3, n3))
+
+        # ASR in real space: the correction is applied to the on-site term.
+        ifc[0] = impose_asr(ifc[0], ifc.sum(axis=0), asr=asr)
+
+        self._rpts, self._ifc_ws = self._get_ws_ifcs(ifc)
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, verbose=0):
+        """String representation."""
+        lines = []
+        app = lines.append
+        app("%s: ngqpt: %s, asr: %s" % (self.__class__.__name__, self.ngqpt, self.asr))
+        app("Number of R-points (Wigner-Seitz images): %d" % len(self._rpts))
+        app("Max imaginary part of the IFCs: %.3e" % self.max_imag_ifc)
+        return "\n".join(lines)
+
+    def _get_ws_ifcs(self, ifc):
+        """
+        Associate the IFCs of the supercell to the images of the R-points inside the Wigner-Seitz cell
+        of the supercell. Images at the same distance share the IFC with equal weights.
+
+        Return: [nr, 3] array with the R-points (reduced coordinates),
+            [nr, 3 * natom, 3 * natom] array with the weighted IFCs.
+        """
+        ngqpt, natom = self.ngqpt, self.natom
+        nbz = int(np.prod(ngqpt))
+        rgrid = np.array(np.unravel_index(np.arange(nbz), tuple(ngqpt))).T
+        shifts = np.array([(i, j, k) for i in range(-2, 3) for j in range(-2, 3) for k in range(-2, 3)])
+        # [nbz, nshift, 3] candidate images.
+        rcands = rgrid[:, None, :] + shifts[None, :, :] * ngqpt
+
+        latt = self.structure.lattice.matrix / abu.Bohr_Ang
+        xred = self.structure.frac_coords
+
+        # Loop over the first atom to bound memory and keep only the Wigner-Seitz images of each pair:
+        # (iat, jat, index of the candidate image in rcands, weight).
+        iats, jats, icands, weights = [], [], [], []
+        for iat in range(natom):
+            # dist[jat, ir, ishift] = |R + x_j - x_i|
+            dvec = rcands[None] + (xred[:, None, None, :] - xred[iat])
+            dist = np.sqrt(((np.dot(np.reshape(dvec, (-1, 3)), latt)) ** 2).sum(axis=-1))
+            dist = np.reshape(dist, (natom, nbz, len(shifts)))
+
+            isws = dist <= dist.min(axis=-1, keepdims=True) + self.ws_tol
+            jat, ibz, ishift = np.nonzero(isws)
+            iats.append(np.full(len(jat), iat, dtype=np.int))
+            jats.append(jat)
+            icands.append(ibz * len(shifts) + ishift)
+            weights.append(1.0 / isws.sum(axis=-1)[jat, ibz])
+
+        iats, jats, icands, weights = map(np.concatenate, (iats, jats, icands, weights))
+
+        # Keep only the images with non-zero weight for at least one pair of atoms.
+        keep, irs = np.unique(icands, return_inverse=True)
+        rpts = np.reshape(rcands, (-1, 3))[keep]
+        ibzs = icands // len(shifts)
+
+        ifc = np.reshape(ifc, (nbz, natom, 3, natom, 3))
+        ifc_ws = np.zeros((len(rpts), natom, 3, natom, 3))
+        ifc_ws[irs, iats, :, jats, :] = ifc[ibzs, iats, :, jats, :] * weights[:, None, None]
+
+        return rpts, np.reshape(ifc_ws, (len(rpts), 3 * natom, 3 * natom))
+
+    def get_dynmat(self, qpoints):
+        """
+        Interpolate the dynamical matrix at the given q-points.
+
+        Args:
+            qpoints: [nq, 3] array with reduced coordinates.
+
+        Return: [nq, 3 * natom, 3 * natom] complex array in Cartesian coordinates (Ha/Bohr^2).
+        """
+        qpoints = np.reshape(qpoints, (-1, 3))
+        n3 = 3 * self.natom
+        phases = np.exp(2j * np.pi * np.dot(qpoints, self._rpts.T))
+        dyn = np.dot(phases, np.reshape(self._ifc_ws, (len(self._rpts), n3 * n3)))
+        dyn = np.reshape(dyn, (len(qpoints), n3, n3))
+
+        return 0.5 * (dyn + np.conj(dyn.transpose(0, 2, 1)))
+
+    def get_phfreqs_phdispl(self, qpoints):
+        """
+        Compute the phonon frequencies (eV) and the displacements (Angstrom) at the given q-points.
+        See :func:`diagonalize_dynmat` for the meaning of the attributes of the named tuple.
+        """
+        return diagonalize_dynmat(self.get_dynmat(qpoints), self.masses_amu)
+
+    def get_phbands(self, qpoints):
+        """
+        Compute the phonon band structure at the given q-points.
+
+        Args:
+            qpoints: |KpointList| or [nq, 3] array with reduced coordinates.
+
+        Return: |PhononBands| object.
+        """
+        if not isinstance(qpoints, KpointList):
+            qpoints = KpointList(self.structure.reciprocal_lattice, np.reshape(qpoints, (-1, 3)),
+                                 weights=None, names=None)
+
+        r = self.get_phfreqs_phdispl(qpoints.frac_coords)
+        return PhononBands(self.structure, qpoints, r.phfreqs, r.phdispl_cart, amu=self.amu)
+
+
+def symmetrize_dynmats(structure, symrel, tnons, symrec, qibz, dyn_ibz, ngqpt, has_timrev=True):
+    """
+    Reconstruct the dynamical matrices on the full Gamma-centered q-mesh from the matrices in the IBZ
+    using D(Sq)_{S(i),S(j)} = S D(q)_{ij} S^T exp(i Sq (L_j - L_i))
+    where the operation {S|t} sends atom i to atom S(i) translated by the lattice vector L_i.
+
+    Args:
+        structure: |Structure| object.
+        symrel, tnons, symrec: Symmetry operations in reduced coordinates (C-order).
+        qibz: [nibz, 3] array with the q-points in the IBZ.
+        dyn_ibz: [nibz, 3 * natom, 3 * natom] array with the dynamical matrices in Cartesian coordinates.
+        ngqpt: Mesh divisions.
+        has_timrev: True if time-reversal can be used.
+
+    Return: [nbz, 3 * natom, 3 * natom] array (C-order, points in the unit cell).
+    """
+    symrel, tnons, symrec = np.asarray(symrel), np.asarray(tnons), np.asarray(symrec)
+    natom = len(structure)
+    xred = structure.frac_coords
+    # Cartesian rotations: S = A R A^{-1} with the lattice vectors stored in the columns of A.
+    amat = structure.lattice.matrix.T
+    cart_rots = np.einsum("ij,sjk,kl->sil", amat, symrel, np.linalg.inv(amat))
+
+    # Atom mapping: R x_i + t = x_{S(i)} + L_i
+    rot_xred = np.einsum("sij,aj->sai", symrel, xred) + tnons[:, None, :]
+    diff = rot_xred[:, :, None, :] - xred[None, None, :, :]
+    isgood = np.all(np.abs(diff - np.rint(diff)) < 1e-4, axis=-1)
+    if not np.all(isgood.sum(axis=-1) == 1):
+        raise ValueError("Cannot find the atom mapping for all the symmetry operations.")
+    indsym = np.argmax(isgood, axis=-1)
+    latt_l = np.rint(diff[np.arange(len(symrel))[:, None], np.arange(natom)[None, :], indsym])
+
+    mapping = map_grid2ibz_symrec(symrec, qibz, ngqpt, has_timrev)
+    dyn_ibz = np.reshape(dyn_ibz, (-1, natom, 3, natom, 3))
+    nbz = len(mapping.bz2ibz)
+    dynmats = np.empty((nbz, natom, 3, natom, 3), dtype=np.complex)
+    r3 = [0, 1, 2]
+    for ibz, (iq, isym, tsign) in enumerate(zip(mapping.bz2ibz, mapping.bz2ibz_symm, mapping.bz2ibz_tsign)):
+        srot = cart_rots[isym]
+        sq = np.dot(symrec[isym], qibz[iq])
+        lvec = latt_l[isym]
+        phase = np.exp(2j * np.pi * (np.dot(lvec, sq)[None, :] - np.dot(lvec, sq)[:, None]))
+        rot_dyn = np.einsum("ij,ajbk,lk->aibl", srot, dyn_ibz[iq], srot) * phase[:, None, :, None]
+        if tsign == -1: rot_dyn = np.conj(rot_dyn)
+        perm = indsym[isym]
+        dynmats[ibz][np.ix_(perm, r3, perm, r3)] = rot_dyn
+
+    return np.reshape(dynmats, (nbz, 3 * natom, 3 * natom))
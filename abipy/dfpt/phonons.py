@@ -24,7 +24,7 @@ from abipy.core.mixins import AbinitNcFile, Has_Structure, Has_PhononBands, Note
 from abipy.core.kpoints import Kpoint, Kpath
 from abipy.abio.robots import Robot
 from abipy.iotools import ETSF_Reader
-from abipy.tools import gaussian, duck
+from abipy.tools import gaussian_dos, duck
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt, set_axlims, get_axarray_fig_plt, set_visible, set_ax_xylabels
 from pymatgen.phonon.bandstructure import PhononBandStructureSymmLine
 from pymatgen.phonon.dos import CompletePhononDos as PmgCompletePhononDos, PhononDos as PmgPhononDos
@@ -607,7 +607,8 @@ class PhononBands(object):
         Compute the phonon DOS on a linear mesh.
 
         Args:
-            method: String defining the method
+            method: String defining the method: "gaussian" or "tetra" for the linear tetrahedron method
+                with Blöchl corrections (requires frequencies in the IBZ of a Gamma-centered q-mesh).
             step: Energy step (eV) of the linear mesh.
             width: Standard deviation (eV) of the gaussian.
 
@@ -626,17 +627,18 @@ class PhononBands(object):
         w_min -= 0.1 * abs(w_min)
         w_max = self.maxfreq
         w_max += 0.1 * abs(w_max)
-        nw = 1 + (w_max - w_min) / step
+        nw = int(1 + (w_max - w_min) / step)
 
         mesh, step = np.linspace(w_min, w_max, num=nw, endpoint=True, retstep=True)
 
         values = np.zeros(nw)
         if method == "gaussian":
-            for q, qpoint in enumerate(self.qpoints):
-                weight = qpoint.weight
-                for nu in self.branches:
-                    w = self.phfreqs[q, nu]
-                    values += weight * gaussian(mesh, width, center=w)
+            values = gaussian_dos(mesh, width, self.phfreqs, self.qpoints.weights[:, None])
+
+        elif method == "tetra":
+            from abipy.core.tetra import Tetrahedra
+            tetra = Tetrahedra.from_kpoints(self.structure, self.qpoints, has_timrev=True)
+            values, _ = tetra.get_dos_idos(self.phfreqs, mesh)
 
         else:
             raise ValueError("Method %s is not supported" % str(method))
@@ -1165,24 +1167,29 @@ class PhononBands(object):
 
             for i, displ in enumerate(self.split_phdispl_cart):
                 eigenvectors = get_dyn_mat_eigenvec(displ, self.structure, amu=self.amu)
-                ind_block = np.zeros((len(displ), self.num_branches), dtype=np.int)
+                nq = len(displ)
+
+                # The pairs of points to be matched depend only on the q-path hence all the
+                # assignments can be computed in a single batch before composing the permutations.
+                kinds = np.arange(-1, nq - 1)
+                for j in range(2, nq):
+                    if not collinear(self.split_qpoints[i][j-2], self.split_qpoints[i][j-1], self.split_qpoints[i][j]):
+                        kinds[j] = j - 2
+                matches = match_eigenvectors_batch(eigenvectors, eigenvectors, kinds[2:], np.arange(2, nq))
+
+                ind_block = np.zeros((nq, self.num_branches), dtype=np.int)
                 # if it's not the first block, match the first two points with the last of the previous block.
                 # Should give a match in case of LO-TO splitting
                 if i == 0:
                     ind_block[0] = range(self.num_branches)
-                    match = match_eigenvectors(eigenvectors[0], eigenvectors[1])
-                    ind_block[1] = [match[m] for m in ind_block[0]]
+                    match = match_eigenvectors_batch(eigenvectors, eigenvectors, [0], [1])[0]
+                    ind_block[1] = match[ind_block[0]]
                 else:
-                    match = match_eigenvectors(last_eigenvectors, eigenvectors[0])
-                    ind_block[0] = [match[m] for m in split_matched_indices[-1][-2]]
-                    match = match_eigenvectors(last_eigenvectors, eigenvectors[1])
-                    ind_block[1] = [match[m] for m in split_matched_indices[-1][-2]]
-                for j in range(2, len(displ)):
-                    k = j-1
-                    if not collinear(self.split_qpoints[i][j-2], self.split_qpoints[i][j-1], self.split_qpoints[i][j]):
-                        k = j-2
-                    match = match_eigenvectors(eigenvectors[k], eigenvectors[j])
-                    ind_block[j] = [match[m] for m in ind_block[k]]
+                    first_matches = match_eigenvectors_batch(last_eigenvectors[None], eigenvectors, [0, 0], [0, 1])
+                    ind_block[:2] = first_matches[:, split_matched_indices[-1][-2]]
+                for j in range(2, nq):
+                    k = kinds[j]
+                    ind_block[j] = matches[j-2][ind_block[k]]
 
                 split_matched_indices.append(ind_block)
                 last_eigenvectors = eigenvectors[-2]
@@ -2024,6 +2031,88 @@ _THERMO_YLABELS = {  # [name][units] --> latex string
 }
 
 
+# Max number of elements in the (..., ntemps, nw) arrays allocated by harmonic_thermo.
+_THERMO_CHUNK_SIZE = 2 ** 22
+
+
+def harmonic_thermo(w, gw, tmesh, weighted=False):
+    """
+    Vectorized evaluation of the thermodynamic properties in the harmonic approximation
+    for a set of temperatures and an arbitrary number of phonon DOSes (e.g. one for each volume).
+    Temperatures are processed in chunks so that all the quantities are computed in a single pass
+    with bounded memory. The expressions are written in terms of exp(-w/kT) to avoid overflows
+    at low T and T = 0 gives the zero-temperature limits (U = ZPE, S = 0, C_v = 0).
+
+    Args:
+        w: Phonon frequencies in eV. Shape (..., nw). Must be > 0.
+        gw: Phonon DOS on the mesh ``w`` (integrated with the trapezoidal rule)
+            or weights of the frequencies if ``weighted``. Same shape as ``w``.
+        tmesh: Temperatures in Kelvin. Shape (ntemps).
+        weighted: True if ``gw`` are weights and the properties are obtained by summing over the frequencies.
+
+    Returns:
+        ``namedtuple`` with the following attributes:
+
+            tmesh: numpy array with the temperatures. Shape (ntemps).
+            internal_energy: internal energy in eV, zero point energy included. Shape (..., ntemps).
+            free_energy: free energy in eV, zero point energy included. Shape (..., ntemps).
+            entropy: entropy in eV/K. Shape (..., ntemps).
+            cv: constant-volume specific heat in eV/K. Shape (..., ntemps).
+            zpe: zero point energy in eV. Shape (...).
+    """
+    tmesh = np.asarray(tmesh, dtype=np.float)
+    w, gw = np.broadcast_arrays(np.asarray(w, dtype=np.float), np.asarray(gw, dtype=np.float))
+    if np.any(w <= 0):
+        raise ValueError("Frequencies must be positive.")
+
+    if weighted:
+        integrate = lambda f: np.sum(f * gw[..., None, :], axis=-1)
+    else:
+        integrate = lambda f: np.trapz(f * gw[..., None, :], x=w[..., None, :], axis=-1)
+
+    shape = w.shape[:-1] + (len(tmesh),)
+    u, f, s, cv = np.empty(shape), np.empty(shape), np.empty(shape), np.empty(shape)
+
+    chunk = max(1, _THERMO_CHUNK_SIZE // max(1, w.size))
+    for start in range(0, len(tmesh), chunk):
+        stop = min(start + chunk, len(tmesh))
+        kt = abu.kb_eVK * tmesh[start:stop, None]
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            # y --> inf and exp(-y) --> 0 if T == 0
+            y = w[..., None, :] / kt
+            e = np.exp(-y)
+            em = -np.expm1(-y)
+            ye = np.where(e > 0, y * e, 0.0)
+            u[..., start:stop] = integrate(w[..., None, :] * (0.5 + e / em))
+            f[..., start:stop] = integrate(0.5 * w[..., None, :] + kt * np.log(em))
+            s[..., start:stop] = abu.kb_eVK * integrate(ye / em - np.log(em))
+            cv[..., start:stop] = abu.kb_eVK * integrate(np.where(e > 0, y * ye, 0.0) / em ** 2)
+
+    zpe = integrate(0.5 * w[..., None, :])[..., 0]
+
+    return dict2namedtuple(tmesh=tmesh, internal_energy=u, free_energy=f, entropy=s, cv=cv, zpe=zpe)
+
+
+def harmonic_thermo_from_phdoses(phdoses, tmesh):
+    """
+    Compute the thermodynamic properties of a list of |PhononDos| with a single call to :func:`harmonic_thermo`.
+    Meshes with different sizes are padded at the end with zero DOS so that they do not contribute to the integrals.
+
+    Args:
+        phdoses: List of |PhononDos| objects.
+        tmesh: Temperatures in Kelvin. Shape (ntemps).
+
+    Returns:
+        ``namedtuple`` with arrays of shape (len(phdoses), ntemps). See :func:`harmonic_thermo`.
+    """
+    meshes = [phdos._get_thermo_mesh() for phdos in phdoses]
+    nw = max(len(w) for w, _ in meshes)
+    w = np.array([np.pad(w, (0, nw - len(w)), mode="edge") for w, _ in meshes])
+    gw = np.array([np.pad(gw, (0, nw - len(gw)), mode="constant") for _, gw in meshes])
+
+    return harmonic_thermo(w, gw, tmesh)
+
+
 class PhononDos(Function1D):
     """
     This object stores the phonon density of states.
@@ -2166,6 +2255,29 @@ class PhononDos(Function1D):
 
         return fig
 
+    def _get_thermo_mesh(self):
+        """Return the positive frequencies and the DOS used to compute thermodynamic properties."""
+        w, gw = self.mesh[self.iw0:], self.values[self.iw0:]
+        if w[0] < 1e-12:
+            w, gw = self.mesh[self.iw0+1:], self.values[self.iw0+1:]
+        return w, gw
+
+    def get_harmonic_thermo(self, tstart=5, tstop=300, num=50):
+        """
+        Compute all the thermodynamic properties in the harmonic approximation in a single pass.
+        See :func:`harmonic_thermo`.
+
+        Args:
+            tstart: The starting value (in Kelvin) of the temperature mesh.
+            tstop: The end value (in Kelvin) of the mesh.
+            num (int): optional Number of samples to generate. Default is 50.
+
+        Return: ``namedtuple`` with the temperature mesh and the internal_energy, free_energy,
+            entropy and cv arrays. Units as in get_internal_energy, get_free_energy, get_entropy and get_cv.
+        """
+        w, gw = self._get_thermo_mesh()
+        return harmonic_thermo(w, gw, np.linspace(tstart, tstop, num=num))
+
     def get_internal_energy(self, tstart=5, tstop=300, num=50):
         """
         Returns the internal energy, in eV, in the harmonic approximation for different temperatures
@@ -2178,22 +2290,8 @@ class PhononDos(Function1D):
 
         Return: |Function1D| object with U(T) + ZPE.
         """
-        tmesh = np.linspace(tstart, tstop, num=num)
-        w, gw = self.mesh[self.iw0:], self.values[self.iw0:]
-        if w[0] < 1e-12:
-            w, gw = self.mesh[self.iw0+1:], self.values[self.iw0+1:]
-        coth = lambda x: 1.0 / np.tanh(x)
-
-        vals = np.empty(len(tmesh))
-        for it, temp in enumerate(tmesh):
-            if temp == 0:
-                vals[it] = self.zero_point_energy
-            else:
-                wd2kt = w / (2 * abu.kb_eVK * temp)
-                vals[it] = 0.5 * np.trapz(w * coth(wd2kt) * gw, x=w)
-            #print(vals[it])
-
-        return Function1D(tmesh, vals)
+        thermo = self.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+        return Function1D(thermo.tmesh, thermo.internal_energy)
 
     def get_entropy(self, tstart=5, tstop=300, num=50):
         """
@@ -2206,21 +2304,8 @@ class PhononDos(Function1D):
 
         Return: |Function1D| object with S(T).
         """
-        tmesh = np.linspace(tstart, tstop, num=num)
-        w, gw = self.mesh[self.iw0:], self.values[self.iw0:]
-        if w[0] < 1e-12:
-            w, gw = self.mesh[self.iw0+1:], self.values[self.iw0+1:]
-        coth = lambda x: 1.0 / np.tanh(x)
-
-        vals = np.empty(len(tmesh))
-        for it, temp in enumerate(tmesh):
-            if temp == 0:
-                vals[it] = 0
-            else:
-                wd2kt = w / (2 * abu.kb_eVK * temp)
-                vals[it] = np.trapz((wd2kt * coth(wd2kt) - np.log(2 * np.sinh(wd2kt))) * gw, x=w)
-
-        return Function1D(tmesh, abu.kb_eVK * vals)
+        thermo = self.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+        return Function1D(thermo.tmesh, thermo.entropy)
 
     def get_free_energy(self, tstart=5, tstop=300, num=50):
         """
@@ -2234,10 +2319,8 @@ class PhononDos(Function1D):
 
         Return: |Function1D| object with F(T) = U(T) + ZPE - T x S(T)
         """
-        uz = self.get_internal_energy(tstart=tstart, tstop=tstop, num=num)
-        s = self.get_entropy(tstart=tstart, tstop=tstop, num=num)
-
-        return Function1D(uz.mesh, uz.values - s.mesh * s.values)
+        thermo = self.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+        return Function1D(thermo.tmesh, thermo.free_energy)
 
     def get_cv(self, tstart=5, tstop=300, num=50):
         """
@@ -2251,21 +2334,8 @@ class PhononDos(Function1D):
 
         Return: |Function1D| object with C_v(T).
         """
-        tmesh = np.linspace(tstart, tstop, num=num)
-        w, gw = self.mesh[self.iw0:], self.values[self.iw0:]
-        if w[0] < 1e-12:
-            w, gw = self.mesh[self.iw0+1:], self.values[self.iw0+1:]
-        csch2 = lambda x: 1.0 / (np.sinh(x) ** 2)
-
-        vals = np.empty(len(tmesh))
-        for it, temp in enumerate(tmesh):
-            if temp == 0:
-                vals[it] = 0
-            else:
-                wd2kt = w / (2 * abu.kb_eVK * temp)
-                vals[it] = np.trapz(wd2kt ** 2 * csch2(wd2kt) * gw, x=w)
-
-        return Function1D(tmesh, abu.kb_eVK * vals)
+        thermo = self.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+        return Function1D(thermo.tmesh, thermo.cv)
 
     @add_fig_kwargs
     def plot_harmonic_thermo(self, tstart=5, tstop=300, num=50, units="eV", formula_units=None,
@@ -2302,13 +2372,14 @@ class PhononDos(Function1D):
         # don't show the last ax if num_plots is odd.
         if num_plots % ncols != 0: ax_mat[-1, -1].axis("off")
 
+        # Compute all the thermodynamic quantities in one pass.
+        thermo = self.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+
         for iax, (qname, ax) in enumerate(zip(quantities, ax_mat.flat)):
-            # Compute thermodynamic quantity associated to qname.
-            f1d = getattr(self, "get_" + qname)(tstart=tstart, tstop=tstop, num=num)
-            ys = f1d.values
+            ys = getattr(thermo, qname).copy()
             if formula_units is not None: ys /= formula_units
             if units == "Jmol": ys = ys * abu.e_Cb * abu.Avogadro
-            ax.plot(f1d.mesh, ys)
+            ax.plot(thermo.tmesh, ys)
 
             ax.set_title(qname)
             ax.grid(True)
@@ -3615,14 +3686,16 @@ class PhononDosPlotter(NotebookWriter):
         # don't show the last ax if num_plots is odd.
         if num_plots % ncols != 0: ax_mat[-1, -1].axis("off")
 
+        # Compute all the thermodynamic quantities in one pass for each DOS.
+        thermos = [phdos.get_harmonic_thermo(tstart=tstart, tstop=tstop, num=num)
+                   for phdos in self._phdoses_dict.values()]
+
         for iax, (qname, ax) in enumerate(zip(quantities, ax_mat.flat)):
-            for i, (label, phdos) in enumerate(self._phdoses_dict.items()):
-                # Compute thermodynamic quantity associated to qname.
-                f1d = getattr(phdos, "get_" + qname)(tstart=tstart, tstop=tstop, num=num)
-                ys = f1d.values
+            for label, thermo in zip(self._phdoses_dict.keys(), thermos):
+                ys = getattr(thermo, qname).copy()
                 if formula_units != 1: ys /= formula_units
                 if units == "Jmol": ys = ys * abu.e_Cb * abu.Avogadro
-                ax.plot(f1d.mesh, ys, label=label)
+                ax.plot(thermo.tmesh, ys, label=label)
 
             ax.set_title(qname, fontsize=fontsize)
             ax.grid(True)
@@ -4158,6 +4231,46 @@ def match_eigenvectors(v1, v2):
     return indices
 
 
+# Max number of complex elements in the batch of overlap matrices computed by match_eigenvectors_batch.
+_MATCH_CHUNK_SIZE = 2 ** 22
+
+
+def match_eigenvectors_batch(v1, v2, inds1=None, inds2=None):
+    """
+    Batched version of :func:`match_eigenvectors`.
+    Match the lists of vectors ``v1[inds1[p]]`` and ``v2[inds2[p]]`` for all the pairs ``p``.
+    The overlap matrices are computed in chunks with a single batched matrix product and each assignment is solved
+    with the Hungarian algorithm (maximum total overlap) instead of the greedy algorithm of :func:`match_eigenvectors`.
+
+    Args:
+        v1: Array of shape (n1, nvec, ncomp) with n1 lists of vectors.
+        v2: Array of shape (n2, nvec, ncomp) with n2 lists of vectors.
+        inds1, inds2: Indices of the pairs to be matched. If None, ``range(len(v1))`` and ``range(len(v2))``.
+
+    Returns:
+        |numpy-array| of shape (npairs, nvec). For each pair, the indices of the vectors of the second list
+        that match the vectors of the first list in ascending order.
+    """
+    from scipy.optimize import linear_sum_assignment
+    inds1 = np.arange(len(v1)) if inds1 is None else np.asarray(inds1, dtype=np.int)
+    inds2 = np.arange(len(v2)) if inds2 is None else np.asarray(inds2, dtype=np.int)
+    if len(inds1) != len(inds2):
+        raise ValueError("len(inds1): %d != len(inds2): %d" % (len(inds1), len(inds2)))
+
+    npairs, nvec = len(inds1), np.shape(v1)[1]
+    indices = np.empty((npairs, nvec), dtype=np.int)
+    chunk = max(1, _MATCH_CHUNK_SIZE // max(1, nvec * nvec))
+    for start in range(0, npairs, chunk):
+        stop = min(start + chunk, npairs)
+        # prod[p, i, j] = |<v2[p, j]|v1[p, i]>|
+        prod = np.absolute(np.matmul(v1[inds1[start:stop]], np.conj(v2[inds2[start:stop]]).transpose(0, 2, 1)))
+        for p in range(stop - start):
+            row, col = linear_sum_assignment(-prod[p])
+            indices[start + p, row] = col
+
+    return indices
+
+
 class RobotWithPhbands(object):
     """
     Mixin class for robots associated to files with |PhononBands|.
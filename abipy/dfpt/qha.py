@@ -13,7 +13,7 @@ from pymatgen.analysis.eos import EOS
 from abipy.core.func1d import Function1D
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt
 from abipy.electrons.gsr import GsrFile
-from abipy.dfpt.phonons import PhononBandsPlotter, PhononDos
+from abipy.dfpt.phonons import PhononBandsPlotter, PhononDos, harmonic_thermo, harmonic_thermo_from_phdoses
 from abipy.dfpt.gruneisen import GrunsNcFile
 import abipy.core.abinit_units as abu
 
@@ -25,6 +25,9 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
     generate an instance of phonopy.qha.QHA. These can be used to obtain other quantities and plots.
     Does not include electronic entropic contributions for metals.
     """
+    # Number of processes used for the EOS fits that cannot be performed by the batched solver
+    # (polynomial EOS or fits that did not converge). See fit_eos_batch.
+    eos_fit_workers = 1
 
     def __init__(self, structures, energies, eos_name='vinet', pressure=0):
         """
@@ -38,6 +41,7 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
         self.structures = structures
         self.energies = np.array(energies)
         self.eos = EOS(eos_name)
+        self.eos_name = eos_name
         self.pressure = pressure
 
         self.volumes = np.array([s.volume for s in structures])
@@ -64,6 +68,12 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
 
         """
 
+        # The last result is stored since the same fits are used by several methods.
+        key = (tstart, tstop, num, self.eos_name, self.pressure)
+        cache = getattr(self, "_fit_cache", None)
+        if cache is not None and cache[0] == key:
+            return cache[1]
+
         tmesh = np.linspace(tstart, tstop, num)
 
         # array with phonon energies and shape (n_vol, n_temp)
@@ -72,13 +82,15 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
         tot_en = self.energies[np.newaxis, :].T + ph_energies + self.volumes[np.newaxis, :].T * self.pressure / abu.eVA3_GPa
 
         # list of fits objects, one for each temperature
-        fits = [self.eos.fit(self.volumes, e) for e in tot_en.T]
+        fits = fit_eos_batch(self.eos, self.volumes, tot_en.T, num_workers=self.eos_fit_workers)
 
         # list of minimum volumes and energies, one for each temperature
         min_volumes = np.array([fit.v0 for fit in fits])
         min_energies = np.array([fit.e0 for fit in fits])
 
-        return dict2namedtuple(tot_en=tot_en, fits=fits, min_en=min_energies, min_vol=min_volumes, temp=tmesh)
+        result = dict2namedtuple(tot_en=tot_en, fits=fits, min_en=min_energies, min_vol=min_volumes, temp=tmesh)
+        self._fit_cache = (key, result)
+        return result
 
     @abc.abstractmethod
     def get_vib_free_energies(self, tstart=0, tstop=800, num=100):
@@ -116,6 +128,25 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
         """
         pass
 
+    def _get_harmonic_thermo(self, tstart, tstop, num):
+        """
+        Return ``namedtuple`` with the harmonic thermodynamic properties for all the volumes.
+        See :func:`abipy.dfpt.phonons.harmonic_thermo`.
+        The last result is stored so that the different quantities and fits reuse the same data.
+        """
+        key = (tstart, tstop, num)
+        cache = getattr(self, "_thermo_cache", None)
+        if cache is None or cache[0] != key:
+            cache = self._thermo_cache = (key, self._compute_harmonic_thermo(np.linspace(tstart, tstop, num)))
+        return cache[1]
+
+    def _compute_harmonic_thermo(self, tmesh):
+        """
+        Compute the harmonic thermodynamic properties for the temperatures in ``tmesh``.
+        Must be implemented by the subclasses that use :meth:`_get_harmonic_thermo`.
+        """
+        raise NotImplementedError("_compute_harmonic_thermo not implemented for %s" % self.__class__.__name__)
+
     @property
     def nvols(self):
         return len(self.volumes)
@@ -133,6 +164,7 @@ class AbstractQHA(six.with_metaclass(abc.ABCMeta, object)):
         """
 
         self.eos = EOS(eos_name)
+        self.eos_name = eos_name
 
     @add_fig_kwargs
     def plot_energies(self, tstart=0, tstop=800, num=10, ax=None, **kwargs):
@@ -473,12 +505,7 @@ class QHA(AbstractQHA):
         Returns:
             AA numpy array of `num` values of of the vibrational contribution to the free energy
         """
-        f = np.zeros((self.nvols, num))
-
-        for i, dos in enumerate(self.doses):
-            f[i] = dos.get_free_energy(tstart, tstop, num).values
-
-        return f
+        return self._get_harmonic_thermo(tstart, tstop, num).free_energy.copy()
 
     def get_thermodynamic_properties(self, tstart=0, tstop=800, num=100):
         """
@@ -498,21 +525,14 @@ class QHA(AbstractQHA):
                 entropy: entropy, in eV/K. Shape (nvols, num).
                 zpe: zero point energy in eV. Shape (nvols).
         """
-        tmesh = np.linspace(tstart, tstop, num)
-        cv = np.zeros((self.nvols, num))
-        free_energy = np.zeros((self.nvols, num))
-        entropy = np.zeros((self.nvols, num))
-        internal_energy = np.zeros((self.nvols, num))
-        zpe  = np.zeros(self.nvols)
+        thermo = self._get_harmonic_thermo(tstart, tstop, num)
+        zpe = np.array([d.zero_point_energy for d in self.doses])
 
-        for i, d in enumerate(self.doses):
-            cv[i] = d.get_cv(tstart, tstop, num).values
-            free_energy[i] = d.get_free_energy(tstart, tstop, num).values
-            entropy[i] = d.get_entropy(tstart, tstop, num).values
-            zpe[i] = d.zero_point_energy
+        return dict2namedtuple(tmesh=thermo.tmesh.copy(), cv=thermo.cv.copy(), free_energy=thermo.free_energy.copy(),
+                               entropy=thermo.entropy.copy(), zpe=zpe)
 
-        return dict2namedtuple(tmesh=tmesh, cv=cv, free_energy=free_energy, entropy=entropy,
-                               zpe=zpe)
+    def _compute_harmonic_thermo(self, tmesh):
+        return harmonic_thermo_from_phdoses(self.doses, tmesh)
 
     @classmethod
     def from_files(cls, gsr_files_paths, phdos_files_paths):
@@ -619,7 +639,7 @@ class QHA3PF(AbstractQHA):
             volumes with size (nvols, num).
         """
 
-        prop_doses = np.array([getattr(dos, "get_" + name)(tstart, tstop, num).values for dos in self.doses])
+        prop_doses = getattr(self._get_harmonic_thermo(tstart, tstop, num), name)
 
         p = np.zeros((self.nvols, num))
 
@@ -629,13 +649,15 @@ class QHA3PF(AbstractQHA):
         dos_vols = self.volumes[self.ind_doses]
         missing_vols = self.volumes[self._ind_energy_only]
 
-        # generate fit objects from the known dos values
-        for i_temp in range(num):
-            fit_params = np.polyfit(dos_vols, prop_doses[:, i_temp], self.fit_degree)
-            p[self._ind_energy_only, i_temp] = np.poly1d(fit_params)(missing_vols)
+        # fit the known dos values for all the temperatures at once. fit_params has shape (fit_degree + 1, num)
+        fit_params = np.polyfit(dos_vols, prop_doses, self.fit_degree)
+        p[self._ind_energy_only] = np.dot(np.vander(missing_vols, self.fit_degree + 1), fit_params)
 
         return p
 
+    def _compute_harmonic_thermo(self, tmesh):
+        return harmonic_thermo_from_phdoses(self.doses, tmesh)
+
     def get_vib_free_energies(self, tstart=0, tstop=800, num=100):
         """
         Generates the vibrational free energy corresponding to all the structures, either from the phonon DOS
@@ -725,24 +747,18 @@ class QHA3P(AbstractQHA):
                 zpe: zero point energy in eV. Shape (nvols).
         """
 
-        w = self.fitted_frequencies
-
-        tmesh = np.linspace(tstart, tstop, num)
-        weights = self.grun.doses['qpoints'].weights
-
-        free_energy = np.zeros((self.nvols, num))
-        cv = np.zeros((self.nvols, num))
-        entropy = np.zeros((self.nvols, num))
-        zpe = np.zeros(self.nvols)
+        thermo = self._get_harmonic_thermo(tstart, tstop, num)
 
-        for i in range(self.nvols):
-            free_energy[i] = [get_free_energy(w[i], weights, t) for t in tmesh]
-            cv[i] = [get_cv(w[i], weights, t) for t in tmesh]
-            entropy[i] = [get_entropy(w[i], weights, t) for t in tmesh]
-            zpe[i] = get_zero_point_energy(w, weights)
+        return dict2namedtuple(tmesh=thermo.tmesh.copy(), cv=thermo.cv.copy(), free_energy=thermo.free_energy.copy(),
+                               entropy=thermo.entropy.copy(), zpe=thermo.zpe.copy())
 
-        return dict2namedtuple(tmesh=tmesh, cv=cv, free_energy=free_energy, entropy=entropy,
-                               zpe=zpe)
+    def _compute_harmonic_thermo(self, tmesh):
+        # Sum over q-points and modes with the weights of the q-points. Non-positive frequencies are excluded.
+        w = self.fitted_frequencies.reshape(self.nvols, -1)
+        weights = self.grun.doses['qpoints'].weights
+        gw = np.tile(np.repeat(weights, self.fitted_frequencies.shape[2]), (self.nvols, 1))
+        gw[w <= 0] = 0.0
+        return harmonic_thermo(np.where(w > 0, w, 1.0), gw, tmesh, weighted=True)
 
     @lazy_property
     def fitted_frequencies(self):
@@ -785,17 +801,7 @@ class QHA3P(AbstractQHA):
             A numpy array of `num` values of of the vibrational contribution to the free energy
         """
 
-        w = self.fitted_frequencies
-
-        tmesh = np.linspace(tstart, tstop, num)
-        weights = self.grun.doses['qpoints'].weights
-
-        f = np.zeros((self.nvols, num))
-
-        for i in range(self.nvols):
-            f[i] = [get_free_energy(w[i], weights, t) for t in tmesh]
-
-        return f
+        return self._get_harmonic_thermo(tstart, tstop, num).free_energy.copy()
 
     @classmethod
     def from_files(cls, gsr_files_paths, grun_file_path, ind_doses):
@@ -825,6 +831,143 @@ class QHA3P(AbstractQHA):
         return cls(structures, gruns, energies, ind_doses)
 
 
+def _make_eos_fit(eos, volumes, energies, params):
+    """
+    Build the pymatgen EOSBase object with the parameters (e0, b0, b1, v0) obtained by fit_eos_batch.
+    pymatgen does not provide a public API to set the parameters so we set the attributes initialized by
+    EOSBase.fit (eos_params and _params) and check the results. Return None if this is not possible.
+    """
+    fit = eos.model(volumes, energies)
+    fit.eos_params = fit._params = params.copy()
+    try:
+        if np.all(np.array([fit.e0, fit.b0, fit.b1, fit.v0]) == params) and \
+           np.allclose(fit.func(volumes), fit._func(volumes, params)):
+            return fit
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _fit_eos(args):
+    """Fit a single set of energies. Module-level function so that it can be used with multiprocessing."""
+    eos, volumes, energies = args
+    return eos.fit(volumes, energies)
+
+
+def fit_eos_batch(eos, volumes, energies, num_workers=1, maxiter=200, tol=1e-12):
+    """
+    Fit several sets of energies as a function of the volume (e.g. one for each temperature)
+    with the same equation of state.
+
+    The parameters of all the sets are obtained at once: the quadratic fit used by pymatgen as initial guess
+    is computed with a single call to np.polyfit and refined with a vectorized Levenberg-Marquardt
+    algorithm (Gauss-Newton steps with central-difference jacobian). Polynomial equations of state and sets
+    for which the batched solver does not converge are fitted with ``eos.fit``, in parallel if ``num_workers`` > 1.
+
+    Args:
+        eos: pymatgen.analysis.eos.EOS object.
+        volumes: Volumes in Ang^3. Shape (nvols).
+        energies: Energies in eV. Shape (nsets, nvols).
+        num_workers: Number of processes used for the fits that are not computed by the batched solver.
+        maxiter: Max number of iterations of the batched solver.
+        tol: Relative tolerance on the sum of squares and on the parameters.
+
+    Returns:
+        List of pymatgen.analysis.eos.EOSBase objects, one for each set, with the fitted parameters.
+    """
+    from pymatgen.analysis.eos import PolynomialEOS
+    volumes = np.asarray(volumes, dtype=np.float)
+    energies = np.reshape(np.asarray(energies, dtype=np.float), (-1, len(volumes)))
+    nsets = len(energies)
+    fits = [None] * nsets
+
+    # The batched solver uses the E(V, params) function of the pymatgen model, that is not part of the public API.
+    # If not available (or if the fitted objects cannot be built, see _make_eos_fit), we fall back to eos.fit.
+    model = eos.model(volumes, energies[0]) if nsets > 0 else None
+    if not issubclass(eos.model, PolynomialEOS) and callable(getattr(model, "_func", None)):
+        func = lambda params: model._func(volumes[None, :], params.T[:, :, None])
+
+        # Initial guess from quadratic fit as in EOSBase._initial_guess. Shape (nsets, 4)
+        a, b, c = np.polyfit(volumes, energies.T, 2)
+        v0 = -b / (2 * a)
+        params = np.array([a * v0 ** 2 + b * v0 + c, 2 * a * v0, np.full(nsets, 4.0), v0]).T
+        # Fits with the minimum of the parabola outside the input volumes are delegated to pymatgen.
+        ok = (volumes.min() < v0) & (v0 < volumes.max())
+
+        with np.errstate(all="ignore"):
+            res = energies - func(params)
+            cost = np.sum(res ** 2, axis=1)
+            lam = np.full(nsets, 1e-3)
+            done = ~ok
+            converged = np.zeros(nsets, dtype=np.bool)
+            eye = np.eye(4)
+
+            for it in range(maxiter):
+                active = ~done
+                if not np.any(active): break
+                p, r = params[active], res[active]
+
+                # Jacobian with central differences. Shape (nact, nvols, 4)
+                h = 1e-6 * np.maximum(np.abs(p), 1e-8)
+                jac = np.empty(r.shape + (4,))
+                for k in range(4):
+                    dp = np.zeros_like(p)
+                    dp[:, k] = h[:, k]
+                    jac[..., k] = (func(p + dp) - func(p - dp)) / (2 * h[:, k, None])
+
+                jtj = np.einsum("sik,sil->skl", jac, jac)
+                jtr = np.einsum("sik,si->sk", jac, r)
+                damped = jtj + lam[active, None, None] * jtj * eye
+                try:
+                    delta = np.linalg.solve(damped, jtr[..., None])[..., 0]
+                except np.linalg.LinAlgError:
+                    delta = np.einsum("skl,sl->sk", np.linalg.pinv(damped), jtr)
+
+                new_params = p + delta
+                new_res = energies[active] - func(new_params)
+                new_cost = np.sum(new_res ** 2, axis=1)
+                improved = np.isfinite(new_cost) & (new_cost <= cost[active])
+
+                # Convergence on the relative reduction of the sum of squares and on the relative step.
+                small_step = np.all(np.abs(delta) <= tol * np.maximum(np.abs(p), 1e-8), axis=1)
+                small_red = np.abs(cost[active] - new_cost) <= tol * np.maximum(cost[active], 1e-300)
+                conv = improved & (small_step | small_red)
+
+                inds = np.where(active)[0]
+                upd = inds[improved]
+                params[upd], res[upd], cost[upd] = new_params[improved], new_res[improved], new_cost[improved]
+                lam[upd] = np.maximum(lam[upd] / 10, 1e-12)
+                lam[inds[~improved]] *= 10
+
+                # Stop if converged or if the damping is so large that no progress is possible.
+                converged[inds[conv]] = True
+                done[inds[conv]] = True
+                done[inds[lam[inds] > 1e12]] = True
+
+        for i in np.where(converged & np.all(np.isfinite(params), axis=1))[0]:
+            fits[i] = _make_eos_fit(eos, volumes, energies[i], params[i])
+
+    # Fit the remaining sets with pymatgen.
+    todo = [i for i, fit in enumerate(fits) if fit is None]
+    if todo:
+        args = [(eos, volumes, energies[i]) for i in todo]
+        if num_workers is not None and num_workers > 1 and len(todo) > 1:
+            from multiprocessing import Pool
+            pool = Pool(min(num_workers, len(todo)))
+            try:
+                results = pool.map(_fit_eos, args)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_fit_eos(a) for a in args]
+
+        for i, fit in zip(todo, results):
+            fits[i] = fit
+
+    return fits
+
+
 def get_free_energy(w, weights, t):
     """
     Calculates the free energy in eV from the phonon frequencies on a regular grid.
@@ -2,13 +2,15 @@
 from __future__ import print_function, division, unicode_literals, absolute_import
 
 import os
+import shutil
+import tempfile
 import numpy as np
 import abipy.data as abidata
 import abipy.core.abinit_units as abu
 
 from abipy import abilab
 from abipy.core.testing import AbipyTest
-from abipy.dfpt.ddb import DdbFile, DielectricTensorGenerator
+from abipy.dfpt.ddb import DdbFile, DielectricTensorGenerator, AnaddbTaskPool
 from abipy.dfpt.anaddbnc import AnaddbNcFile
 from abipy.dfpt.phonons import PhononBands
 
@@ -88,6 +90,16 @@ class DdbTest(AbipyTest):
             assert lines[2].rstrip() ==  "   1   1   1   1  0.80977066582497D+01 -0.46347282336361D-16"
             assert lines[-1].rstrip() == "   3   2   3   2  0.49482344898401D+01 -0.44885664256253D-17"
 
+            # Blocks are indexed with byte offsets and parsed on demand.
+            assert blocks[0].nelements == 36 and blocks[0].start < blocks[0].stop
+            values = blocks[0].get_values()
+            assert values.shape == (36, 6)
+            self.assert_equal(values[0, :4], [1, 1, 1, 1])
+            self.assert_almost_equal(values[-1, 4:], [0.49482344898401e+01, -0.44885664256253e-17])
+            dynmat = ddb.computed_dynmat[ddb.qpoints[0]]
+            assert len(dynmat) == 36
+            self.assert_almost_equal(dynmat["cvalue"].values, values[:, 4] + 1j * values[:, 5])
+
             for qpt in ddb.qpoints:
                 assert ddb.get_block_for_qpoint(qpt)
                 assert ddb.get_block_for_qpoint(qpt.frac_coords)
@@ -104,6 +116,12 @@ class DdbTest(AbipyTest):
                 phbands = new_ddb.anaget_phmodes_at_qpoint(qpoint=new_ddb.qpoints[0], verbose=1)
                 assert phbands is not None and hasattr(phbands, "phfreqs")
 
+                # Overwrite the file with a subset of blocks: the other blocks must remain valid.
+                all_data = [b["data"] for b in ddb.blocks]
+                new_ddb.write(tmp_file, filter_blocks=[0])
+                self.assert_equal([b["data"] for b in new_ddb.blocks], all_data)
+                self.assert_equal(new_ddb.blocks[-1].get_values(), ddb.blocks[-1].get_values())
+
     def test_alas_ddb_444_nobecs(self):
         """Testing DDB for AlAs on a 4x4x4x q-mesh without Born effective charges."""
         ddb = DdbFile(os.path.join(test_dir, "AlAs_444_nobecs_DDB"))
@@ -365,6 +383,62 @@ class DdbTest(AbipyTest):
             for qpoint in ddb.qpoints:
                 assert qpoint in ddb.computed_dynmat
 
+    def test_sidecar_cache(self):
+        """Testing DDB sidecar cache."""
+        filepath = os.path.join(tempfile.mkdtemp(), "AlAs_nl_dte_DDB")
+        shutil.copy(abidata.ref_file("refs/alas_nl_dfpt/AlAs_nl_dte_DDB"), filepath)
+
+        with DdbFile(filepath) as ref_ddb:
+            assert not os.path.exists(ref_ddb.sidecar_path)
+            # Cache is created if not present.
+            with DdbFile(filepath, cache=True) as ddb:
+                assert os.path.exists(ddb.sidecar_path)
+
+            # Header and blocks are now read from the cache.
+            with DdbFile(filepath, cache=True) as ddb:
+                assert all(b._values is not None for b in ddb.blocks)
+                assert ddb.qpoints == ref_ddb.qpoints
+                assert ddb.header.lines == ref_ddb.header.lines
+                assert ddb.header.nkpt == ref_ddb.header.nkpt
+                self.assert_equal(ddb.header.symrel, ref_ddb.header.symrel)
+                assert ddb.structure == ref_ddb.structure
+                self.assert_almost_equal(ddb.total_energy, ref_ddb.total_energy)
+                for qpt, df in ddb.computed_dynmat.items():
+                    self.assert_almost_equal(df["cvalue"].values, ref_ddb.computed_dynmat[qpt]["cvalue"].values)
+                assert [b["data"] for b in ddb.blocks] == [b["data"] for b in ref_ddb.blocks]
+
+        # Cache is invalidated if the DDB file changes.
+        with open(filepath, "at") as fh:
+            fh.write("\n")
+        with DdbFile(filepath) as ddb:
+            assert ddb._read_sidecar() is None
+
+    def test_anaddb_cache(self):
+        """Testing the cache for the results produced by anaddb."""
+        from abipy.dfpt import ddb as ddb_module
+        from abipy.tools.diskcache import DiskCache
+        cache = DiskCache(tempfile.mkdtemp(), maxsize_mb=None)
+        old_cache, ddb_module._ANADDB_CACHE = ddb_module._ANADDB_CACHE, cache
+        try:
+            with DdbFile(os.path.join(test_dir, "AlAs_444_nobecs_DDB")) as ddb:
+                ddb.use_anaddb_cache = True
+                assert ddb.content_hash == ddb.content_hash
+                phbands = ddb.anaget_phmodes_at_qpoint(qpoint=[0.5, 0.5, 0], asr=1, dipdip=0)
+                assert len(cache.keys()) == 1
+
+                # Second call uses the cache.
+                phbands_cached = ddb.anaget_phmodes_at_qpoint(qpoint=[0.5, 0.5, 0], asr=1, dipdip=0)
+                assert len(cache.keys()) == 1
+                self.assert_almost_equal(phbands_cached.phfreqs, phbands.phfreqs)
+
+                # Different input --> new entry.
+                ddb.anaget_phmodes_at_qpoint(qpoint=[0.5, 0.5, 0], asr=2, dipdip=0)
+                assert len(cache.keys()) == 2
+                assert ddb.clear_anaddb_cache() == 2
+                assert cache.keys() == []
+        finally:
+            ddb_module._ANADDB_CACHE = old_cache
+
 
 class DielectricTensorGeneratorTest(AbipyTest):
 
@@ -399,6 +473,52 @@ class DielectricTensorGeneratorTest(AbipyTest):
                 assert d.plot_vs_w(num=10, component=comp, units="cm-1", show=False)
 
 
+class AnaddbTaskPoolTest(AbipyTest):
+
+    def test_map(self):
+        """Testing AnaddbTaskPool."""
+        for num_workers in (1, 3):
+            pool = AnaddbTaskPool(num_workers=num_workers)
+            assert pool.map(lambda x: x ** 2, range(10)) == [x ** 2 for x in range(10)]
+            assert pool.map(abs, []) == []
+
+            def func(x):
+                if x == 2: raise ValueError("x == 2")
+                return x
+
+            with self.assertRaises(ValueError):
+                pool.map(func, range(5))
+
+    def test_kill_process_tree(self):
+        """Testing _kill_process_tree with a slow shell script."""
+        import time
+        import subprocess
+        from abipy.dfpt.ddb import _kill_process_tree, _get_descendant_pids
+
+        # Fake job script that starts a slow child process as done by the shell qadapter.
+        script = self.get_tmpname(text=True)
+        with open(script, "wt") as fh:
+            fh.write("#!/bin/bash\nsleep 60\n")
+        process = subprocess.Popen(("/bin/bash", script))
+
+        def is_alive(pid):
+            stat = subprocess.Popen(["ps", "-o", "stat=", "-p", str(pid)],
+                                    stdout=subprocess.PIPE).communicate()[0].decode("utf-8").strip()
+            return bool(stat) and not stat.startswith("Z")
+
+        children = []
+        for i in range(50):
+            children = _get_descendant_pids(process.pid)
+            if children: break
+            time.sleep(0.1)
+        assert children and all(is_alive(pid) for pid in children)
+
+        _kill_process_tree(process.pid)
+        process.wait()
+        time.sleep(0.2)
+        assert not any(is_alive(pid) for pid in children)
+
+
 class DdbRobotTest(AbipyTest):
 
     def test_ddb_robot(self):
@@ -455,7 +575,7 @@ class DdbRobotTest(AbipyTest):
 
         with abilab.DdbRobot.from_files(paths) as robot:
             # Test anacompare_epsinf
-            rinf = robot.anacompare_epsinf(ddb_header_keys="nkpt", chneut=0, with_path=True, verbose=2)
+            rinf = robot.anacompare_epsinf(ddb_header_keys="nkpt", chneut=0, with_path=True, verbose=2, num_cpus=2)
             assert "nkpt" in rinf.df
             assert "ddb_path" in rinf.df
             assert len(rinf.epsinf_list) == len(robot)
@@ -0,0 +1,66 @@
+"""Tests for ifcinterp module"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import os
+import numpy as np
+import abipy.data as abidata
+import abipy.core.abinit_units as abu
+
+from abipy.core.testing import AbipyTest
+from abipy.dfpt.ddb import DdbFile
+from abipy.dfpt.ifcinterp import IfcInterpolator, get_ddb_dynmats, impose_asr, diagonalize_dynmat
+
+
+test_dir = os.path.join(os.path.dirname(__file__), "..", "..", 'test_files')
+
+
+class IfcInterpolatorTest(AbipyTest):
+
+    def test_alas_444_nobecs(self):
+        """Testing in-process IFC interpolation for AlAs on a 4x4x4 q-mesh."""
+        with DdbFile(os.path.join(test_dir, "AlAs_444_nobecs_DDB")) as ddb:
+            data = get_ddb_dynmats(ddb)
+            assert len(data.qpoints) == 8 and data.dynmats.shape == (8, 6, 6)
+            self.assert_almost_equal(data.dynmats, np.conj(data.dynmats.transpose(0, 2, 1)), decimal=5)
+
+            ifc = ddb.get_ifc_interpolator(asr=1)
+            assert ddb.get_ifc_interpolator(asr=1) is ifc
+            self.assert_equal(ifc.ngqpt, [4, 4, 4])
+            assert ifc.to_string(verbose=1)
+            assert ifc.max_imag_ifc < 1e-6
+
+            # Interpolation must reproduce the ab-initio frequencies.
+            direct = diagonalize_dynmat(impose_asr(data.dynmats, data.dynmats[0], asr=1), data.masses_amu)
+            interp = ifc.get_phfreqs_phdispl(data.qpoints)
+            self.assert_almost_equal(interp.phfreqs * abu.eV_to_cm1, direct.phfreqs * abu.eV_to_cm1, decimal=2)
+
+            # Acoustic modes at Gamma and symmetry-equivalent q-points.
+            assert np.all(np.abs(interp.phfreqs[0, :3]) * abu.eV_to_cm1 < 1e-2)
+            r = ifc.get_phfreqs_phdispl([[0.1, 0.2, 0.3], [-0.1, -0.2, -0.3], [0.3, 0.2, 0.1]])
+            self.assert_almost_equal(r.phfreqs[0], r.phfreqs[1])
+            self.assert_almost_equal(r.phfreqs[0], r.phfreqs[2])
+
+            phbands = ddb.interpolate_phbands([[0, 0, 0], [0.5, 0, 0], [0.5, 0.5, 0]], asr=1)
+            assert phbands.phfreqs.shape == (3, 6) and phbands.phdispl_cart.shape == (3, 6, 6)
+            self.assert_almost_equal(phbands.phfreqs[2], direct.phfreqs[6])
+            assert "nkpt" in phbands.params
+
+            # Native diagonalization at the q-points of the DDB.
+            phbands = ddb.get_phmodes_at_qpoint(qpoint=[0.5, 0.5, 0], asr=1)
+            self.assert_almost_equal(phbands.phfreqs[0], direct.phfreqs[6])
+
+            with self.assertRaises(ValueError):
+                ddb.get_phmodes_at_qpoint(qpoint=[0.1, 0, 0])
+
+    def test_alas_reference(self):
+        """Testing in-process IFC interpolation against anaddb results at the q-points of the mesh."""
+        with DdbFile(abidata.ref_file("refs/alas_phonons/trf2_3.ddb.out")) as ddb:
+            ifc = IfcInterpolator.from_ddb(ddb, ngqpt=[4, 4, 4], asr=1)
+            # Frequencies in cm-1 at L and X computed by anaddb (see trf2_5.out_PHBST.nc).
+            r = ifc.get_phfreqs_phdispl([[0.5, 0.5, 0.5], [0.5, 0.5, 1.0]])
+            self.assert_almost_equal(r.phfreqs * abu.eV_to_cm1,
+                [[69.03, 69.03, 202.47, 332.61, 332.61, 352.30],
+                 [92.57, 92.57, 204.56, 313.90, 313.90, 375.87]], decimal=1)
+
+            with self.assertRaises(ValueError):
+                IfcInterpolator.from_ddb(ddb, ngqpt=[8, 8, 8])
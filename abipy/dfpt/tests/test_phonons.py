@@ -11,7 +11,8 @@ import abipy.core.abinit_units as abu
 
 from abipy import abilab
 from abipy.dfpt.phonons import (PhononBands, PhononDos, PhdosFile, InteratomicForceConstants, phbands_gridplot,
-        PhononBandsPlotter, PhononDosPlotter, dataframe_from_phbands)
+        PhononBandsPlotter, PhononDosPlotter, dataframe_from_phbands, match_eigenvectors, match_eigenvectors_batch,
+        harmonic_thermo, harmonic_thermo_from_phdoses)
 from abipy.dfpt.ddb import DdbFile
 from abipy.core.testing import AbipyTest
 
@@ -126,6 +127,8 @@ class PhononBandsTest(AbipyTest):
         # Cannot compute PHDOS with q-path
         with self.assertRaises(ValueError):
             phdos = phbands.get_phdos()
+        with self.assertRaises(ValueError):
+            phdos = phbands.get_phdos(method="tetra")
 
         # convert to pymatgen object
         phbands.to_pymatgen()
@@ -138,6 +141,34 @@ class PhononBandsTest(AbipyTest):
         assert phbands.has_linewidths
 
 
+    def test_match_eigenvectors_batch(self):
+        """Testing batched matching of eigenvectors."""
+        np.random.seed(1)
+        nvec, npairs = 6, 4
+        v1 = np.array([np.linalg.qr(np.random.rand(nvec, nvec) + 1j * np.random.rand(nvec, nvec))[0].T
+                       for p in range(npairs)])
+        perms = np.array([np.random.permutation(nvec) for p in range(npairs)])
+        v2 = np.array([v1[p][perms[p]] + 1e-3 * np.random.rand(nvec, nvec) for p in range(npairs)])
+
+        indices = match_eigenvectors_batch(v1, v2)
+        assert indices.shape == (npairs, nvec)
+        for p in range(npairs):
+            self.assert_equal(indices[p], np.argsort(perms[p]))
+            self.assert_equal(indices[p], match_eigenvectors(v1[p], v2[p]))
+
+        indices = match_eigenvectors_batch(v1, v2, inds1=[0, 0], inds2=[0, 1])
+        assert indices.shape == (2, nvec)
+        self.assert_equal(indices[0], np.argsort(perms[0]))
+        with self.assertRaises(ValueError):
+            match_eigenvectors_batch(v1, v2, inds1=[0], inds2=[0, 1])
+
+        phbands = PhononBands.from_file(abidata.ref_file("trf2_5.out_PHBST.nc"))
+        for ind, freqs in zip(phbands.split_matched_indices, phbands.split_phfreqs):
+            assert ind.shape == freqs.shape
+            for row in ind:
+                self.assert_equal(np.sort(row), np.arange(phbands.num_branches))
+
+
 class PlotterTest(AbipyTest):
 
     def test_plot_functions(self):
@@ -371,6 +402,30 @@ class PhononDosTest(AbipyTest):
         f = phdos.get_free_energy()
         self.assert_almost_equal(f.values, (u - s.mesh * s.values).values)
 
+        # All the quantities in one pass, also for multiple DOSes and T = 0.
+        thermo = phdos.get_harmonic_thermo()
+        self.assert_almost_equal(thermo.internal_energy, u.values)
+        self.assert_almost_equal(thermo.cv, cv.values)
+        thermo = harmonic_thermo_from_phdoses([phdos, phdos], [0, 5, 300])
+        assert thermo.free_energy.shape == (2, 3)
+        self.assert_almost_equal(thermo.internal_energy[:, 0], thermo.zpe)
+        self.assert_almost_equal(thermo.free_energy[:, 0], thermo.zpe)
+        self.assert_equal(thermo.entropy[:, 0], 0)
+        self.assert_equal(thermo.cv[:, 0], 0)
+        self.assert_almost_equal(thermo.entropy[0, 1:], [s.values[0], s.values[-1]])
+
+        # Sum over frequencies with weights. Compare with the closed-form expressions.
+        w, weights, temp = np.array([0.01, 0.02, 0.05]), np.array([0.2, 0.3, 0.5]), 200.0
+        thermo = harmonic_thermo(w, weights, [temp], weighted=True)
+        kt = abu.kb_eVK * temp
+        self.assert_almost_equal(thermo.free_energy[0],
+            np.sum(weights * (w / 2 + kt * np.log(1 - np.exp(-w / kt)))))
+        self.assert_almost_equal(thermo.cv[0],
+            np.sum(weights * abu.kb_eVK * (w / kt) ** 2 * np.exp(w / kt) / (np.exp(w / kt) - 1) ** 2))
+        self.assert_almost_equal(thermo.internal_energy[0] - temp * thermo.entropy[0], thermo.free_energy[0])
+        with self.assertRaises(ValueError):
+            harmonic_thermo([0.0, 0.01], [1, 1], [10])
+
         self.assertAlmostEqual(phdos.debye_temp, 469.01524830328606)
         self.assertAlmostEqual(phdos.get_acoustic_debye_temp(len(ncfile.structure)), 372.2576492728813)
 
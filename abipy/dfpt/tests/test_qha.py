@@ -3,9 +3,10 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 
 import os
 import warnings
+import numpy as np
 import abipy.data as abidata
 
-from abipy.dfpt.qha import QHA, QHA3PF, QHA3P
+from abipy.dfpt.qha import QHA, QHA3PF, QHA3P, fit_eos_batch, _make_eos_fit
 from abipy.dfpt.phonons import PhononBands
 from abipy.core.testing import AbipyTest
 
@@ -56,6 +57,38 @@ class QhaTest(AbipyTest):
             # fake temperatures to test the plotting function.
             assert qha.plot_phbs(self.phbs, temperatures=[10, 20], show=False)
 
+    def test_fit_eos_batch(self):
+        """Testing batched EOS fit against pymatgen."""
+        qha = QHA.from_files(self.gsr_paths, self.dos_paths)
+        f = qha.fit_energies(tstart=0, tstop=600, num=7)
+        assert qha.fit_energies(tstart=0, tstop=600, num=7) is f
+
+        for eos_name in ("vinet", "murnaghan", "birch_murnaghan", "deltafactor"):
+            qha.set_eos(eos_name)
+            fits = fit_eos_batch(qha.eos, qha.volumes, f.tot_en.T)
+            assert len(fits) == 7
+            for fit, e in zip(fits, f.tot_en.T):
+                ref = qha.eos.fit(qha.volumes, e)
+                self.assertAlmostEqual(fit.v0, ref.v0, places=4)
+                self.assertAlmostEqual(fit.e0, ref.e0, places=6)
+                self.assert_almost_equal(fit.func(qha.volumes), ref.func(qha.volumes), decimal=6)
+
+        # The cache must be invalidated when the EOS changes.
+        assert qha.eos_name == "deltafactor"
+        f2 = qha.fit_energies(tstart=0, tstop=600, num=7)
+        assert f2 is not f
+        self.assert_almost_equal(f2.min_vol, [fit.v0 for fit in f2.fits])
+
+        # fit_eos_batch relies on these (private) attributes of the pymatgen EOS models.
+        qha.set_eos("vinet")
+        ref = qha.eos.fit(qha.volumes, f.tot_en[:, 0])
+        assert callable(ref._func)
+        self.assert_equal(ref._params, ref.eos_params)
+        self.assert_equal([ref.e0, ref.b0, ref.b1, ref.v0], ref._params)
+        self.assert_almost_equal(ref.func(qha.volumes), ref._func(qha.volumes, ref._params))
+        fit = _make_eos_fit(qha.eos, qha.volumes, f.tot_en[:, 0], np.array(ref._params))
+        assert fit is not None and fit.v0 == ref.v0
+
     def test_phonopy_object(self):
         self.skip_if_not_phonopy()
 
@@ -572,9 +572,7 @@ class HistRobot(Robot):
             #"ecut", "pawecutdg", "tsmear", "nkpt",
         ] + kwargs.pop("attrs", [])
 
-        rows, row_names = [], []
-        for label, hist in self.items():
-            row_names.append(label)
+        def get_row(hist):
             d = OrderedDict()
 
             initial_fstas_dict = hist.get_fstats_dict(step=0)
@@ -593,10 +591,20 @@ class HistRobot(Robot):
                     value = getattr(hist, aname, None)
                 d[aname] = value
 
+            return d
+
+        # Rows are taken from the metadata index if use_metadata_index.
+        key = "HistRobot.get_dataframe with_geo=%s with_spglib=%s attrs=%s" % (with_geo, with_spglib, attrs)
+        rows, row_names = [], []
+        for label, hist in self.items():
+            row_names.append(label)
+            d = self._get_indexed_row(hist, key, get_row)
+
             # Execute functions
             if funcs is not None: d.update(self._exec_funcs(funcs, hist))
             rows.append(d)
 
+        self._save_metadata_index()
         import pandas as pd
         row_names = row_names if not abspath else self._to_relpaths(row_names)
         index = row_names if index is None else index
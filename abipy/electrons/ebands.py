@@ -32,7 +32,7 @@ from abipy.core.kpoints import (Kpoint, KpointList, Kpath, IrredZone, KSamplingI
     Ktables, has_timrev_from_kptopt, map_grid2ibz, kmesh_from_mpdivs)
 from abipy.core.structure import Structure
 from abipy.iotools import ETSF_Reader
-from abipy.tools import gaussian, duck
+from abipy.tools import gaussian_dos, duck
 from abipy.tools.plotting import (set_axlims, add_fig_kwargs, get_ax_fig_plt, get_axarray_fig_plt,
     get_ax3d_fig_plt, rotate_ticklabels, set_visible, plot_unit_cell)
 
@@ -1507,6 +1507,8 @@ class ElectronBands(Has_Structure):
 
         Args:
             method: String defining the method for the computation of the DOS.
+                "gaussian" or "tetra" for the linear tetrahedron method with Blöchl corrections
+                (requires energies in the IBZ of a Gamma-centered k-mesh).
             step: Energy step (eV) of the linear mesh.
             width: Standard deviation (eV) of the gaussian.
 
@@ -1521,15 +1523,21 @@ class ElectronBands(Has_Structure):
         nw = int(1 + (e_max - e_min) / step)
         mesh, step = np.linspace(e_min, e_max, num=nw, endpoint=True, retstep=True)
 
-        # TODO: Write cython version.
         dos = np.zeros((self.nsppol, nw))
         if method == "gaussian":
+            weights = self.kpoints.weights
             for spin in self.spins:
-                for k, kpoint in enumerate(self.kpoints):
-                    weight = kpoint.weight
-                    for band in range(self.nband_sk[spin,k]):
-                        e = self.eigens[spin,k,band]
-                        dos[spin] += weight * gaussian(mesh, width, center=e)
+                # Select the bands computed at each k-point.
+                kb_mask = np.arange(self.mband)[None, :] < self.nband_sk[spin][:, None]
+                dos[spin] = gaussian_dos(mesh, width, self.eigens[spin][kb_mask],
+                                         np.broadcast_to(weights[:, None], kb_mask.shape)[kb_mask])
+
+        elif method == "tetra":
+            from abipy.core.tetra import Tetrahedra
+            tetra = Tetrahedra.from_kpoints(self.structure, self.kpoints, self.has_timrev)
+            # Tetrahedra require the same number of bands at all k-points.
+            nb = self.nband_sk.min()
+            dos, _ = tetra.get_dos_idos(self.eigens[:, :, :nb], mesh)
 
         else:
             raise NotImplementedError("Method %s is not supported" % method)
@@ -1679,16 +1687,14 @@ class ElectronBands(Has_Structure):
         full = 2.0 if self.nsppol == 1 else 1.0
 
         if method == "gaussian":
-            for k, kpoint in enumerate(self.kpoints):
-                weight = kpoint.weight
-                for c in conduction:
-                    ec = self.eigens[spin, k, c]
-                    fc = 1.0 - self.occfacts[spin,k,c] / full
-                    for v in valence:
-                        ev = self.eigens[spin, k, v]
-                        fv = self.occfacts[spin, k, v] / full
-                        fact = weight * fv * fc
-                        jdos += fact * gaussian(mesh, width, center=ec-ev)
+            conduction, valence = list(conduction), list(valence)
+            # Arrays of shape [nkpt, nc, nv]
+            ec = self.eigens[spin][:, conduction, None]
+            ev = self.eigens[spin][:, None, valence]
+            fc = 1.0 - self.occfacts[spin][:, conduction, None] / full
+            fv = self.occfacts[spin][:, None, valence] / full
+            facts = self.kpoints.weights[:, None, None] * fv * fc
+            jdos = gaussian_dos(mesh, width, ec - ev, facts)
 
         else:
             raise NotImplementedError("Method %s is not supported" % str(method))
@@ -13,14 +13,13 @@ from monty.string import marquee, list_strings
 from pymatgen.core.periodic_table import Element
 from abipy.core.mixins import AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, NotebookWriter
 from abipy.electrons.ebands import ElectronsReader
-from abipy.tools import gaussian
+from abipy.tools import gaussian_dos
 from abipy.tools.plotting import set_axlims, get_axarray_fig_plt, add_fig_kwargs, get_ax_fig_plt
 
 
 def gaussians_dos(dos, mesh, width, values, energies, weights):
     assert len(dos) == len(mesh) and len(values) == len(energies) == len(weights)
-    for vw, e, w in zip(values * weights, energies, weights):
-        dos += vw * gaussian(mesh, width, center=e)
+    dos += gaussian_dos(mesh, width, energies, np.asarray(values) * weights)
     return dos
 
 
@@ -1386,17 +1385,21 @@ class FatBandsFile(AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, N
         pawt1dos_al = np.zeros((self.natom, self.lsize, self.nsppol, nw))
 
         if method == "gaussian":
+            # Select the (atom, l) terms to be computed.
+            al_mask = np.zeros((self.natom, self.lsize))
+            for iatom in range(self.natom):
+                if not self.has_atom[iatom]: continue
+                al_mask[iatom, :min(self.lmax_atom[iatom] + 1, mylsize)] = 1.0
+
             for spin in range(self.nsppol):
-                for k, kpoint in enumerate(kpoints):
-                    weight = kpoint.weight
-                    for band in range(nband_sk[spin, k]):
-                        gs = gaussian(mesh, width, center=eigens[spin,k,band])
-                        for iatom in range(self.natom):
-                            if not self.has_atom[iatom]: continue
-                            for l in range(min(self.lmax_atom[iatom] + 1, mylsize)):
-                                totdos_al[iatom, l, spin] += weight * gs * wal_sbk[iatom, l, spin, band, k]
-                                paw1dos_al[iatom, l, spin] += weight * gs * paw1_wal_sbk[iatom, l, spin, band, k]
-                                pawt1dos_al[iatom, l, spin] += weight * gs * pawt1_wal_sbk[iatom, l, spin, band, k]
+                # Select the bands computed at each k-point: [mband, nkpt] mask
+                bk_mask = np.arange(ebands.mband)[:, None] < nband_sk[spin][None, :]
+                ene = eigens[spin].T[bk_mask]
+                wtk = np.broadcast_to(kpoints.weights[None, :], bk_mask.shape)[bk_mask]
+                for dos_al, w_sbk in ((totdos_al, wal_sbk), (paw1dos_al, paw1_wal_sbk),
+                                      (pawt1dos_al, pawt1_wal_sbk)):
+                    dos_al[:, :, spin] = al_mask[:, :, None] * \
+                        gaussian_dos(mesh, width, ene, w_sbk[:, :, spin][..., bk_mask] * wtk)
 
         else:
             raise ValueError("Method %s is not supported" % method)
@@ -1634,13 +1637,12 @@ class _DosIntegrator(object):
                 wlsbk = fbfile.get_wl_symbol(symbol)
                 lso = np.zeros((fbfile.lsize, fbfile.nsppol, len(self.mesh)))
                 for spin in range(fbfile.nsppol):
-                    for k, kpoint in enumerate(ebands.kpoints):
-                        weight = kpoint.weight
-                        for band in range(ebands.nband_sk[spin, k]):
-                            e = ebands.eigens[spin, k, band]
-                            for l in range(lmax + 1):
-                                lso[l, spin] += wlsbk[l, spin, band, k] *\
-                                                weight * gaussian(self.mesh, self.width, center=e)
+                    # Select the bands computed at each k-point: [mband, nkpt] mask
+                    bk_mask = np.arange(ebands.mband)[:, None] < ebands.nband_sk[spin][None, :]
+                    ene = ebands.eigens[spin].T[bk_mask]
+                    wtk = np.broadcast_to(ebands.kpoints.weights[None, :], bk_mask.shape)[bk_mask]
+                    lso[:lmax + 1, spin] = gaussian_dos(self.mesh, self.width, ene,
+                                                        wlsbk[:lmax + 1, spin][:, bk_mask] * wtk)
                 symbols_lso[symbol] = lso
 
         else:
@@ -415,9 +415,7 @@ class GsrRobot(Robot, RobotWithEbands):
             "nsppol", "nspinor", "nspden",
         ] + kwargs.pop("attrs", [])
 
-        rows, row_names = [], []
-        for label, gsr in self.items():
-            row_names.append(label)
+        def get_row(gsr):
             d = OrderedDict()
 
             # Add info on structure.
@@ -432,10 +430,20 @@ class GsrRobot(Robot, RobotWithEbands):
                     if value is None: value = getattr(gsr.ebands, aname, None)
                 d[aname] = value
 
+            return d
+
+        # Rows are taken from the metadata index if use_metadata_index.
+        key = "GsrRobot.get_dataframe with_geo=%s attrs=%s" % (with_geo, attrs)
+        rows, row_names = [], []
+        for label, gsr in self.items():
+            row_names.append(label)
+            d = self._get_indexed_row(gsr, key, get_row)
+
             # Execute functions
             if funcs is not None: d.update(self._exec_funcs(funcs, gsr))
             rows.append(d)
 
+        self._save_metadata_index()
         row_names = row_names if not abspath else self._to_relpaths(row_names)
         return pd.DataFrame(rows, index=row_names, columns=list(rows[0].keys()))
 
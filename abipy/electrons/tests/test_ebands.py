@@ -265,6 +265,11 @@ class ElectronBandsTest(AbipyTest):
 
         si_edos = si_ebands_kmesh.get_edos()
         repr(si_edos); str(si_edos)
+
+        # Linear tetrahedron method (Gamma-centered 8x8x8 mesh)
+        tetra_edos = si_ebands_kmesh.get_edos(method="tetra")
+        self.assert_almost_equal(tetra_edos.tot_idos.values[-1], 2 * si_ebands_kmesh.mband)
+        self.assert_almost_equal(tetra_edos.find_mu(8), si_edos.find_mu(8), decimal=1)
         assert ElectronDos.as_edos(si_edos, {}) is si_edos
         assert si_edos == si_edos and not (si_edos != si_edos)
         edos_samevals = ElectronDos.as_edos(si_ebands_kmesh, {})
@@ -0,0 +1,346 @@
+# coding: utf-8
+"""
+Content-addressed cache on disk with size-based LRU eviction.
+
+Each entry is a directory whose name is the hash of the inputs used to produce the data
+so that results computed in a previous process can be reused without recomputing them.
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+from six.moves import cPickle as pickle
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "get_cache_dir",
+    "hash_objects",
+    "hash_file",
+    "DiskCache",
+]
+
+
+def get_cache_dir(name=None):
+    """
+    Return the absolute path of the root directory used to store cached data.
+    The default is ``~/.abinit/abipy/cache``, can be changed with the ``ABIPY_CACHE_DIR`` environment variable.
+
+    Args:
+        name: If not None, return the path of the subdirectory ``name``.
+    """
+    root = os.path.expanduser(os.environ.get("ABIPY_CACHE_DIR", os.path.join("~", ".abinit", "abipy", "cache")))
+    root = os.path.abspath(root)
+    return root if name is None else os.path.join(root, name)
+
+
+def hash_objects(*objs):
+    """
+    Compute the sha1 hash of a list of objects. numpy arrays are hashed from their dtype, shape and data,
+    lists and tuples are processed recursively, other objects are hashed from their ``repr``.
+
+    Return: string with hexadecimal digits.
+    """
+    sha = hashlib.sha1()
+
+    def update(obj):
+        if isinstance(obj, np.ndarray):
+            obj = np.ascontiguousarray(obj)
+            sha.update(("ndarray %s %s|" % (obj.dtype.str, obj.shape)).encode("utf-8"))
+            sha.update(obj.tobytes())
+        elif isinstance(obj, (list, tuple)):
+            sha.update(("%s %d|" % (type(obj).__name__, len(obj))).encode("utf-8"))
+            for o in obj:
+                update(o)
+        elif isinstance(obj, dict):
+            sha.update(("dict %d|" % len(obj)).encode("utf-8"))
+            for k in sorted(obj.keys()):
+                update(k)
+                update(obj[k])
+        elif isinstance(obj, bytes):
+            sha.update(b"bytes|" + obj)
+        else:
+            sha.update(("%s %r|" % (type(obj).__name__, obj)).encode("utf-8"))
+
+    for obj in objs:
+        update(obj)
+
+    return sha.hexdigest()
+
+
+def hash_file(filepath, blocksize=2 ** 20):
+    """
+    Compute the sha1 hash of the content of a file. The file is read in chunks of ``blocksize`` bytes.
+
+    Return: string with hexadecimal digits.
+    """
+    sha = hashlib.sha1()
+    with open(filepath, "rb") as fh:
+        while True:
+            buf = fh.read(blocksize)
+            if not buf: break
+            sha.update(buf)
+
+    return sha.hexdigest()
+
+
+class DiskCache(object):
+    """
+    Content-addressed cache stored in a directory. Each entry is a subdirectory named after the key
+    with an arbitrary number of files. The modification time of the subdirectory is used
+    to implement the LRU eviction policy when the total size exceeds ``maxsize_mb``.
+
+    .. rubric:: Example
+
+    cache = DiskCache(get_cache_dir("skw"), maxsize_mb=500)
+    key = hash_objects(kpts, eigens)
+    data = cache.load_npz(key, "data.npz")
+    if data is None:
+        data = compute(kpts, eigens)
+        cache.save_npz(key, "data.npz", **data)
+    """
+
+    def __init__(self, dirpath, maxsize_mb=1024):
+        """
+        Args:
+            dirpath: Directory used to store the entries. Created if it does not exist.
+            maxsize_mb: Max size of the cache in Mb. None for unlimited size.
+        """
+        self.dirpath = os.path.abspath(dirpath)
+        self.maxsize_mb = maxsize_mb
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, verbose=0):
+        """String representation."""
+        lines = ["DiskCache: %s" % self.dirpath]
+        app = lines.append
+        app("Number of entries: %d, size: %.2f Mb, maxsize: %s Mb" % (
+            len(self.keys()), self.get_size() / 1024 ** 2, self.maxsize_mb))
+        if verbose:
+            for key in self.keys():
+                app("    %s" % key)
+
+        return "\n".join(lines)
+
+    def _makedirs(self):
+        if not os.path.isdir(self.dirpath):
+            try:
+                os.makedirs(self.dirpath)
+            except OSError:
+                # Another process might have created the directory.
+                if not os.path.isdir(self.dirpath): raise
+
+    def keys(self):
+        """List with the keys stored in the cache."""
+        if not os.path.isdir(self.dirpath): return []
+        return [k for k in os.listdir(self.dirpath)
+                if not k.startswith(".") and os.path.isdir(os.path.join(self.dirpath, k))]
+
+    def __contains__(self, key):
+        return os.path.isdir(os.path.join(self.dirpath, key))
+
+    def get_entry(self, key):
+        """
+        Return the absolute path of the directory associated to ``key``, None if not in the cache.
+        Accessing an entry marks it as recently used.
+        """
+        path = os.path.join(self.dirpath, key)
+        if not os.path.isdir(path): return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def get_filepath(self, key, basename):
+        """
+        Return the absolute path of file ``basename`` in the entry ``key``, None if not available.
+        """
+        path = self.get_entry(key)
+        if path is None: return None
+        filepath = os.path.join(path, basename)
+        return filepath if os.path.exists(filepath) else None
+
+    def add_files(self, key, filepaths):
+        """
+        Copy a list of files to the entry ``key``. Existing files with the same basename are replaced.
+        The files are written in a temporary directory that is then renamed so that
+        other processes never see partially-written entries.
+
+        Return: Absolute path of the entry.
+        """
+        self._makedirs()
+        tmpdir = tempfile.mkdtemp(dir=self.dirpath, prefix=".tmp_")
+        try:
+            for src in filepaths:
+                shutil.copy(src, os.path.join(tmpdir, os.path.basename(src)))
+            return self._commit(key, tmpdir)
+        finally:
+            if os.path.exists(tmpdir): shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def save_npz(self, key, basename, **arrays):
+        """
+        Save numpy arrays in npz format in file ``basename`` of entry ``key``.
+
+        Return: Absolute path of the entry.
+        """
+        self._makedirs()
+        tmpdir = tempfile.mkdtemp(dir=self.dirpath, prefix=".tmp_")
+        try:
+            with open(os.path.join(tmpdir, basename), "wb") as fh:
+                np.savez(fh, **arrays)
+            return self._commit(key, tmpdir)
+        finally:
+            if os.path.exists(tmpdir): shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def load_npz(self, key, basename):
+        """
+        Load the arrays saved with :meth:`save_npz`.
+
+        Return: dictionary {name: array} or None if entry is not available or the file cannot be read.
+        """
+        filepath = self.get_filepath(key, basename)
+        if filepath is None: return None
+        try:
+            with np.load(filepath, allow_pickle=False) as data:
+                return {k: data[k] for k in data.files}
+        except Exception as exc:
+            logger.warning("Removing corrupted cache entry %s\n%s" % (filepath, str(exc)))
+            self.remove(key)
+            return None
+
+    def save_pickle(self, key, basename, obj):
+        """
+        Save ``obj`` in pickle format in file ``basename`` of entry ``key``.
+
+        Return: Absolute path of the entry.
+        """
+        self._makedirs()
+        tmpdir = tempfile.mkdtemp(dir=self.dirpath, prefix=".tmp_")
+        try:
+            with open(os.path.join(tmpdir, basename), "wb") as fh:
+                pickle.dump(obj, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            return self._commit(key, tmpdir)
+        finally:
+            if os.path.exists(tmpdir): shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def load_pickle(self, key, basename):
+        """
+        Load the object saved with :meth:`save_pickle`. Return None if not available.
+        """
+        filepath = self.get_filepath(key, basename)
+        if filepath is None: return None
+        try:
+            with open(filepath, "rb") as fh:
+                return pickle.load(fh)
+        except Exception as exc:
+            logger.warning("Removing corrupted cache entry %s\n%s" % (filepath, str(exc)))
+            self.remove(key)
+            return None
+
+    def _commit(self, key, tmpdir):
+        """Move the files in tmpdir to the entry ``key`` and apply the eviction policy."""
+        path = os.path.join(self.dirpath, key)
+        if not os.path.isdir(path):
+            try:
+                os.rename(tmpdir, path)
+            except OSError:
+                # Entry created by another process in the meantime.
+                if not os.path.isdir(path): raise
+
+        if os.path.isdir(tmpdir):
+            for basename in os.listdir(tmpdir):
+                # os.rename is atomic on POSIX and overwrites dst.
+                os.rename(os.path.join(tmpdir, basename), os.path.join(path, basename))
+
+        os.utime(path, None)
+        self.evict(keep=key)
+        return path
+
+    def remove(self, key):
+        """Remove entry ``key`` from the cache. Return True if entry was present."""
+        path = os.path.join(self.dirpath, key)
+        if not os.path.isdir(path): return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def remove_prefix(self, prefix):
+        """Remove all the entries whose key starts with ``prefix``. Return list of removed keys."""
+        removed = [key for key in self.keys() if key.startswith(prefix)]
+        for key in removed:
+            self.remove(key)
+        return removed
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for key in self.keys():
+            self.remove(key)
+
+    def _entry_size(self, key):
+        path = os.path.join(self.dirpath, key)
+        size = 0
+        for root, _, files in os.walk(path):
+            for f in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, f))
+                except OSError:
+                    pass
+        return size
+
+    def get_size(self):
+        """Total size of the cache in bytes."""
+        return sum(self._entry_size(key) for key in self.keys())
+
+    def evict(self, maxsize_mb=None, keep=None):
+        """
+        Remove the least recently used entries until the size of the cache is below ``maxsize_mb``.
+
+        Args:
+            maxsize_mb: Max size in Mb. If None, ``self.maxsize_mb`` is used.
+            keep: Key of an entry that should not be removed.
+
+        Return: List with the keys of the entries that have been removed.
+        """
+        maxsize_mb = self.maxsize_mb if maxsize_mb is None else maxsize_mb
+        if maxsize_mb is None: return []
+        maxsize = maxsize_mb * 1024 ** 2
+
+        entries = []
+        for key in self.keys():
+            try:
+                mtime = os.path.getmtime(os.path.join(self.dirpath, key))
+            except OSError:
+                continue
+            entries.append((mtime, key, self._entry_size(key)))
+
+        total = sum(e[2] for e in entries)
+        removed = []
+        for mtime, key, size in sorted(entries):
+            if total <= maxsize: break
+            if key == keep: continue
+            self.remove(key)
+            total -= size
+            removed.append(key)
+
+        return removed
+
+    def remove_older_than(self, seconds):
+        """Remove the entries that have not been used in the last ``seconds`` seconds."""
+        now = time.time()
+        removed = []
+        for key in self.keys():
+            try:
+                if now - os.path.getmtime(os.path.join(self.dirpath, key)) > seconds:
+                    self.remove(key)
+                    removed.append(key)
+            except OSError:
+                pass
+        return removed
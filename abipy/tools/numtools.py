@@ -227,6 +227,107 @@ def lorentzian(x, width, center=0.0, height=None):
 
     return height * width**2 / ((x - center) ** 2 + width ** 2)
 
+
+# Max ratio between the step of the mesh and the step of the fine grid used by gaussian_dos with method="fft".
+# Larger values (width much smaller than the step) are treated with the exact method.
+_GAUSSIAN_DOS_MAX_OVERSAMPLING = 100
+
+
+def gaussian_dos(mesh, width, centers, weights=None, method="fft", oversampling=None, max_npts=2**22):
+    r"""
+    Sum of normalized gaussians evaluated on a mesh:
+
+        :math:`dos(\omega) = \sum_i w_i \, g(\omega - c_i)`
+
+    This is the kernel used to compute DOSes and JDOSes with gaussian broadening.
+
+    Args:
+        mesh: Sorted array with the mesh points.
+        width: Standard deviation of the gaussians.
+        centers: Array with the centers of the gaussians.
+        weights: Array with the weights, broadcastable to shape [..., \*centers.shape].
+            The leading dimensions can be used to compute several DOSes (e.g. projections)
+            sharing the same centers. None means unit weights.
+        method: "fft" to accumulate the weighted centers on a fine linear grid
+            and perform a single convolution with the gaussian via FFT.
+            "exact" to evaluate the gaussians on ``mesh`` in blocks of centers.
+            "fft" falls back to "exact" if the mesh is not equally spaced or if the fine grid
+            is too large (width much smaller than the step of the mesh).
+        oversampling: Ratio between the step of ``mesh`` and the step of the grid used in the "fft" method.
+            If None, the internal step is smaller than width / 40 so that the relative error
+            with respect to the exact result is below 1e-4.
+        max_npts: Max number of (center, mesh point) entries treated in a single block by the "exact" method
+            and max number of points of the fine grids (all the DOSes) used by the "fft" method.
+
+    Return: numpy array with shape [..., len(mesh)]
+    """
+    mesh = np.asarray(mesh, dtype=np.float)
+    centers = np.atleast_1d(np.asarray(centers, dtype=np.float))
+    if weights is None: weights = np.ones(centers.shape)
+    shape = np.broadcast(np.asarray(weights), centers).shape
+    if shape[len(shape) - centers.ndim:] != centers.shape:
+        raise ValueError("Cannot broadcast weights to centers shape %s" % str(centers.shape))
+    lead_shape = shape[:len(shape) - centers.ndim]
+    weights = np.reshape(np.broadcast_to(weights, shape), (-1, centers.size))
+    centers = centers.ravel()
+    nw = len(mesh)
+
+    if method == "fft":
+        step = mesh[1] - mesh[0] if nw > 1 else 0.0
+        if nw < 2 or step <= 0 or not np.allclose(np.diff(mesh), step, rtol=1e-6, atol=0):
+            method = "exact"
+
+    if method == "fft":
+        m = int(np.ceil(40 * step / width)) if oversampling is None else int(oversampling)
+        m = max(m, 1)
+        h = step / m
+        # Gaussians are truncated at 6 standard deviations.
+        npad = int(np.ceil(6 * width / h))
+        next_ = (nw - 1) * m + 1 + 2 * npad
+        nfft = 1 << int(np.ceil(np.log2(next_ + 2 * npad)))
+        # The fine grid grows as step / width: use the exact method if the oversampling
+        # is large or if the grid of a single DOS does not fit in max_npts.
+        if m > _GAUSSIAN_DOS_MAX_OVERSAMPLING or nfft > max_npts: method = "exact"
+
+    if method == "fft":
+        x0 = mesh[0] - npad * h
+
+        # Linear interpolation of the weighted centers on the fine grid (conserves norm and first moment).
+        pos = (centers - x0) / h
+        inside = (pos >= 0) & (pos < next_ - 1)
+        pos = pos[inside]
+        ipos = np.floor(pos).astype(np.int)
+        frac = pos - ipos
+        kernel_g = np.fft.rfft(gaussian(np.arange(-npad, npad + 1) * h, width), n=nfft)
+
+        # DOSes are computed in blocks so that the fine grids contain at most max_npts points.
+        values = np.empty((len(weights), nw))
+        nch = max(1, max_npts // nfft)
+        for start in range(0, len(weights), nch):
+            wins = weights[start:start + nch, inside]
+            nb = len(wins)
+            offs = (np.arange(nb) * next_)[:, None]
+            hist = np.bincount((offs + ipos).ravel(), weights=(wins * (1 - frac)).ravel(), minlength=nb * next_) + \
+                   np.bincount((offs + ipos + 1).ravel(), weights=(wins * frac).ravel(), minlength=nb * next_)
+            hist = np.reshape(hist[:nb * next_], (nb, next_))
+
+            # Linear convolution with the gaussian sampled on the fine grid.
+            conv = np.fft.irfft(np.fft.rfft(hist, n=nfft, axis=-1) * kernel_g, n=nfft, axis=-1)
+            values[start:start + nb] = conv[:, 2 * npad:2 * npad + (nw - 1) * m + 1:m]
+
+    elif method == "exact":
+        values = np.zeros((len(weights), nw))
+        chunk = max(1, max_npts // max(nw, 1))
+        for start in range(0, len(centers), chunk):
+            stop = start + chunk
+            gs = gaussian(mesh[None, :], width, center=centers[start:stop, None])
+            values += np.dot(weights[:, start:stop], gs)
+
+    else:
+        raise ValueError("Wrong method: %s" % str(method))
+
+    return np.reshape(values, lead_shape + (nw,))
+
 #=====================================
 # === Data Interpolation/Smoothing ===
 #=====================================
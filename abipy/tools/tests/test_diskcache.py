@@ -0,0 +1,80 @@
+# coding: utf-8
+"""Tests for diskcache module."""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import os
+import tempfile
+import numpy as np
+
+from abipy.core.testing import AbipyTest
+from abipy.tools.diskcache import DiskCache, hash_objects, hash_file, get_cache_dir
+
+
+class DiskCacheTest(AbipyTest):
+
+    def test_hash_objects(self):
+        """Testing hash_objects."""
+        a = np.arange(6, dtype=np.float)
+        assert hash_objects(a, 1) == hash_objects(a.copy(), 1)
+        assert hash_objects(a) != hash_objects(a.reshape(2, 3))
+        assert hash_objects(a) != hash_objects(a.astype(np.float32))
+        assert hash_objects([1, 2], None) != hash_objects((1, 2), None)
+        assert hash_objects({"b": 1, "a": 2}) == hash_objects({"a": 2, "b": 1})
+        # Non-contiguous arrays are hashed from their data.
+        b = np.arange(12.).reshape(3, 4)[:, :2]
+        assert hash_objects(b) == hash_objects(np.ascontiguousarray(b))
+        assert os.path.isabs(get_cache_dir("skw"))
+
+        tmpfile = self.get_tmpname(text=True)
+        with open(tmpfile, "wt") as fh:
+            fh.write("hello")
+        assert hash_file(tmpfile) == hash_file(tmpfile, blocksize=2)
+        assert hash_file(tmpfile) == "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+
+    def test_diskcache(self):
+        """Testing DiskCache."""
+        cache = DiskCache(os.path.join(tempfile.mkdtemp(), "cache"), maxsize_mb=None)
+        repr(cache); str(cache)
+        assert cache.keys() == [] and cache.get_size() == 0
+        assert cache.load_npz("foo", "data.npz") is None
+        assert cache.get_entry("foo") is None and "foo" not in cache
+
+        arr = np.random.rand(10, 10)
+        cache.save_npz("foo", "data.npz", arr=arr, num=3)
+        assert "foo" in cache and cache.keys() == ["foo"]
+        data = cache.load_npz("foo", "data.npz")
+        self.assert_equal(data["arr"], arr)
+        assert int(data["num"]) == 3
+
+        # Add more files to the same entry.
+        cache.save_pickle("foo", "obj.pickle", {"hello": [1, 2]})
+        assert cache.load_pickle("foo", "obj.pickle") == {"hello": [1, 2]}
+        tmpfile = self.get_tmpname(text=True)
+        with open(tmpfile, "wt") as fh:
+            fh.write("hello")
+        entry = cache.add_files("foo", [tmpfile])
+        assert os.path.exists(os.path.join(entry, os.path.basename(tmpfile)))
+        assert cache.get_filepath("foo", "data.npz") is not None
+
+        # LRU eviction.
+        cache.save_npz("bar", "data.npz", arr=arr)
+        os.utime(cache.get_entry("bar"), (0, 0))
+        assert sorted(cache.keys()) == ["bar", "foo"]
+        assert cache.evict(maxsize_mb=cache._entry_size("foo") / 1024 ** 2) == ["bar"]
+        assert cache.keys() == ["foo"]
+        assert cache.remove_older_than(3600) == []
+
+        # Corrupted entries are removed.
+        with open(os.path.join(cache.get_entry("foo"), "data.npz"), "wt") as fh:
+            fh.write("garbage")
+        assert cache.load_npz("foo", "data.npz") is None
+        assert "foo" not in cache
+
+        cache.save_npz("bar", "data.npz", arr=arr)
+        assert cache.remove("bar") and not cache.remove("bar")
+        cache.save_npz("bar_1", "data.npz", arr=arr)
+        cache.save_npz("bar_2", "data.npz", arr=arr)
+        assert sorted(cache.remove_prefix("bar_")) == ["bar_1", "bar_2"]
+        assert "bar" in cache
+        cache.clear()
+        assert cache.keys() == []
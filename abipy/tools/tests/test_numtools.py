@@ -69,3 +69,41 @@ class TestNumTools(AbipyTest):
 
         assert lorentzian(x=0.0, width=1.0, center=0.0, height=1.0) == 1.0
         self.assert_almost_equal(lorentzian(x=0.0, width=1.0, center=0.0, height=None), 1/np.pi)
+
+    def test_gaussian_dos(self):
+        """Testing gaussian_dos."""
+        mesh = np.linspace(-5, 5, num=201)
+        centers = np.array([[-1.0, 0.5], [0.3, 2.0], [4.9, 7.0]])
+        weights = np.array([0.2, 0.3, 0.5])[:, None]
+        ref = np.zeros(len(mesh))
+        for c, w in zip(centers.ravel(), np.broadcast_to(weights, centers.shape).ravel()):
+            ref += w * gaussian(mesh, 0.2, center=c)
+
+        exact = gaussian_dos(mesh, 0.2, centers, weights, method="exact", max_npts=100)
+        self.assert_almost_equal(exact, ref)
+        values = gaussian_dos(mesh, 0.2, centers, weights)
+        assert values.shape == mesh.shape
+        assert np.abs(values - ref).max() < 1e-4 * ref.max()
+
+        # Leading dimensions of weights define independent channels.
+        wch = np.random.rand(2, 3, 3, 2)
+        values = gaussian_dos(mesh, 0.2, centers, wch)
+        assert values.shape == (2, 3, len(mesh))
+        self.assert_almost_equal(values[1, 2], gaussian_dos(mesh, 0.2, centers, wch[1, 2]))
+        # Channels are computed in blocks if the fine grids do not fit in max_npts.
+        self.assert_almost_equal(gaussian_dos(mesh, 0.2, centers, wch, max_npts=2 * 4096), values)
+
+        # Width much smaller than the step --> exact method (the fine grid would be too large).
+        step = mesh[1] - mesh[0]
+        width = step / 200
+        wpeaks = np.random.rand(2, 3, 1)
+        self.assert_almost_equal(gaussian_dos(mesh, width, mesh[::7], wpeaks),
+                                 gaussian_dos(mesh, width, mesh[::7], wpeaks, method="exact"))
+
+        # Non-linear mesh --> exact method
+        nlmesh = mesh ** 3
+        self.assert_almost_equal(gaussian_dos(nlmesh, 0.2, centers),
+                                 gaussian_dos(nlmesh, 0.2, centers, method="exact"))
+
+        with self.assertRaises(ValueError):
+            gaussian_dos(mesh, 0.2, centers, method="foo")
@@ -12,9 +12,11 @@ import time
 from collections import OrderedDict
 from tabulate import tabulate
 from monty.string import marquee
+from monty.collections import dict2namedtuple
 from monty.functools import lazy_property
 from monty.termcolor import cprint
 from abipy.core.mixins import AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, NotebookWriter
+import abipy.core.abinit_units as abu
 from abipy.core.kpoints import Kpath, IrredZone
 from abipy.abio.robots import Robot
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt #, get_axarray_fig_plt
@@ -319,25 +321,15 @@ class AbiwanFile(AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, Not
                     vertices_names = [(k.frac_coords, k.name) for k in self.structure.hsym_kpoints]
                 kpoints = Kpath.from_vertices_and_names(self.structure, vertices_names, line_density=line_density)
 
-        nk = len(kpoints)
-        eigens = np.zeros((self.nsppol, nk, self.mwan))
-
-        # Interpolate Hamiltonian for each kpoint and spin.
+        # Interpolate Hamiltonian for all kpoints and spins.
         start = time.time()
-        write_warning = True
-        for spin in range(self.nsppol):
-            num_wan = self.nwan_spin[spin]
-            for ik, kpt in enumerate(kpoints):
-                oeigs = self.hwan.eval_sk(spin, kpt.frac_coords)
-                eigens[spin, ik, :num_wan] = oeigs
-                if num_wan < self.mwan:
-                    # May have different number of wannier functions if nsppol == 2.
-                    # Here I use the last value to fill eigens matrix (not very clean but oh well).
-                    eigens[spin, ik, num_wan:self.mwan] = oeigs[-1]
-                    if write_warning:
-                        cprint("Different number of wannier functions for spin. Filling last bands with oeigs[-1]",
-                               "yellow")
-                        write_warning = False
+        if np.any(np.array(self.nwan_spin) < self.mwan):
+            cprint("Different number of wannier functions for spin. Filling last bands with oeigs[-1]", "yellow")
+        wan_eigens = self.hwan.interp_kpts(kpoints.frac_coords).eigens
+        eigens = np.empty((self.nsppol, len(kpoints), self.mwan))
+        nb = wan_eigens.shape[-1]
+        eigens[..., :nb] = wan_eigens
+        eigens[..., nb:] = wan_eigens[..., nb - 1, None]
 
         print("Interpolation completed in %.3f [s]" % (time.time() - start))
         occfacts = np.zeros_like(eigens)
@@ -401,14 +393,17 @@ class HWanR(ElectronInterpolator):
 
     # <0n|H|Rm>
     """
+    # Max number of entries in the [nk, nrpts] and [nk, num_wan, num_wan] arrays
+    # used to interpolate a block of k-points (see interp_kpts).
+    max_hk_nelem = 2 ** 22
 
     def __init__(self, structure, nwan_spin, spin_vmatrix, spin_rmn, irvec, ndegen):
         self.structure = structure
         self.nwan_spin = nwan_spin
         self.spin_vmatrix = spin_vmatrix
         self.spin_rmn = spin_rmn
-        self.irvec = irvec
-        self.ndegen = ndegen
+        self.irvec = np.asarray(irvec)
+        self.ndegen = np.asarray(ndegen)
         self.nrpts = len(ndegen)
         self.nsppol = len(nwan_spin)
         assert self.nsppol == len(self.spin_rmn)
@@ -420,7 +415,7 @@ class HWanR(ElectronInterpolator):
         self.cell = (self.structure.lattice.matrix, self.structure.frac_coords, self.structure.atomic_numbers)
         self.has_timrev = True
         self.verbose = 0
-        self.nband = nwan_spin[0]
+        self.nband = max(nwan_spin)
         #self.nelect
 
     def eval_sk(self, spin, kpt, der1=None, der2=None):
@@ -437,27 +432,151 @@ class HWanR(ElectronInterpolator):
         Return:
             oeigs[nband]
         """
-        if der1 is not None or der2 is not None:
-            raise NotImplementedError("Derivatives")
+        if der2 is not None:
+            raise NotImplementedError("Second order derivatives")
+
+        hk, dhk = self.eval_hk(spin, kpt, dk1=der1 is not None)
+        if der1 is None:
+            return np.linalg.eigh(hk[0])[0]
+
+        oeigs, uk = np.linalg.eigh(hk[0])
+        der1[:len(oeigs)] = self._hellmann_feynman(uk[None], dhk)[0]
+        return oeigs
 
-        # O_ij(k) = sum_R e^{+ik.R}*O_ij(R)
-        j2pi = 2.0j * np.pi
+    @lazy_property
+    def _spin_hr(self):
         """
-        num_wan = self.nwan_spin[spin]
-        hk_ij = np.zeros((num_wan, num_wan), dtype=np.complex)
-        for ir in range(self.nrpts):
-            jrk = j2pi * np.dot(kpt, self.irvec[ir])
-            hk_ij += self.spin_rmn[spin][ir] * (np.exp(jrk) / self.ndegen[ir])
-        oeigs, _ = np.linalg.eigh(hk_ij)
+        List with the H(R) / ndegen(R) matrices for each spin reshaped to [nrpts, num_wan**2].
         """
+        return [(np.asarray(rmn) / self.ndegen[:, None, None]).reshape(self.nrpts, -1) for rmn in self.spin_rmn]
 
-        # This is a bit faster.
-        jrk = j2pi * np.dot(self.irvec, kpt)
-        phases = np.exp(jrk) / self.ndegen
-        hk_ij = (self.spin_rmn[spin] * phases[:, None, None]).sum(axis=0)
-        oeigs, _ = np.linalg.eigh(hk_ij)
+    def _get_kchunk(self, kchunk, dk1=False):
+        """Number of k-points in each block used to build H(k)."""
+        if kchunk is not None: return max(1, int(kchunk))
+        mwan = max(self.nwan_spin)
+        # Workspace: phases [nk, nrpts] (plus 3 derivatives) and H(k) [nk, mwan, mwan] (plus 3 derivatives).
+        return max(1, self.max_hk_nelem // ((4 if dk1 else 1) * max(self.nrpts, mwan ** 2)))
 
-        return oeigs
+    def eval_hk(self, spin, kpts, dk1=False):
+        """
+        Build the KS Hamiltonian in the Wannier gauge for a set of k-points.
+        The phases for all k-points are obtained with a single matrix product with ``irvec``.
+
+        Args:
+            spin: Spin index.
+            kpts: K-points in reduced coordinates.
+            dk1: True if the derivatives of H(k) wrt k are wanted.
+
+        Return:
+            (hk, dhk) where hk is a complex array of shape [nk, num_wan, num_wan] and
+            dhk is a complex array of shape [nk, 3, num_wan, num_wan] with the derivatives
+            wrt 2 pi k in reduced coordinates (same convention as SkwInterpolator). None if not dk1.
+        """
+        # O_ij(k) = sum_R e^{+ik.R} * O_ij(R) / ndegen(R)
+        kpts = np.reshape(kpts, (-1, 3))
+        nk, num_wan = len(kpts), self.nwan_spin[spin]
+        phases = np.exp(2.0j * np.pi * np.matmul(kpts, self.irvec.T))
+        hr = self._spin_hr[spin]
+        hk = np.matmul(phases, hr).reshape(nk, num_wan, num_wan)
+
+        dhk = None
+        if dk1:
+            # dO_ij(k) / d(2 pi k_a) = sum_R i R_a e^{+ik.R} * O_ij(R) / ndegen(R)
+            dphases = 1.0j * np.einsum("kr,ra->kar", phases, self.irvec)
+            dhk = np.matmul(dphases, hr).reshape(nk, 3, num_wan, num_wan)
+
+        return hk, dhk
+
+    @staticmethod
+    def _hellmann_feynman(uk, dhk):
+        """
+        Derivatives of the eigenvalues from the eigenvectors uk[nk, num_wan, nband] (along the columns)
+        and the derivatives of the Hamiltonian dhk[nk, 3, num_wan, num_wan].
+
+        Return: real array of shape [nk, nband, 3]
+        """
+        # dE_n/dk = <u_n|dH/dk|u_n>
+        return np.einsum("kmn,kamp,kpn->kna", uk.conj(), dhk, uk).real
+
+    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False, kchunk=None):
+        """
+        Interpolate energies on an arbitrary set of k-points. Optionally, compute gradients
+        with the Hellmann-Feynman theorem. H(k) is built for blocks of k-points (see :meth:`eval_hk`)
+        and diagonalized with a single call to ``np.linalg.eigh``.
+
+        Args:
+            kfrac_coords: K-points in reduced coordinates.
+            dk1 (bool): True if gradient is wanted.
+            dk2 (bool): True to compute 2nd order derivatives. Not implemented.
+            kchunk: Number of k-points in each block. If None, the value is computed
+                from ``max_hk_nelem`` so that memory is bounded.
+
+        Return:
+            namedtuple with:
+            interpolated energies in eigens[nsppol, len(kfrac_coords), nband]
+            gradient in dedk[self.nsppol, len(kfrac_coords), self.nband, 3))
+            hessian in dedk2 (always None)
+
+            If the number of Wannier functions depends on spin, the last bands are
+            filled with the highest interpolated eigenvalue.
+            For degenerate states, the gradient is given by the diagonal matrix elements of dH/dk
+            in the basis of eigenvectors returned by ``np.linalg.eigh``.
+        """
+        if dk2:
+            raise NotImplementedError("Second order derivatives")
+        start = time.time()
+
+        kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
+        new_nkpt = len(kfrac_coords)
+        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband))
+        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3))
+
+        kchunk = self._get_kchunk(kchunk, dk1=dk1)
+        for spin in range(self.nsppol):
+            num_wan = self.nwan_spin[spin]
+            for ks in range(0, new_nkpt, kchunk):
+                ke = min(ks + kchunk, new_nkpt)
+                hk, dhk = self.eval_hk(spin, kfrac_coords[ks:ke], dk1=dk1)
+                if not dk1:
+                    new_eigens[spin, ks:ke, :num_wan] = np.linalg.eigh(hk)[0]
+                else:
+                    new_eigens[spin, ks:ke, :num_wan], uk = np.linalg.eigh(hk)
+                    dedk[spin, ks:ke, :num_wan] = self._hellmann_feynman(uk, dhk)
+
+            if num_wan < self.nband:
+                # May have different number of wannier functions if nsppol == 2.
+                new_eigens[spin, :, num_wan:] = new_eigens[spin, :, num_wan - 1, None]
+                if dk1: dedk[spin, :, num_wan:] = dedk[spin, :, num_wan - 1, None]
+
+        if self.verbose:
+            print("Interpolation completed in %.3f (s)" % (time.time() - start))
+
+        return dict2namedtuple(eigens=new_eigens, dedk=dedk, dedk2=None)
+
+    def get_velocities(self, kfrac_coords, kchunk=None):
+        """
+        Compute the band velocities v = 1/hbar dE/dk in Cartesian coordinates from
+        the analytic derivatives of the interpolated Hamiltonian.
+        Assumes energies in eV and lattice vectors in Angstrom (same convention as |ElectronBands|).
+
+        Args:
+            kfrac_coords: K-points in reduced coordinates.
+            kchunk: Number of k-points in each block (see :meth:`interp_kpts`).
+
+        Return:
+            namedtuple with interpolated energies in eigens[nsppol, nk, nband] and
+            velocities in m/s in vels[nsppol, nk, nband, 3].
+        """
+        r = self.interp_kpts(kfrac_coords, dk1=True, kchunk=kchunk)
+
+        # dedk is the derivative wrt 2 pi k_red and k_cart = 2 pi A^{-T} k_red with A having
+        # the lattice vectors along the columns so that dE/dk_cart = A dE.
+        amat = self.structure.lattice.matrix.T / abu.Bohr_Ang
+        # Atomic units of velocity to m/s.
+        vau_ms = abu.Bohr_Ang * 1e-10 / abu.Time_Sec
+        vels = np.einsum("ai,skbi->skba", amat, r.dedk) * (vau_ms / abu.Ha_eV)
+
+        return dict2namedtuple(eigens=r.eigens, vels=vels)
 
     # TODO
     #def interpolate_omat(self, omat, kpoints):
@@ -2,6 +2,7 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 import os
+import numpy as np
 import abipy.data as abidata
 
 from abipy import abilab
@@ -39,6 +40,25 @@ class TestAbiwanFile(AbipyTest):
                     ews = abiwan.hwan.eval_sk(spin, kpt.frac_coords)
                     self.assert_almost_equal(ews[:n], in_eigens[spin, ik, :n])
 
+            # Batched interpolation and Hellmann-Feynman derivatives vs finite differences.
+            hwan = abiwan.hwan
+            kfrac_coords = abiwan.kpoints.frac_coords
+            r = hwan.interp_kpts(kfrac_coords, dk1=True, kchunk=3)
+            self.assert_almost_equal(r.eigens[:, :, :4], in_eigens[:, :, :4])
+            kpt, delta = [0.11, 0.23, -0.17], 1e-5
+            der1 = np.empty((hwan.nband, 3))
+            hwan.eval_sk(0, kpt, der1=der1)
+            self.assert_almost_equal(hwan.interp_kpts(kpt, dk1=True).dedk[0, 0], der1)
+            for i in range(3):
+                kp, km = np.array(kpt, dtype=float), np.array(kpt, dtype=float)
+                kp[i] += delta; km[i] -= delta
+                fd = (hwan.eval_sk(0, kp) - hwan.eval_sk(0, km)) / (2 * np.pi * 2 * delta)
+                self.assert_almost_equal(der1[:, i], fd, decimal=5)
+            v = hwan.get_velocities(kfrac_coords)
+            assert v.vels.shape == (abiwan.nsppol, len(kfrac_coords), hwan.nband, 3)
+            with self.assertRaises(NotImplementedError):
+                hwan.interp_kpts(kpt, dk2=True)
+
             ebands_kmesh = abiwan.interpolate_ebands(ngkpt=(4, 4, 4))
             assert ebands_kmesh.kpoints.is_ibz
 
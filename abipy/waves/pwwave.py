@@ -18,6 +18,7 @@ from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt, get_axarray_fig
 
 __all__ = [
     "PWWaveFunction",
+    "PWWaveFunctionSet",
 ]
 
 def latex_label_ispinor(ispinor, nspinor):
@@ -258,10 +259,15 @@ class PWWaveFunction(WaveFunction):
         space:  Integration space. Possible values ["g", "gsphere", "r"]
             if "g" or "r" the scalar product is computed in G- or R-space on the FFT box.
             if "gsphere" the integration is done on the G-sphere.
+            If istwfk > 1, "g" and "gsphere" use the coefficients reconstructed on the FFT box.
         """
         space = space.lower()
+        if space == "gsphere" and self.gsphere.istwfk != 1: space = "g"
 
-        if space == "g":
+        if space == "g" and self.gsphere.istwfk != 1:
+            ug_mesh = self.get_ug_mesh()
+            return np.real(np.vdot(ug_mesh, ug_mesh))
+        elif space == "g":
             return np.real(np.vdot(self.ug, self.ug))
         elif space == "gsphere":
             return np.real(np.vdot(self.ug, self.ug))
@@ -282,8 +288,10 @@ class PWWaveFunction(WaveFunction):
                 if "g" or "r" the scalar product is computed in G- or R-space on the FFT box.
                 if "gsphere" the integration is done on the G-sphere. Note that
                 this option assumes that self and other have the same list of G-vectors.
+                If istwfk > 1, "gsphere" is equivalent to "g".
         """
         space = space.lower()
+        if space == "gsphere" and self.gsphere.istwfk != 1: space = "g"
 
         if space == "g":
             ug1_mesh = self.gsphere.tofftmesh(self.mesh, self.ug)
@@ -579,6 +587,227 @@ class PWWaveFunction(WaveFunction):
     #    return figure
 
 
+class PWWaveFunctionSet(object):
+    """
+    Set of wavefunctions with the same spin and k-point expressed in a plane-wave basis set.
+    The coefficients of all the bands are stored in a single [nband, nspinor, npw] array
+    so that operations on many bands can be performed with vectorized numpy calls:
+    the FFTs of all the bands are done with one batched call and overlap matrices with one matrix product.
+
+    .. rubric:: Example
+
+        waves = wfk.get_waves(spin=0, kpoint=0)
+        ovlp = waves.get_overlaps()        # <u_m|u_n> computed on the G-sphere
+        ur = waves.ur                      # [nband, nspinor, nx, ny, nz] array
+
+    .. rubric:: Inheritance Diagram
+    .. inheritance-diagram:: PWWaveFunctionSet
+    """
+    def __init__(self, structure, nspinor, spin, bands, gsphere, ug):
+        """
+        Args:
+            structure: |Structure| object.
+            nspinor: number of spinorial components.
+            spin: spin index (only used if collinear-magnetism).
+            bands: List with the band indices (>=0).
+            gsphere |GSphere| instance.
+            ug: 3D array containing u[band, nspinor, G] for G in gsphere.
+        """
+        self.structure = structure
+        self.nspinor, self.spin = nspinor, spin
+        self.bands = np.array(bands, dtype=np.int).ravel()
+        # Sanity check.
+        assert ug.ndim == 3
+        assert ug.shape == (len(self.bands), nspinor, gsphere.npw)
+
+        self._gsphere = gsphere
+        self._ug = ug
+
+    def __len__(self):
+        return len(self.bands)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        """Return |PWWaveFunction| with the i-th band of the set."""
+        wave = PWWaveFunction(self.structure, self.nspinor, self.spin, self.bands[i], self.gsphere, self.ug[i])
+        if hasattr(self, "_mesh"): wave.set_mesh(self.mesh)
+        return wave
+
+    def __repr__(self):
+        return self.to_string()
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, verbose=0):
+        """String representation."""
+        lines = []; app = lines.append
+        app("%s: nspinor: %d, spin: %d, nband: %d, bands: [%d, ..., %d]" % (
+            self.__class__.__name__, self.nspinor, self.spin, len(self), self.bands[0], self.bands[-1]))
+        app(self.gsphere.to_string(verbose=verbose))
+        if hasattr(self, "_mesh"):
+            app(self.mesh.to_string(verbose=verbose))
+
+        return "\n".join(lines)
+
+    @property
+    def shape(self):
+        """Shape of ug i.e. (nband, nspinor, npw)"""
+        return self.ug.shape
+
+    @property
+    def gsphere(self):
+        """:class:`GSphere` object"""
+        return self._gsphere
+
+    @property
+    def kpoint(self):
+        """|Kpoint| object"""
+        return self.gsphere.kpoint
+
+    @property
+    def npw(self):
+        """Number of G-vectors."""
+        return len(self.gsphere)
+
+    @property
+    def ug(self):
+        """[nband, nspinor, npw] array with the periodic part of the wavefunctions in G-space."""
+        return self._ug
+
+    @property
+    def mesh(self):
+        """The mesh used for the FFT."""
+        return self._mesh
+
+    def set_mesh(self, mesh):
+        """Change the FFT mesh. `u(r)` will be computed on this box."""
+        assert isinstance(mesh, Mesh3D)
+        self._mesh = mesh
+        self.delete_ur()
+
+    @property
+    def ur(self):
+        """[nband, nspinor, nx, ny, nz] array with the periodic part of the wavefunctions in real space."""
+        try:
+            return self._ur
+        except AttributeError:
+            self._ur = self.fft_ug()
+            return self._ur
+
+    def delete_ur(self):
+        """Delete _u(r) (if it has been computed)."""
+        try:
+            del self._ur
+        except AttributeError:
+            pass
+
+    def get_ug_mesh(self, mesh=None):
+        """
+        Returns [nband, nspinor, nx, ny, nz] array with u(G) on the FFT mesh.
+
+        Args:
+            mesh: |Mesh3d| object. If mesh is None, the internal mesh is used.
+        """
+        mesh = self.mesh if mesh is None else mesh
+        ug_mesh = self.gsphere.tofftmesh(mesh, np.reshape(self.ug, (-1, self.npw)))
+        return np.reshape(ug_mesh, self.shape[:2] + tuple(mesh.shape))
+
+    def fft_ug(self, mesh=None):
+        """
+        Performs the FFT transform of :math:`u(g)` on mesh for all the bands with a single batched call.
+
+        Args:
+            mesh: |Mesh3d| object. If mesh is None, self.mesh is used.
+
+        Returns:
+            [nband, nspinor, nx, ny, nz] array with :math:`u(r)` on the real space FFT box.
+        """
+        mesh = self.mesh if mesh is None else mesh
+        return mesh.fft_g2r(self.get_ug_mesh(mesh=mesh), fg_ishifted=False)
+
+    def _get_selfconj_mask(self):
+        """
+        Return mask selecting the G-vectors with G = -G - G0 if only half of the G-sphere is stored (istwfk > 1).
+        None if istwfk == 1.
+        """
+        if self.gsphere.istwfk == 1: return None
+        g0 = np.rint(2 * np.asarray(self.kpoint.frac_coords))
+        return np.tile(np.all(2 * self.gsphere.gvecs == -g0, axis=1), self.nspinor)
+
+    def norm2(self, space="gsphere"):
+        r"""
+        Return [nband] array with :math:`||\psi||^2` computed in G- or r-space.
+
+        Args:
+            space: Integration space. Possible values ["g", "gsphere", "r"]
+                if "g" or "gsphere" the sum is computed on the G-sphere, if "r" on the real space FFT box.
+        """
+        space = space.lower()
+        if space in ("g", "gsphere"):
+            a = np.reshape(self.ug, (len(self), -1))
+            norms = (a.real ** 2 + a.imag ** 2).sum(axis=1)
+            mask = self._get_selfconj_mask()
+            if mask is not None:
+                # Only half of the sphere is stored.
+                norms = 2 * norms - (np.abs(a[:, mask]) ** 2).sum(axis=1)
+            return norms
+        elif space == "r":
+            ur = np.reshape(self.ur, (len(self), -1))
+            return (ur.real ** 2 + ur.imag ** 2).sum(axis=1) / self.mesh.size
+        else:
+            raise ValueError("Wrong space: %s" % str(space))
+
+    def get_overlaps(self, other=None, space="gsphere"):
+        """
+        Compute the overlap matrix <u_m|u_n> between the bands of self and the bands of other
+        with a single matrix-matrix product. As in :meth:`PWWaveFunction.braket`,
+        the selection rules introduced by the k-points are not taken into account.
+
+        Args:
+            other: Other :class:`PWWaveFunctionSet` (right-hand side). None to use self.
+            space: Integration space. Possible values ["g", "gsphere", "r"]
+                if "gsphere" the scalar product is computed on the G-sphere (requires the same G-sphere in other).
+                if "g" or "r" the scalar product is computed in G- or R-space on the FFT box of self.
+
+        Return: [len(self), len(other)] complex array.
+        """
+        other = self if other is None else other
+        space = space.lower()
+
+        if space == "gsphere":
+            if other is not self and other.gsphere != self.gsphere:
+                raise ValueError("space `gsphere` requires wavefunctions with the same G-sphere")
+            a = np.reshape(self.ug, (len(self), -1))
+            b = a if other is self else np.reshape(other.ug, (len(other), -1))
+            ovlp = np.dot(a.conj(), b.T)
+            mask = self._get_selfconj_mask()
+            if mask is not None:
+                # Only half of the sphere is stored: sum_G = 2 Re sum_{G in half} - self-conjugate terms.
+                ovlp = 2 * ovlp.real - np.dot(a[:, mask].conj(), b[:, mask].T).real + 0j
+            return ovlp
+
+        elif space == "g":
+            a = np.reshape(self.get_ug_mesh(), (len(self), -1))
+            b = a if other is self else np.reshape(other.get_ug_mesh(mesh=self.mesh), (len(other), -1))
+            return np.dot(a.conj(), b.T)
+
+        elif space == "r":
+            a = np.reshape(self.ur, (len(self), -1))
+            if other is self:
+                b = a
+            else:
+                b = other.ur if other.mesh == self.mesh else other.fft_ug(mesh=self.mesh)
+                b = np.reshape(b, (len(other), -1))
+            return np.dot(a.conj(), b.T) / self.mesh.size
+
+        else:
+            raise ValueError("Wrong space: %s" % str(space))
+
+
 class PAW_WaveFunction(WaveFunction):
     """
     All the methods that are related to the all-electron representation should start with ae.
@@ -43,3 +43,12 @@ class TestPWWave(AbipyTest):
                 int_r = mesh.integrate(fr)
                 int_g = fg[..., 0, 0, 0]
                 self.assert_almost_equal(int_r, int_g)
+
+        # Batched FFT of a stack of arrays.
+        fg = mesh.random(dtype=np.complex, extra_dims=(2, 3))
+        fr = mesh.fft_g2r(fg)
+        self.assert_almost_equal(fr[1, 2], mesh.fft_g2r(fg[1, 2]))
+
+        mesh.fft_backend = "foo"
+        with self.assertRaises(ValueError):
+            mesh.fft_g2r(fg)
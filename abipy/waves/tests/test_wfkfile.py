@@ -86,6 +86,47 @@ class TestWFKFile(AbipyTest):
 
         wave.export_ur2(".xsf")
 
+        # Read all the bands at one k-point with one call.
+        waves = wfk.get_waves(spin, kpoint)
+        repr(waves); str(waves)
+        assert len(waves) == wfk.nband_sk[spin, 0]
+        assert waves.shape == (len(waves), wfk.nspinor, wave.npw)
+        self.assert_equal(waves.ug[0], wave.ug)
+        self.assert_equal(waves[1].ug, other_wave.ug)
+        assert waves[1].band == 1 and waves[1].mesh == wave.mesh
+        waves = wfk.get_waves(spin, kpoint, bands=[3, 1])
+        self.assert_equal(waves.bands, [3, 1])
+        self.assert_equal(waves.ug[1], other_wave.ug)
+        # Non-contiguous bands are read in contiguous runs.
+        waves = wfk.get_waves(spin, kpoint, bands=[0, 2, 3, 1])
+        self.assert_equal(waves.ug[0], wfk.get_wave(spin, kpoint, 0).ug)
+        self.assert_equal(waves.ug[1:3], wfk.get_waves(spin, kpoint, bands=slice(2, 4)).ug)
+        self.assert_equal(waves.ug[3], other_wave.ug)
+        with self.assertRaises(ValueError):
+            wfk.get_waves(spin, kpoint, bands=[100])
+
+        # Overlap matrices and batched FFTs.
+        waves = wfk.get_waves(spin, kpoint)
+        for space in ["gsphere", "g", "r"]:
+            self.assert_almost_equal(waves.get_overlaps(space=space), np.eye(len(waves)))
+            self.assert_almost_equal(waves.norm2(space=space), np.ones(len(waves)))
+        assert waves.ur.shape == (len(waves), wfk.nspinor) + wave.mesh.shape
+        self.assert_almost_equal(waves.ur[0], wave.ur)
+        other_waves = wfk.get_waves(spin, 1)
+        self.assert_almost_equal(waves.get_overlaps(other_waves, space="g"),
+                                 waves.get_overlaps(other_waves, space="r"))
+        with self.assertRaises(ValueError):
+            waves.get_overlaps(other_waves, space="gsphere")
+
+        # Iterate over k-points and bands in chunks.
+        nchunks = 0
+        for waves in wfk.iter_waves(spin, bands=slice(0, 4), chunk_size_mb=3 * 16 * wfk.nspinor * 200 / 1024**2):
+            assert len(waves) <= 3
+            ik = wfk.kindex(waves.kpoint)
+            self.assert_equal(waves.ug[-1], wfk.get_wave(spin, ik, waves.bands[-1]).ug)
+            nchunks += 1
+        assert nchunks == 2 * wfk.nkpt
+
         if self.has_matplotlib():
             assert wave.plot_line(0, 1, num=100, show=False)
             assert wave.plot_line([0, 0, 0], [2, 2, 2], num=100, with_krphase=True, show=False)
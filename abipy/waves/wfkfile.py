@@ -11,7 +11,7 @@ from abipy.core import Mesh3D, GSphere, Structure
 from abipy.core.mixins import AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, NotebookWriter
 from abipy.iotools import ETSF_Reader, Visualizer
 from abipy.electrons.ebands import ElectronsReader
-from abipy.waves.pwwave import PWWaveFunction
+from abipy.waves.pwwave import PWWaveFunction, PWWaveFunctionSet
 from abipy.tools import duck
 
 __all__ = [
@@ -42,6 +42,9 @@ class WfkFile(AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, Notebo
         # Get a wavefunction.
         wave = wfk.get_wave(spin=0, kpoint=[0, 0, 0], band=0)
 
+        # Get all the bands at the first k-point with one read.
+        waves = wfk.get_waves(spin=0, kpoint=0)
+
     .. rubric:: Inheritance Diagram
     .. inheritance-diagram:: WfkFile
     """
@@ -158,6 +161,50 @@ class WfkFile(AbinitNcFile, Has_Header, Has_Structure, Has_ElectronBands, Notebo
 
         return wave
 
+    def get_waves(self, spin, kpoint, bands=None):
+        """
+        Read a set of wavefunctions with the given spin and kpoint with one read from file.
+
+        Args:
+            spin: spin index. Must be in (0, 1)
+            kpoint: Either :class:`Kpoint` instance or integer giving the sequential index in the IBZ (C-convention).
+            bands: slice, range or list of band indices. None for all the bands.
+
+        Return: :class:`PWWaveFunctionSet` object.
+        """
+        ik = self.kindex(kpoint)
+        if spin not in range(self.nsppol) or ik not in range(self.nkpt):
+            raise ValueError("Wrong (spin, kpt) indices")
+
+        bids = self.reader.get_band_indices(spin, ik, bands=bands)
+        ug = self.reader.read_ug_block(spin, ik, bands=bids)
+        waves = PWWaveFunctionSet(self.structure, self.nspinor, spin, bids, self.gspheres[ik], ug)
+        waves.set_mesh(self.fft_mesh)
+
+        return waves
+
+    def iter_waves(self, spin, kpoints=None, bands=None, chunk_size_mb=256):
+        """
+        Generator yielding :class:`PWWaveFunctionSet` objects for the given spin.
+        The bands at each k-point are read in chunks whose size is bounded by ``chunk_size_mb``
+        so that the memory does not depend on the number of k-points and bands.
+
+        Args:
+            spin: spin index. Must be in (0, 1)
+            kpoints: List of k-points (:class:`Kpoint` objects or integers). None for all the k-points in the file.
+            bands: slice, range or list of band indices. None for all the bands.
+            chunk_size_mb: Max size in Mb of the coefficients read in one chunk.
+        """
+        if spin not in range(self.nsppol):
+            raise ValueError("Wrong spin index: %s" % str(spin))
+
+        for ik, bids, ug in self.reader.iter_ug_blocks(spin, kpoints=kpoints, bands=bands,
+                                                       chunk_size_mb=chunk_size_mb):
+            # The buffer is reused by the reader hence we need a copy.
+            waves = PWWaveFunctionSet(self.structure, self.nspinor, spin, bids, self.gspheres[ik], ug.copy())
+            waves.set_mesh(self.fft_mesh)
+            yield waves
+
     def export_ur2(self, filepath, spin, kpoint, band, visu=None):
         """
         Export :math:`|u(r)|^2` on file filename.
@@ -387,3 +434,91 @@ class WFK_Reader(ElectronsReader):
         var = self.rootgrp.variables["coefficients_of_wavefunctions"]
         value = var[spin, ik, band, :, :npw_k, :]
         return value[..., 0] + 1j*value[..., 1]  # Build complex array
+
+    def get_band_indices(self, spin, kpoint, bands=None):
+        """
+        Return |numpy-array| with the band indices at (spin, kpoint).
+
+        Args:
+            bands: slice, range, integer or list of band indices. None for all the bands.
+        """
+        ik = self.kindex(kpoint)
+        nband = self.nband_sk[spin, ik]
+        if bands is None:
+            bids = np.arange(nband)
+        elif isinstance(bands, slice):
+            bids = np.arange(nband)[bands]
+        else:
+            bids = np.array(bands, dtype=np.int).ravel()
+
+        if len(bids) == 0 or bids.min() < 0 or bids.max() >= nband:
+            raise ValueError("Invalid band indices %s for spin: %s, ik: %s with nband: %s" % (
+                             str(bands), spin, ik, nband))
+        return bids
+
+    def read_ug_block(self, spin, kpoint, bands=None, out=None):
+        """
+        Read the Fourier components of a block of bands with one read of a contiguous hyperslab.
+        Non-contiguous band indices are split in contiguous runs and each run is read
+        with a separate hyperslab so that memory does not depend on the band span.
+
+        Args:
+            spin: spin index.
+            kpoint: :class:`Kpoint` object or integer.
+            bands: slice, range or list of band indices. None for all the bands at (spin, kpoint).
+            out: Preallocated complex array with shape [nb, nspinor, npw_k]. If None a new array is allocated.
+
+        Return: [nb, nspinor, npw_k] complex array.
+        """
+        ik = self.kindex(kpoint)
+        npw_k = self.npwarr[ik]
+        if self.cplex_ug != 2:
+            raise NotImplementedError("")
+
+        bids = self.get_band_indices(spin, ik, bands=bands)
+        shape = (len(bids), self.nspinor, npw_k)
+        if out is None:
+            out = np.empty(shape, dtype=np.complex)
+        elif out.shape != shape:
+            raise ValueError("Wrong shape of out array: %s, expecting: %s" % (str(out.shape), str(shape)))
+
+        var = self.rootgrp.variables["coefficients_of_wavefunctions"]
+        # Positions in bids where a new run of consecutive band indices starts.
+        run_starts = [0] + list(np.where(np.diff(bids) != 1)[0] + 1) + [len(bids)]
+        for i0, i1 in zip(run_starts[:-1], run_starts[1:]):
+            start = bids[i0]
+            value = var[spin, ik, start:start + i1 - i0, :, :npw_k, :]
+            out.real[i0:i1] = value[..., 0]
+            out.imag[i0:i1] = value[..., 1]
+
+        return out
+
+    def iter_ug_blocks(self, spin, kpoints=None, bands=None, chunk_size_mb=256):
+        """
+        Generator yielding ``(ik, bids, ug)`` where ug is a [len(bids), nspinor, npw_k] complex array
+        with the Fourier components of the bands ``bids`` at the k-point with index ``ik``.
+        The bands at each k-point are split in chunks so that ``ug`` is not larger than ``chunk_size_mb``.
+
+        .. important::
+
+            ``ug`` is a view of a buffer that is overwritten at the next iteration. Make a copy to keep the data.
+
+        Args:
+            spin: spin index.
+            kpoints: List of k-points (:class:`Kpoint` objects or integers). None for all the k-points.
+            bands: Band indices (see :meth:`get_band_indices`).
+            chunk_size_mb: Max size of the buffer in Mb.
+        """
+        kinds = list(range(len(self.kpoints))) if kpoints is None else [self.kindex(k) for k in kpoints]
+        if not kinds: return
+        mpw = max(self.npwarr[ik] for ik in kinds)
+        nb_chunk = max(1, int(chunk_size_mb * 1024 ** 2) // (16 * self.nspinor * mpw))
+        nb_chunk = min(nb_chunk, max(len(self.get_band_indices(spin, ik, bands=bands)) for ik in kinds))
+        buf = np.empty(nb_chunk * self.nspinor * mpw, dtype=np.complex)
+
+        for ik in kinds:
+            bids, npw_k = self.get_band_indices(spin, ik, bands=bands), self.npwarr[ik]
+            for start in range(0, len(bids), nb_chunk):
+                chunk = bids[start:start + nb_chunk]
+                ug = np.reshape(buf[:len(chunk) * self.nspinor * npw_k], (len(chunk), self.nspinor, npw_k))
+                yield ik, chunk, self.read_ug_block(spin, ik, bands=chunk, out=ug)